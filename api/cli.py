@@ -0,0 +1,94 @@
+"""
+Maintenance commands, run from the project root:
+
+    python -m api.cli backfill-votes --chunk-size 500
+    python -m api.cli import-evaluators evaluators.csv --chunk-size 1000
+    python -m api.cli reprocess --workers 8
+    python -m api.cli audit --max-sections 100
+"""
+import argparse
+import os
+import sys
+
+from .src.handlers import audit_bulletins, import_evaluator_file, reprocess_journal
+from .src.utils.evaluator_import import FORMATS, format_from_name
+from .src.utils.vote_tables import backfill_vote_tables
+
+
+def backfill_votes(args: argparse.Namespace) -> int:
+    total = backfill_vote_tables(chunk_size=args.chunk_size, pause=args.pause)
+    print(f'{total} bulletins copied to the vote tables')
+    return 0
+
+
+def import_evaluators(args: argparse.Namespace) -> int:
+    fmt = args.format or format_from_name(args.file)
+    if not fmt:
+        print(f'Unknown format of {args.file}, pass --format', file=sys.stderr)
+        return 2
+    with open(args.file, 'rb') as file:
+        result = import_evaluator_file(file, fmt, chunk_size=args.chunk_size)
+    for error in result.errors:
+        print(f'line {error.line}: {error.error}', file=sys.stderr)
+    print(f'{result.imported} evaluators imported, {result.failed} of {result.total} rows rejected')
+    return 1 if result.failed else 0
+
+
+def reprocess(args: argparse.Namespace) -> int:
+    result = reprocess_journal(args.journal_dir, workers=args.workers, chunk_size=args.chunk_size)
+    for error in result.errors:
+        print(error, file=sys.stderr)
+    print(f'{result.records} journal records reparsed: {result.updated} bulletins rewritten, '
+          f'{result.unmatched} without a stored bulletin, {result.failed} failed')
+    return 1 if result.failed or result.errors else 0
+
+
+def audit(args: argparse.Namespace) -> int:
+    report = audit_bulletins(args.max_sections, args.chunk_size)
+    for section in report.items:
+        place = f'{section.UNFE} {section.MUNI} zone {section.ZONA} section {section.SECA}'
+        for violation in section.violations:
+            scope = ''.join(f' {name} {value}' for name, value in (('CARG', violation.CARG), ('PART', violation.PART)) if value is not None)
+            print(f'bulletin {section.bulletin_id} ({place}){scope}: {violation.check} '
+                  f'expected {violation.expected}, found {violation.found}', file=sys.stderr)
+    checks = ', '.join(f'{check} {count}' for check, count in report.checks.items() if count)
+    print(f'{report.sections} bulletins audited in {report.seconds:.2f}s: {report.inconsistent} inconsistent'
+          + (f' ({checks})' if checks else ''))
+    return 1 if report.inconsistent else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m api.cli', description='API maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill = commands.add_parser('backfill-votes', help='fill the normalized vote tables from the stored bulletins')
+    backfill.add_argument('--chunk-size', type=int, default=500, help='bulletins read and written per transaction')
+    backfill.add_argument('--pause', type=float, default=0.0, help='seconds to wait between chunks, to limit the load')
+    backfill.set_defaults(handler=backfill_votes)
+
+    evaluators = commands.add_parser('import-evaluators', help='create or update evaluators from a CSV or NDJSON file')
+    evaluators.add_argument('file', help='CSV with a phone_number,section,zone,city header, or NDJSON with the same keys')
+    evaluators.add_argument('--format', choices=FORMATS, help='file format, by default from the file extension')
+    evaluators.add_argument('--chunk-size', type=int, default=None, help='rows validated and upserted per transaction')
+    evaluators.set_defaults(handler=import_evaluators)
+
+    replay = commands.add_parser('reprocess', help='parse the journaled QR codes again and rewrite the stored bulletins')
+    replay.add_argument('--journal-dir', default=None, help='directory of the journal segments, by default JOURNAL_DIR')
+    replay.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='parser processes')
+    replay.add_argument('--chunk-size', type=int, default=500, help='records parsed per task and written per transaction')
+    replay.set_defaults(handler=reprocess)
+
+    checks = commands.add_parser('audit', help='check that the totals of the stored bulletins add up')
+    checks.add_argument('--max-sections', type=int, default=None, help='inconsistent bulletins listed, by default AUDIT_MAX_SECTIONS')
+    checks.add_argument('--chunk-size', type=int, default=None, help='bulletins loaded and checked at once, by default AUDIT_CHUNK_SIZE')
+    checks.set_defaults(handler=audit)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,28 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from .src.routes import application_router
 from .src.settings import app_settings as settings
-from .src.logger import LoggerHandler, get_logger
+from .src.logger import LoggerHandler, RequestIdMiddleware, get_logger, sampled
+from .src.handlers import close_payload_journal, close_write_behind_queue, flush_bulletin_sessions, warm_evaluator_cache, warm_scan_index
+from .src.utils.parser_pool import get_parser_pool
+from .src.utils.metrics import CONTENT_TYPE, MetricsMiddleware, get_metrics_registry
+from .src.database import get_database_interface
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI): # pylint: disable=unused-argument, redefined-outer-name
     app.state.logger_handler = LoggerHandler()
     app.state.logger_handler.log_lifespan()
+    warm_evaluator_cache()
+    warm_scan_index()
     yield
+    close_write_behind_queue()
+    flush_bulletin_sessions()
+    close_payload_journal()
+    get_parser_pool().shutdown()
+    await get_database_interface().dispose_async()
     app.state.logger_handler.log_lifespan(shutdown=True)
 
 app = FastAPI(
@@ -33,6 +44,8 @@ app.add_middleware(
     allow_methods=settings.allowed_methods,
     allow_headers=settings.allowed_headers,
 )
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(application_router)
 
@@ -45,7 +58,8 @@ async def root():
             logger.exception('Failed to GET /')
             raise e
         finally:
-            logger.info('Successfully GET /')
+            if sampled():
+                logger.info('Successfully GET /')
 
 @app.post('/ping', include_in_schema=False)
 async def root_post():
@@ -56,4 +70,12 @@ async def root_post():
             logger.exception('Failed to POST /ping')
             raise e
         finally:
-            logger.info('Successfully POST /ping')
\ No newline at end of file
+            if sampled():
+                logger.info('Successfully POST /ping')
+
+@app.get('/metrics', include_in_schema=False)
+def metrics():
+    """
+    Description: Request, parser stage and database metrics in the Prometheus text format.
+    """
+    return Response(get_metrics_registry().render(), media_type=CONTENT_TYPE)
@@ -1,9 +1,18 @@
 import sqlalchemy as sa
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import registry, sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
 
-from .settings import database_settings as settings
+from .settings import database_settings as settings, evaluator_lock_settings
 from .logger import LoggerHandler, get_logger, logger
+from .utils.metrics import instrument_engine, instrument_sessions
+
+
+def _safe_url(url: str) -> str:
+    """
+    Database URL to be logged, with the password masked
+    """
+    return make_url(url).render_as_string(hide_password=True)
 
 
 class DatabaseInterface:
@@ -31,17 +40,51 @@ class DatabaseInterface:
         """
         with get_logger(task="database") as logger:
             try:
-                logger.debug('Creating database engine...')
-                logger.debug(f'Database URL: {settings.url}')
-                self.engine = sa.create_engine(settings.url)
-                logger.info('Database engine established successfully.')
                 self.Base = declarative_base()
-                self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine) # pylint: disable=invalid-name
+                self.create_engines()
                 self.test_connection()
             except Exception as e:
                 err_msg = 'Database engine creation failed'
                 logger.exception(err_msg)
 
+    def create_engines(self):
+        """
+        Create the engines and session factories from the current database settings
+        """
+        with get_logger(task="database") as logger:
+            logger.debug('Creating database engine...')
+            logger.debug('Database URL: {}', _safe_url(settings.url))
+            self.engine = sa.create_engine(settings.url, **settings.engine_options)
+            instrument_engine(self.engine, 'sync')
+            instrument_sessions()
+            logger.info('Database engine established successfully.')
+            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine) # pylint: disable=invalid-name
+            # The advisory locks of the evaluators are held while an upload writes, on a pool of their own
+            self.lock_engine = None
+            if evaluator_lock_settings.database_locks:
+                self.lock_engine = sa.create_engine(settings.url, **evaluator_lock_settings.engine_options)
+                instrument_engine(self.lock_engine, 'lock')
+            self.async_engine = self.async_lock_engine = None
+            if settings.is_async:
+                self.create_async_instance()
+
+    def create_async_instance(self):
+        """
+        Create the async engine serving the request path when DB_ASYNC is enabled
+        """
+        # Imported here so the sync mode does not require greenlet and the async driver
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        with get_logger(task="database") as logger:
+            logger.debug('Creating async database engine: {}', _safe_url(settings.async_url))
+            self.async_engine = create_async_engine(settings.async_url, **settings.engine_options)
+            instrument_engine(self.async_engine.sync_engine, 'async')
+            if evaluator_lock_settings.database_locks:
+                self.async_lock_engine = create_async_engine(settings.async_url, **evaluator_lock_settings.engine_options)
+                instrument_engine(self.async_lock_engine.sync_engine, 'async_lock')
+            self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False) # pylint: disable=invalid-name
+            logger.info('Async database engine established successfully.')
+
     def test_connection(self):
         """
         Test the database connection
@@ -73,6 +116,24 @@ class DatabaseInterface:
             logger.exception(err_msg, task='database', args='')
             raise ValueError(err_msg)
 
+    def get_async_session(self):
+        """
+        Get an async session object, only available when DB_ASYNC is enabled
+        """
+        if self.async_engine is None:
+            err_msg = 'Async database engine is not enabled'
+            logger.error(err_msg, task='database', args='')
+            raise ValueError(err_msg)
+        return self.AsyncSessionLocal()
+
+    async def dispose_async(self):
+        """
+        Close the connections of the async engines
+        """
+        for engine in (self.async_engine, self.async_lock_engine):
+            if engine is not None:
+                await engine.dispose()
+
     def create_tables(self):
         """
         Create tables in the database
@@ -124,9 +185,9 @@ class DatabaseInterface:
         with get_logger(task="database") as logger:
             with self.get_session() as session:
                 try:
-                    logger.debug(f'Querying data from model: {model}')
+                    logger.debug('Querying data from model: {}', model)
                     data = session.query(model).all()
-                    logger.info(f'Successfully retrieved {len(data)} records.')
+                    logger.info('Successfully retrieved {} records.', len(data))
                     return data
                 except Exception as e:
                     err_msg = 'Failed to query data'
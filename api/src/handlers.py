@@ -1,90 +1,846 @@
 from .database import get_database_interface
 from .schemas import BulletinQrCode
-from .logger import get_logger
+from .logger import get_logger, sampled
 from datetime import datetime as dt
-from .schemas import EvaluatorLogin, EvaluatorPublic, Header, Content, BoletimUrna
-from .models import BoletimUrnaModel
-from .utils.bu_parser import BulletinUrnaParser        
-from sqlalchemy.exc import SQLAlchemyError
+from .schemas import EvaluatorLogin, EvaluatorPublic, Header, Content, BoletimUrna, BulletinProgress
+from .schemas import BatchItemStatus, BulletinBatchItem, BulletinBatchResult, PositionResult, ResultsPosition, EvaluatorImportResult
+from .schemas import JournalReprocessResult, AuditReport, AuditViolation
+from .models import BoletimUrnaModel, BuScanModel, BuSectionModel
+from .utils.parser_trace import ParserTrace, get_parser_trace_store
+from .utils.bulletin_sessions import BulletinSession, PartStatus, get_bulletin_session_store, read_qrbu
+from .utils.parser_pool import get_parser_pool, parse_bulletin, parse_payloads
+from .utils.vote_tables import delete_vote_tables, insert_vote_tables, insert_vote_tables_async
+from .utils.tally import get_tally_engine
+from .utils.evaluator_cache import get_evaluator_directory
+from .utils.evaluator_import import import_evaluators
+from .utils.scan_index import ScanStatus, Section, bulletin_digest, classify_scans, get_scan_index, known_scans_query, scan_hashes
+from .utils.scan_index import scan_rows, section_of, section_scans_query, stored_section
+from .utils.payload_journal import JournalRecord, get_payload_journal, journal_records
+from .utils.write_behind import WriteBehindQueue, get_write_behind_queue
+from .utils.evaluator_locks import get_evaluator_locks
+from .utils.qr_stream import read_qr_codes
+from .utils.audit import audit_contents, audit_stored_bulletins
+from .utils.metrics import get_metrics_registry
+from .settings import app_settings, audit_settings
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+import asyncio
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy import insert, select, update
 from sqlalchemy.sql import text as Text
+from typing import AsyncIterator, BinaryIO, List, NamedTuple, Optional, Tuple
+import hashlib
+import io
 import json
 import ast
 
 
-def save_bulletin_qr_code(evaluator: EvaluatorPublic, bulletin: BulletinQrCode):
+def _bulletin_document(bulletin: BoletimUrna) -> Tuple[str, str]:
+    """
+    Description: Canonical JSON of a bulletin, as served by GET /bulletin/{phone_number}, and its ETag.
+    """
+    document = bulletin.model_dump_json()
+    return document, hashlib.sha256(document.encode()).hexdigest()
+
+def _bulletin_row(phone_number: str, bulletin: BoletimUrna, payload_digest: Optional[str] = None) -> dict:
+    document, etag = _bulletin_document(bulletin)
+    return dict(
+        evaluator_phone=phone_number,
+        type=bulletin.type,
+        finished=bulletin.finished,
+        last_carg=bulletin.last_carg,
+        last_party=bulletin.last_party,
+        open_steps=bulletin.open_steps,
+        header=bulletin.header.model_dump_json(),
+        content=bulletin.content.model_dump_json(),
+        document=document,
+        etag=etag,
+        payload_digest=payload_digest
+    )
+
+# Returns the ids in the order of the inserted rows, to fill the vote tables of each bulletin
+_INSERT_BULLETINS = insert(BoletimUrnaModel).returning(BoletimUrnaModel.id, sort_by_parameter_order=True)
+
+def _store_bulletin(phone_number: str, bulletin: BoletimUrna, hashes: Optional[List[str]] = None) -> str:
+    """
+    Description: Insert a parsed bulletin in the database.
+    """
+    return _store_bulletins(phone_number, [bulletin], [hashes])[0]
+
+def _scan_plan(rows, phone_numbers: List[str], bulletins: List[BoletimUrna], hashes: List[Optional[List[str]]]) -> Tuple[list, List[str]]:
+    """
+    Description: (phone number, bulletin, hashes, status, new scans) of the bulletins to insert, duplicates left out,
+    and the ScanStatus of every bulletin.
+    """
+    plans = classify_scans(rows, bulletins, hashes)
+    return [(phone_number, bulletin, digests, status, scans)
+            for phone_number, bulletin, digests, (status, scans) in zip(phone_numbers, bulletins, hashes, plans)
+            if status != ScanStatus.DUPLICATE], [status for status, _ in plans]
+
+def _stored_rows(stored: list) -> List[dict]:
+    return [_bulletin_row(phone_number, bulletin, bulletin_digest(digests) if digests else None)
+            for phone_number, bulletin, digests, *_ in stored]
+
+def _scan_table_rows(ids: List[int], stored: list) -> List[dict]:
+    return [row for bulletin_id, (_, bulletin, digests, status, scans) in zip(ids, stored)
+            for row in scan_rows(bulletin_id, bulletin, len(digests or ()), scans, status == ScanStatus.CONFLICT)]
+
+def _counted_contents(ids: List[int], stored: list) -> list:
+    # A conflicting bulletin is kept for review, the tally keeps counting the content stored first
+    return [(bulletin_id, phone_number, bulletin.content) for bulletin_id, (phone_number, bulletin, _, status, _) in zip(ids, stored)
+            if bulletin.finished and status == ScanStatus.NEW]
+
+def _write_bulletins(session, phone_numbers: List[str], bulletins: List[BoletimUrna], hashes: List[Optional[List[str]]]) -> List[str]:
+    sections = {section_of(bulletin) for bulletin, digests in zip(bulletins, hashes) if digests}
+    rows = session.execute(section_scans_query(sections)).all() if sections else []
+    stored, statuses = _scan_plan(rows, phone_numbers, bulletins, hashes)
+    if stored:
+        ids = session.scalars(_INSERT_BULLETINS, _stored_rows(stored)).all()
+        scans = _scan_table_rows(ids, stored)
+        if scans:
+            session.execute(insert(BuScanModel), scans)
+        insert_vote_tables(session, _counted_contents(ids, stored))
+    session.commit()
+    return statuses
+
+def _store_bulletins(phone_number: str, bulletins: List[BoletimUrna], hashes: Optional[List[Optional[List[str]]]] = None) -> List[str]:
+    """
+    Description: Insert several parsed bulletins in the database with a single bulk insert,
+    and the vote tables of the finished ones with one bulk insert per table.
+    Bulletins given with the payload hashes of their QR codes are checked against the stored scans
+    of their section: duplicates are not inserted, and a different content is stored as a conflict.
+    Returns the ScanStatus of each bulletin.
+    """
+    return _store_many([phone_number] * len(bulletins), bulletins, hashes or [None] * len(bulletins))
+
+def _store_many(phone_numbers: List[str], bulletins: List[BoletimUrna], hashes: List[Optional[List[str]]]) -> List[str]:
+    """
+    Description: _store_bulletins for bulletins of several evaluators, in one transaction.
+    """
+    if not bulletins:
+        return []
+    try:
+        with get_database_interface().get_session() as session:
+            statuses = _write_bulletins(session, phone_numbers, bulletins, hashes)
+    except IntegrityError:
+        # The same scan was stored concurrently by another request, it is read back as a duplicate now
+        with get_database_interface().get_session() as session:
+            statuses = _write_bulletins(session, phone_numbers, bulletins, hashes)
+    _scans_stored(hashes, statuses)
+    return statuses
+
+async def _write_bulletins_async(session, phone_numbers: List[str], bulletins: List[BoletimUrna], hashes: List[Optional[List[str]]]) -> List[str]:
+    sections = {section_of(bulletin) for bulletin, digests in zip(bulletins, hashes) if digests}
+    rows = (await session.execute(section_scans_query(sections))).all() if sections else []
+    stored, statuses = _scan_plan(rows, phone_numbers, bulletins, hashes)
+    if stored:
+        ids = (await session.scalars(_INSERT_BULLETINS, _stored_rows(stored))).all()
+        scans = _scan_table_rows(ids, stored)
+        if scans:
+            await session.execute(insert(BuScanModel), scans)
+        await insert_vote_tables_async(session, _counted_contents(ids, stored))
+    await session.commit()
+    return statuses
+
+async def _store_bulletins_async(phone_number: str, bulletins: List[BoletimUrna], hashes: Optional[List[Optional[List[str]]]] = None) -> List[str]:
+    """
+    Description: Insert several parsed bulletins in the database with the async engine.
+    """
+    if not bulletins:
+        return []
+    phone_numbers, hashes = [phone_number] * len(bulletins), hashes or [None] * len(bulletins)
+    try:
+        async with get_database_interface().get_async_session() as session:
+            statuses = await _write_bulletins_async(session, phone_numbers, bulletins, hashes)
+    except IntegrityError:
+        async with get_database_interface().get_async_session() as session:
+            statuses = await _write_bulletins_async(session, phone_numbers, bulletins, hashes)
+    _scans_stored(hashes, statuses)
+    return statuses
+
+def _write_behind_batch(items: List[Tuple[str, BoletimUrna, Optional[List[str]]]]) -> List[str]:
+    """
+    Description: Store the bulletins queued for write-behind, of any evaluator, in one group commit.
+    """
+    return _store_many(*map(list, zip(*items)))
+
+def _write_queue() -> WriteBehindQueue:
+    queue = get_write_behind_queue()
+    queue.start(_write_behind_batch)
+    return queue
+
+def _save_parsed(phone_number: str, bulletin: BoletimUrna, hashes: List[str]) -> str:
+    """
+    Description: Store a parsed bulletin, through the write-behind queue when enabled, once it is committed.
+    """
+    if get_write_behind_queue().enabled:
+        return _write_queue().submit((phone_number, bulletin, hashes)).result()
+    return _store_bulletin(phone_number, bulletin, hashes)
+
+async def _save_parsed_async(phone_number: str, bulletin: BoletimUrna, hashes: List[str]) -> str:
+    if get_write_behind_queue().enabled:
+        return await asyncio.wrap_future(_write_queue().submit((phone_number, bulletin, hashes)))
+    status, = await _store_bulletins_async(phone_number, [bulletin], [hashes])
+    return status
+
+def _check_write_capacity():
+    # Rejects the request before parsing when the write-behind queue is full
+    if get_write_behind_queue().enabled:
+        get_write_behind_queue().ensure_capacity()
+
+def _scans_stored(hashes: List[Optional[List[str]]], statuses: List[str]):
+    get_scan_index().add(digest for digests in hashes if digests for digest in digests)
+    if any(status != ScanStatus.DUPLICATE for status in statuses):
+        get_tally_engine().notify()
+
+def _stored_section(hashes: List[str]) -> Optional[Section]:
+    """
+    Description: Section already stored with the same content, looked up only when the prefilter has seen every part.
+    """
+    if not get_scan_index().might_contain(hashes):
+        return None
+    with get_database_interface().get_session() as session:
+        return stored_section(session.execute(known_scans_query(hashes)).all(), hashes)
+
+async def _stored_section_async(hashes: List[str]) -> Optional[Section]:
+    if not get_scan_index().might_contain(hashes):
+        return None
+    async with get_database_interface().get_async_session() as session:
+        return stored_section((await session.execute(known_scans_query(hashes))).all(), hashes)
+
+def _stored_sections(jobs: List[List[str]]) -> List[Optional[Section]]:
+    """
+    Description: _stored_section of several bulletins, with a single query.
+    """
+    index = get_scan_index()
+    candidates = [digests if index.might_contain(digests) else None for digests in jobs]
+    wanted = {digest for digests in candidates if digests for digest in digests}
+    if not wanted:
+        return [None] * len(jobs)
+    with get_database_interface().get_session() as session:
+        rows = session.execute(known_scans_query(wanted)).all()
+    return [stored_section(rows, digests) if digests else None for digests in candidates]
+
+BATCH_STATUSES = {
+    ScanStatus.NEW: BatchItemStatus.STORED,
+    ScanStatus.DUPLICATE: BatchItemStatus.DUPLICATE,
+    ScanStatus.CONFLICT: BatchItemStatus.CONFLICT,
+}
+
+def _progress(session: BulletinSession, duplicate: bool = False, conflict: bool = False) -> BulletinProgress:
+    return BulletinProgress(
+        phone_number=session.phone_number,
+        urn=session.urn,
+        total_parts=session.total_parts,
+        received_parts=session.received_parts,
+        missing_parts=session.missing_parts,
+        finished=session.finished,
+        duplicate=duplicate,
+        conflict=conflict
+    )
+
+def _accept_qr_code(phone_number: str, bu_string: str, logger) -> Tuple[Optional[BulletinSession], Optional[List[str]], Optional[BulletinProgress]]:
+    """
+    Description: Buffer a QR code in the session store.
+    Returns the session and ordered payloads of a bulletin ready to be parsed (no session for
+    single-part bulletins), or the progress to answer with while parts are missing.
+    """
+    part, total_parts = read_qrbu(bu_string)
+    if total_parts == 1:
+        return None, [bu_string], None
+    session, part_status = get_bulletin_session_store().add_part(phone_number, bu_string)
+    # A complete session not stored yet (e.g. rejected with a 503) is retried by sending a part again
+    if part_status == PartStatus.DUPLICATE and (session.finished or not session.is_complete):
+        if sampled():
+            logger.info('Duplicate QR code part {}:{} ignored.', part, total_parts)
+        return session, None, _progress(session, duplicate=True)
+    if part_status == PartStatus.RESTARTED:
+        logger.warning('QR code part {}:{} does not match the parts buffered, a new bulletin was started.', part, total_parts)
+    if not session.is_complete:
+        if sampled():
+            logger.info('QR code part {}:{} buffered, missing parts: {}.', part, total_parts, session.missing_parts)
+        return session, None, _progress(session)
+    return session, session.ordered_payloads(), None
+
+def _finish_bulletin(phone_number: str, session: Optional[BulletinSession], urn: Optional[int], status: str = ScanStatus.NEW,
+                     violations: Optional[List[AuditViolation]] = None) -> BulletinProgress:
+    """
+    Description: Release the session of a stored, or already stored, bulletin.
+    """
+    duplicate, conflict = status == ScanStatus.DUPLICATE, status == ScanStatus.CONFLICT
+    if session is None:
+        return BulletinProgress(phone_number=phone_number, urn=urn, total_parts=1, received_parts=[1],
+                                finished=True, duplicate=duplicate, conflict=conflict, violations=violations or [])
+    get_bulletin_session_store().complete(session)
+    session.finished = True
+    progress = _progress(session, duplicate=duplicate, conflict=conflict)
+    progress.violations = violations or []
+    return progress
+
+def _audit(bulletins: List[BoletimUrna], logger) -> List[List[AuditViolation]]:
+    """
+    Description: Totals of the parsed bulletins that do not add up, checked at ingest so an inconsistent
+    scan is reported to the evaluator right away. The bulletins are stored anyway.
+    """
+    if not audit_settings.on_ingest or not bulletins:
+        return [[] for _ in bulletins]
+    found = audit_contents([bulletin.content for bulletin in bulletins])
+    for bulletin, violations in zip(bulletins, found):
+        if violations:
+            checks = [violation.check for violation in violations]
+            logger.warning('Bulletin {} totals do not add up: {}.', bulletin.content.metadata.IDUE, ', '.join(sorted(set(checks))))
+            get_metrics_registry().observe_audit(checks)
+    return found
+
+def _log_scan_status(status: str, logger):
+    if status == ScanStatus.CONFLICT:
+        logger.warning('Bulletin stored as a conflict: its section was stored before with a different content.')
+    elif not sampled():
+        return
+    elif status == ScanStatus.DUPLICATE:
+        logger.info('Bulletin already stored from another scan, acknowledged without storing it again.')
+    else:
+        logger.info('Bulletin QR code saved successfully.')
+
+def save_bulletin_qr_code(evaluator: EvaluatorPublic, bulletin: BulletinQrCode, trace: ParserTrace = None) -> BulletinProgress:
     """
     Description: Save the QR code for a bulletin.
+    Parts of a "large" bulletin are buffered in the session store in any order, and the
+    bulletin is parsed in one pass and stored once every part has been received.
+    A bulletin whose QR codes were all stored before, e.g. scanned by another evaluator,
+    is acknowledged without parsing it.
+    The uploads of an evaluator run one at a time in arrival order, so the part completing
+    a bulletin parses and stores it once.
     """
     with get_logger(task="application") as logger:
         try:
             logger.debug('Bulletin QR code saving requested...')
-            parser = BulletinUrnaParser(evaluator.phone_number)
-            bulletin = parser.execute(bulletin.content)
-            with get_database_interface().get_session() as session:
-                bulletin_record = BoletimUrnaModel(
-                    evaluator_phone=evaluator.phone_number,
-                    type=bulletin.type,
-                    finished=bulletin.finished,
-                    last_carg=bulletin.last_carg,
-                    last_party=bulletin.last_party,
-                    open_steps=bulletin.open_steps,
-                    header=bulletin.header.json(),
-                    content=bulletin.content.json()
-                )
-                session.add(bulletin_record)
-                session.commit()
-            logger.info('Bulletin QR code saved successfully.')
+            with get_evaluator_locks().hold(evaluator.phone_number):
+                session, payloads, progress = _accept_qr_code(evaluator.phone_number, bulletin.content, logger)
+                if progress:
+                    return progress
+                hashes = scan_hashes(payloads)
+                section = _stored_section(hashes)
+                if section:
+                    _log_scan_status(ScanStatus.DUPLICATE, logger)
+                    return _finish_bulletin(evaluator.phone_number, session, section[-1], ScanStatus.DUPLICATE)
+                _check_write_capacity()
+                get_payload_journal().append(evaluator.phone_number, payloads)
+                # On failure the session is kept, so a corrected scan of the broken part can replace it
+                parsed = parse_bulletin(evaluator.phone_number, payloads, trace=trace)
+                violations, = _audit([parsed], logger)
+                status = _save_parsed(evaluator.phone_number, parsed, hashes)
+                _log_scan_status(status, logger)
+                return _finish_bulletin(evaluator.phone_number, session, parsed.content.metadata.IDUE, status, violations)
         except Exception as e:
             logger.exception('Bulletin QR code saving failed')
             raise e
+
+async def save_bulletin_qr_code_async(evaluator: EvaluatorPublic, bulletin: BulletinQrCode, trace: ParserTrace = None) -> BulletinProgress:
+    """
+    Description: Save the QR code for a bulletin with the async engine, parsing off the event loop.
+    """
+    with get_logger(task="application") as logger:
+        try:
+            logger.debug('Bulletin QR code saving requested...')
+            async with get_evaluator_locks().hold_async(evaluator.phone_number):
+                session, payloads, progress = _accept_qr_code(evaluator.phone_number, bulletin.content, logger)
+                if progress:
+                    return progress
+                hashes = scan_hashes(payloads)
+                section = await _stored_section_async(hashes)
+                if section:
+                    _log_scan_status(ScanStatus.DUPLICATE, logger)
+                    return _finish_bulletin(evaluator.phone_number, session, section[-1], ScanStatus.DUPLICATE)
+                _check_write_capacity()
+                await run_in_threadpool(get_payload_journal().append, evaluator.phone_number, payloads)
+                parsed = await get_parser_pool().parse_async(evaluator.phone_number, payloads, trace=trace)
+                violations, = _audit([parsed], logger)
+                status = await _save_parsed_async(evaluator.phone_number, parsed, hashes)
+                _log_scan_status(status, logger)
+                return _finish_bulletin(evaluator.phone_number, session, parsed.content.metadata.IDUE, status, violations)
+        except Exception as e:
+            logger.exception('Bulletin QR code saving failed')
+            raise e
+
+def save_bulletin_qr_code_batch(evaluator: EvaluatorPublic, bulletins: List[BulletinQrCode]) -> BulletinBatchResult:
+    """
+    Description: Save a batch of QR codes, e.g. scans queued while offline.
+    Parts of "large" bulletins go through the session store like single uploads; every bulletin
+    ready to be parsed is parsed in the parser process pool and stored with one bulk insert.
+    Bulletins already stored are looked up with a single query and acknowledged without parsing them.
+    """
+    with get_logger(task="application") as logger:
+        try:
+            logger.debug('Batch of {} QR codes saving requested...', len(bulletins))
+            with get_evaluator_locks().hold(evaluator.phone_number):
+                items = [BulletinBatchItem(index=index, status=BatchItemStatus.BUFFERED) for index in range(len(bulletins))]
+                jobs = []  # (item, session or None, ordered payloads)
+                for item, bulletin in zip(items, bulletins):
+                    try:
+                        session, payloads, progress = _accept_qr_code(evaluator.phone_number, bulletin.content, logger)
+                        if progress:
+                            item.progress = progress
+                            item.status = BatchItemStatus.DUPLICATE if progress.duplicate else BatchItemStatus.BUFFERED
+                        else:
+                            jobs.append((item, session, payloads))
+                    except Exception as e:
+                        item.status, item.error = BatchItemStatus.ERROR, str(e)
+
+                hashes = [scan_hashes(payloads) for _, _, payloads in jobs]
+                pending = []
+                for job, digests, section in zip(jobs, hashes, _stored_sections(hashes)):
+                    if section:
+                        item, session, _ = job
+                        item.status = BatchItemStatus.DUPLICATE
+                        item.progress = _finish_bulletin(evaluator.phone_number, session, section[-1], ScanStatus.DUPLICATE)
+                    else:
+                        pending.append((job, digests))
+
+                get_payload_journal().append_many(evaluator.phone_number, [payloads for (_, _, payloads), _ in pending])
+                results = get_parser_pool().parse_many(evaluator.phone_number, [payloads for (_, _, payloads), _ in pending])
+                parsed = []
+                for ((item, session, _), digests), (bulletin, error) in zip(pending, results):
+                    if error:
+                        # The session is kept, so a corrected scan of the broken part can replace it
+                        item.status, item.error = BatchItemStatus.ERROR, error
+                        continue
+                    parsed.append((item, session, bulletin, digests))
+
+                statuses = _store_bulletins(evaluator.phone_number, [bulletin for _, _, bulletin, _ in parsed],
+                                            [digests for *_, digests in parsed])
+                audits = _audit([bulletin for _, _, bulletin, _ in parsed], logger)
+                for (item, session, bulletin, _), status, violations in zip(parsed, statuses, audits):
+                    item.status = BATCH_STATUSES[status]
+                    item.progress = _finish_bulletin(evaluator.phone_number, session, bulletin.content.metadata.IDUE, status, violations)
+
+            result = BulletinBatchResult(
+                stored=sum(item.status in (BatchItemStatus.STORED, BatchItemStatus.CONFLICT) for item in items),
+                failed=sum(item.status == BatchItemStatus.ERROR for item in items),
+                items=items
+            )
+            logger.info('Batch of {} QR codes saved: {} bulletins stored, {} failed.', len(bulletins), result.stored, result.failed)
+            return result
+        except Exception as e:
+            logger.exception('Batch QR code saving failed')
+            raise e
+
+async def save_bulletin_qr_code_stream(evaluator: EvaluatorPublic, chunks: AsyncIterator[bytes], fmt: str) -> BulletinBatchResult:
+    """
+    Description: Save the QR codes of a request body stream, one per line, e.g. the bulk upload of a
+    device's scans. Lines are read as the body arrives and saved as batches of BATCH_MAX_ITEMS, the
+    next batch being read once the previous one is stored, so the body is never held in memory.
+    When a batch fails, e.g. the evaluator is busy, it and the following lines are reported as
+    errors along with the results of the batches already stored.
+    """
+    with get_logger(task="application") as logger:
+        result, failure = BulletinBatchResult(), None
+        async for group in read_qr_codes(chunks, fmt, app_settings.batch_max_items, app_settings.batch_max_line_bytes):
+            bulletins = [bulletin for bulletin, _ in group if bulletin is not None]
+            batch = BulletinBatchResult()
+            if bulletins and failure is None:
+                try:
+                    batch = await run_in_threadpool(save_bulletin_qr_code_batch, evaluator, bulletins)
+                except Exception as e:
+                    # The batches stored before are reported, the lines from this one on fail with its error
+                    logger.exception('Stream batch of {} QR codes failed, the following lines are not saved', len(bulletins))
+                    failure = str(e) or type(e).__name__
+            saved = iter(batch.items)
+            for index, (bulletin, error) in enumerate(group, len(result.items)):
+                if bulletin is None or failure is not None:
+                    item = BulletinBatchItem(index=index, status=BatchItemStatus.ERROR, error=error or failure)
+                    result.failed += 1
+                else:
+                    item = next(saved)
+                    item.index = index
+                result.items.append(item)
+            result.stored += batch.stored
+            result.failed += batch.failed
+        logger.info('Stream of {} QR codes saved: {} bulletins stored, {} failed.', len(result.items), result.stored, result.failed)
+        return result
+
+def get_bulletin_progress(phone_number: str) -> List[BulletinProgress]:
+    """
+    Description: Get the parts received and missing of the evaluator's partial bulletins.
+    """
+    with get_logger(task="application") as logger:
+        logger.debug('Bulletin progress requested...')
+        return [_progress(session) for session in get_bulletin_session_store().pending(phone_number)]
+
+def flush_bulletin_sessions():
+    """
+    Description: Spill every partial bulletin kept in memory to disk, e.g. on shutdown.
+    """
+    with get_logger(task="application") as logger:
+        sessions = get_bulletin_session_store().drain()
+        logger.info('{} partial bulletin sessions flushed.', len(sessions))
+
+def close_payload_journal():
+    """
+    Description: Sync and close the segment of the payload journal written by this process, e.g. on shutdown.
+    """
+    with get_logger(task="journal") as logger:
+        try:
+            get_payload_journal().close()
+        except Exception:
+            logger.exception('Payload journal closing failed')
+
+def _reparse_records(records: List[JournalRecord]) -> list:
+    """
+    Description: (payload digest, bulletin row, content to count or None, error) of journaled bulletins.
+    Module level so it can run in the worker processes, which also build the rows.
+    """
+    results = []
+    for record in records:
+        digest = bulletin_digest(scan_hashes(record.payloads))
+        bulletin, error = parse_payloads(record.phone_number, record.payloads)
+        if error:
+            results.append((digest, None, None, error))
+            continue
+        row = _bulletin_row(record.phone_number, bulletin, digest)
+        results.append((digest, row, bulletin.content if bulletin.finished else None, None))
+    return results
+
+def _reparsed_chunks(records, workers: int, chunk_size: int):
+    """
+    Description: Results of _reparse_records by chunk of records, in order, with at most two chunks per worker in flight.
+    """
+    chunks = iter(lambda: list(islice(records, chunk_size)), [])
+    if workers <= 1:
+        yield from map(_reparse_records, chunks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_reparse_records, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _rewrite_bulletins(results: list, result: JournalReprocessResult):
+    """
+    Description: Update the stored rows of reparsed bulletins in bulk, found by payload digest,
+    and replace the vote tables of those counted in the tally.
+    """
+    parsed = {digest: (row, content) for digest, row, content, _ in results if row is not None}
+    with get_database_interface().get_session() as session:
+        stored = session.execute(
+            select(BoletimUrnaModel.id, BoletimUrnaModel.payload_digest).where(BoletimUrnaModel.payload_digest.in_(list(parsed)))
+        ).all()
+        if stored:
+            ids = [bulletin_id for bulletin_id, _ in stored]
+            session.execute(update(BoletimUrnaModel), [
+                {**parsed[digest][0], 'id': bulletin_id, 'updated_at': dt.now()} for bulletin_id, digest in stored
+            ])
+            counted = set(session.scalars(select(BuSectionModel.bulletin_id).where(BuSectionModel.bulletin_id.in_(ids))))
+            delete_vote_tables(session, list(counted))
+            insert_vote_tables(session, [(bulletin_id, parsed[digest][0]['evaluator_phone'], parsed[digest][1])
+                                         for bulletin_id, digest in stored if bulletin_id in counted and parsed[digest][1] is not None])
+        session.commit()
+    matched = {digest for _, digest in stored}
+    result.updated += len(stored)
+    result.unmatched += sum(digest not in matched for digest in parsed)
+
+REPROCESS_MAX_ERRORS = 1000  # Errors listed in the result, all of them are counted
+
+def reprocess_journal(directory: Optional[str] = None, workers: int = 1, chunk_size: int = 500) -> JournalReprocessResult:
+    """
+    Description: Parse again every bulletin of the payload journal, e.g. after a parser fix, and rewrite
+    the stored rows they produced. Records are parsed in chunks across a process pool and each chunk
+    is written in its own transaction. Running API processes must be restarted afterwards, so their
+    tally is rebuilt from the rewritten vote tables.
+    """
+    with get_logger(task="reprocess") as logger:
+        try:
+            result = JournalReprocessResult()
+            records = journal_records(directory, result.errors)
+            for results in _reparsed_chunks(records, workers, chunk_size):
+                result.records += len(results)
+                for _, _, _, error in results:
+                    if error:
+                        result.failed += 1
+                        if len(result.errors) < REPROCESS_MAX_ERRORS:
+                            result.errors.append(error)
+                _rewrite_bulletins(results, result)
+                logger.debug('{} journal records reprocessed...', result.records)
+            logger.info('{} journal records reprocessed: {} bulletins rewritten, {} without a stored bulletin, {} failed.',
+                        result.records, result.updated, result.unmatched, result.failed)
+            return result
+        except Exception as e:
+            logger.exception('Journal reprocessing failed')
+            raise e
         
-def get_bulletin(phone_number: str):
+BULLETIN_ETAG_QUERY = """
+    SELECT id, etag FROM boletim_urna WHERE evaluator_phone = :evaluator_phone ORDER BY id DESC LIMIT 1
+""" # (!!!!MOCKADOO!!!!)
+
+BULLETIN_DOCUMENT_QUERY = """
+    SELECT document, type, finished, last_carg, last_party, open_steps, header, content FROM boletim_urna WHERE id = :id
+"""
+
+BULLETIN_DOCUMENT_UPDATE = """
+    UPDATE boletim_urna SET document = :document, etag = :etag WHERE id = :id
+"""
+
+class BulletinDocument(NamedTuple):
+    etag: str
+    body: Optional[bytes]  # None when the client already has this version
+
+def _bulletin_from_row(result) -> BoletimUrna:
+    return BoletimUrna(
+        type=result[0],
+        finished=result[1],
+        last_carg=result[2],
+        last_party=result[3],
+        open_steps=ast.literal_eval(result[4]) if isinstance(result[4], str) else result[4],
+        header=Header(**json.loads(json.loads(result[5]))),
+        content=Content(**json.loads(json.loads(result[6])))
+    )
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
     """
-    Description: Get the bulletin for the evaluator.
+    Description: Whether an If-None-Match header names the ETag (weak or strong) or is "*".
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/').strip('"') == etag:
+            return True
+    return False
+
+def get_bulletin_document(phone_number: str, if_none_match: Optional[str] = None) -> BulletinDocument:
+    """
+    Description: Get the stored JSON of the evaluator's bulletin, without building the models.
+    Only the ETag is read when it matches If-None-Match. Rows stored before the document
+    column existed are serialized once, on their first read.
     """
     with get_logger(task="application") as logger:
         try:
             logger.debug('Bulletin retrieval requested...')
             with get_database_interface().get_session() as session:
-                query = """
-                    SELECT type, finished, last_carg, last_party, open_steps, header, content FROM boletim_urna WHERE evaluator_phone = :evaluator_phone
-                """ # (!!!!MOCKADOO!!!!)
-                result = session.execute(Text(query), {'evaluator_phone': phone_number}).fetchone()
+                result = session.execute(Text(BULLETIN_ETAG_QUERY), {'evaluator_phone': phone_number}).fetchone()
+                if not result:
+                    logger.warning('No bulletin found for phone number: {}', phone_number)
+                    raise Exception('No bulletin found')
+                bulletin_id, etag = result
+                if etag and _etag_matches(if_none_match, etag):
+                    return BulletinDocument(etag, None)
+                row = session.execute(Text(BULLETIN_DOCUMENT_QUERY), {'id': bulletin_id}).fetchone()
+                document = row[0]
+                if document is None:
+                    document, etag = _bulletin_document(_bulletin_from_row(row[1:]))
+                    session.execute(Text(BULLETIN_DOCUMENT_UPDATE), {'id': bulletin_id, 'document': document, 'etag': etag})
+                    session.commit()
+                    if _etag_matches(if_none_match, etag):
+                        return BulletinDocument(etag, None)
+                return BulletinDocument(etag, document.encode())
+        except Exception as e:
+            logger.exception('Bulletin retrieval failed')
+            raise e
+
+async def get_bulletin_document_async(phone_number: str, if_none_match: Optional[str] = None) -> BulletinDocument:
+    """
+    Description: Get the stored JSON of the evaluator's bulletin with the async engine.
+    """
+    with get_logger(task="application") as logger:
+        try:
+            logger.debug('Bulletin retrieval requested...')
+            async with get_database_interface().get_async_session() as session:
+                result = (await session.execute(Text(BULLETIN_ETAG_QUERY), {'evaluator_phone': phone_number})).fetchone()
                 if not result:
-                    logger.warning(f"No bulletin found for phone number: {phone_number}")
+                    logger.warning('No bulletin found for phone number: {}', phone_number)
                     raise Exception('No bulletin found')
-                return BoletimUrna(
-                    type=result[0],
-                    finished=result[1],
-                    last_carg=result[2],
-                    last_party=result[3],
-                    open_steps=ast.literal_eval(result[4]),
-                    header=Header(**json.loads(json.loads(result[5]))),
-                    content=Content(**json.loads(json.loads(result[6])))
-                )
+                bulletin_id, etag = result
+                if etag and _etag_matches(if_none_match, etag):
+                    return BulletinDocument(etag, None)
+                row = (await session.execute(Text(BULLETIN_DOCUMENT_QUERY), {'id': bulletin_id})).fetchone()
+                document = row[0]
+                if document is None:
+                    document, etag = _bulletin_document(_bulletin_from_row(row[1:]))
+                    await session.execute(Text(BULLETIN_DOCUMENT_UPDATE), {'id': bulletin_id, 'document': document, 'etag': etag})
+                    await session.commit()
+                    if _etag_matches(if_none_match, etag):
+                        return BulletinDocument(etag, None)
+                return BulletinDocument(etag, document.encode())
         except Exception as e:
             logger.exception('Bulletin retrieval failed')
             raise e
 
+EVALUATOR_QUERY = """
+    SELECT id, phone_number FROM evaluator WHERE phone_number = :phone_number
+"""
+
 def get_evaluator(phone_number):
     """
-    Description: Get the evaluator by phone number.
+    Description: Get the evaluator by phone number, from the evaluator directory cache when it is there.
     """
     with get_logger(task="application") as logger:
         try:
             logger.debug('Evaluator retrieval requested...')
+            directory = get_evaluator_directory()
+            evaluator = directory.get(phone_number)
+            if evaluator:
+                return evaluator
             with get_database_interface().get_session() as session:
-                query = """
-                    SELECT id, phone_number FROM evaluator WHERE phone_number = :phone_number
-                """
-                result = session.execute(Text(query), {'phone_number': phone_number}).fetchone()
+                result = session.execute(Text(EVALUATOR_QUERY), {'phone_number': phone_number}).fetchone()
+                if not result:
+                    logger.warning('No evaluator found for phone number: {}', phone_number)
+                    raise Exception('No evaluator found')
+                evaluator = EvaluatorPublic(id=result[0], phone_number=result[1])
+                directory.put(evaluator)
+                return evaluator
+        except SQLAlchemyError as e:
+            logger.exception('Database error occurred during evaluator retrieval')
+            raise e  # Re-raise database-specific exceptions for further handling
+        except Exception as e:
+            logger.exception('An unexpected error occurred during evaluator retrieval')
+            raise e  # Re-raise non-database exceptions
+
+async def get_evaluator_async(phone_number):
+    """
+    Description: Get the evaluator by phone number with the async engine, from the evaluator directory cache when it is there.
+    """
+    with get_logger(task="application") as logger:
+        try:
+            logger.debug('Evaluator retrieval requested...')
+            directory = get_evaluator_directory()
+            evaluator = directory.get(phone_number)
+            if evaluator:
+                return evaluator
+            async with get_database_interface().get_async_session() as session:
+                result = (await session.execute(Text(EVALUATOR_QUERY), {'phone_number': phone_number})).fetchone()
                 if not result:
-                    logger.warning(f"No evaluator found for phone number: {phone_number}")
+                    logger.warning('No evaluator found for phone number: {}', phone_number)
                     raise Exception('No evaluator found')
-                return EvaluatorPublic(id=result[0], phone_number=result[1])
+                evaluator = EvaluatorPublic(id=result[0], phone_number=result[1])
+                directory.put(evaluator)
+                return evaluator
         except SQLAlchemyError as e:
             logger.exception('Database error occurred during evaluator retrieval')
             raise e  # Re-raise database-specific exceptions for further handling
         except Exception as e:
             logger.exception('An unexpected error occurred during evaluator retrieval')
-            raise e  # Re-raise non-database exceptions
\ No newline at end of file
+            raise e  # Re-raise non-database exceptions
+
+def get_evaluator_cache_stats() -> dict:
+    """
+    Description: Get the size and hit/miss counters of the evaluator directory cache.
+    """
+    return get_evaluator_directory().stats()
+
+def get_write_behind_stats() -> dict:
+    """
+    Description: Get the queue length and group commit counters of the write-behind queue.
+    """
+    return {'enabled': get_write_behind_queue().enabled, **get_write_behind_queue().stats()}
+
+def close_write_behind_queue():
+    """
+    Description: Write the bulletins still queued and stop the write-behind writer, e.g. on shutdown.
+    """
+    with get_logger(task="write_behind") as logger:
+        try:
+            get_write_behind_queue().close()
+        except Exception:
+            logger.exception('Write-behind queue closing failed')
+
+def warm_evaluator_cache():
+    """
+    Description: Load the evaluators in the directory cache, so logins skip the database from the start.
+    A failure is only logged, the cache then fills on demand.
+    """
+    with get_logger(task="evaluator_cache") as logger:
+        try:
+            get_evaluator_directory().warm()
+        except Exception:
+            logger.exception('Evaluator cache warm-up failed, it will fill on demand')
+
+def warm_scan_index():
+    """
+    Description: Load the payload hashes of the stored scans in the duplicate prefilter.
+    A failure is only logged, duplicates are then still recognized when their bulletin is stored.
+    """
+    with get_logger(task="scan_index") as logger:
+        try:
+            get_scan_index().warm()
+        except Exception:
+            logger.exception('Scan index warm-up failed, duplicates will be found on storing')
+
+def import_evaluator_file(file: BinaryIO, fmt: str, chunk_size: Optional[int] = None) -> EvaluatorImportResult:
+    """
+    Description: Import the evaluators of a CSV or NDJSON file, read as a stream and upserted in chunks.
+    Invalid rows are reported with their line and do not stop the import.
+    """
+    with get_logger(task="evaluator_import") as logger:
+        try:
+            lines = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_evaluators(lines, fmt, chunk_size)
+            finally:
+                lines.detach()  # The caller closes the file
+            logger.info('{} evaluators imported, {} of {} rows rejected.', result.imported, result.failed, result.total)
+            return result
+        except Exception as e:
+            logger.exception('Evaluator import failed')
+            raise e
+
+def audit_bulletins(max_sections: Optional[int] = None, chunk_size: Optional[int] = None) -> AuditReport:
+    """
+    Description: Check the totals of every bulletin of the vote tables, reporting the bulletins
+    whose totals do not add up with their section and the failed checks.
+    """
+    with get_logger(task="audit") as logger:
+        try:
+            report = audit_stored_bulletins(max_sections, chunk_size)
+            logger.info('{} bulletins audited in {:.2f}s: {} inconsistent.', report.sections, report.seconds, report.inconsistent)
+            return report
+        except Exception as e:
+            logger.exception('Bulletin audit failed')
+            raise e
+
+def get_results_positions() -> List[ResultsPosition]:
+    """
+    Description: Get the (turn, position) pairs with counted sections.
+    """
+    with get_logger(task="results") as logger:
+        logger.debug('Results positions requested...')
+        return [ResultsPosition(turn=turn, carg=carg) for turn, carg in get_tally_engine().positions()]
+
+def get_results(turn: int, carg: int, uf: str = None, muni: int = None, zona: int = None) -> Optional[PositionResult]:
+    """
+    Description: Get the running totals of a position, for the whole country or one state, municipality or zone.
+    """
+    with get_logger(task="results") as logger:
+        logger.debug('Results of turn {}, position {} requested (uf={}, muni={}, zona={})...', turn, carg, uf, muni, zona)
+        uf = uf.upper() if uf else None
+        if zona is not None:
+            if not uf:
+                raise ValueError('A UF é obrigatória para consultar uma zona')
+            scope = ('ZONA', uf, zona)
+        elif muni is not None:
+            scope = ('MUNI', muni)
+        elif uf:
+            scope = ('UF', uf)
+        else:
+            scope = ('BR',)
+        totals = get_tally_engine().result(scope, turn, carg)
+        if totals is None:
+            logger.warning('No results for turn {}, position {} in {}', turn, carg, scope)
+            return None
+        return PositionResult(turn=turn, carg=carg, scope=scope[0], uf=uf, muni=muni, zona=zona, **totals)
+
+def get_parser_trace(trace_id: str) -> dict:
+    """
+    Description: Get the recorded parser events of a traced request.
+    """
+    with get_logger(task="application") as logger:
+        logger.debug('Parser trace {} requested...', trace_id)
+        trace = get_parser_trace_store().get(trace_id)
+        if not trace:
+            logger.warning('No parser trace found for id: {}', trace_id)
+            return None
+        return trace.to_dict()
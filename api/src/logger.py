@@ -1,9 +1,23 @@
-from typing import Optional
+import os
+import sys
+from contextvars import ContextVar
+from datetime import datetime
+from random import random
+from typing import Iterator, Optional
 from contextlib import contextmanager
+from uuid import uuid4
 from loguru import logger
 from fastapi import Request
 
 from .settings import logger_settings as settings
+from .utils.log_reader import index_rotated_file, search_logs, tail_lines
+
+# Id of the request being served, set once per request by RequestIdMiddleware
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+
+
+def _add_request_id(record):
+    record['extra']['request_id'] = request_id_var.get()
 
 
 class LoggerHandler:
@@ -27,18 +41,8 @@ class LoggerHandler:
         Create a new instance of the logger
         """
         try:
-            settings.ensure_dir()
-
-            logger.add(
-                "logs/application.log",
-                colorize=True,
-                level=settings.level,
-                format=settings.format_loguru,
-                rotation=settings.rotation,
-                enqueue=True, # async logging while ensuring thread safety and order (integrity)
-                backtrace=True, # for debugging purposes
-                diagnose=True, # for debugging purposes
-                )
+            self.handler_ids = []
+            self.configure()
 
             with logger.contextualize(task='logger', args=''):
                 logger.info('Logger initialized successfully')
@@ -47,6 +51,39 @@ class LoggerHandler:
             print(f"{err_msg}: {e}")
             raise ValueError(err_msg)
 
+    def configure(self):
+        """
+        Add the console and file handlers of the LOG_PROFILE, replacing the ones added before.
+        The debug profile keeps tracebacks with the locals of every frame (diagnose) and the
+        console at DEBUG. The production profile leaves them out, so a DEBUG message is never
+        formatted unless LOG_LEVEL is DEBUG: loguru drops it before formatting its arguments.
+        """
+        settings.ensure_dir()
+        logger.configure(extra={'task': '', 'args': ''}, patcher=_add_request_id)
+        for handler_id in self.handler_ids:
+            logger.remove(handler_id)
+        if not self.handler_ids:
+            logger.remove()  # The default console handler of loguru, replaced by the one of the profile
+        self.handler_ids = [
+            logger.add(
+                sys.stderr,
+                level=settings.console_level,
+                backtrace=settings.diagnose,
+                diagnose=settings.diagnose,
+                ),
+            logger.add(
+                settings.current_log_file,
+                colorize=True,
+                level=settings.level,
+                format=settings.format_loguru,
+                rotation=settings.rotation,
+                compression=index_rotated_file, # sparse time index of each rotated file, for the log search
+                enqueue=True, # async logging while ensuring thread safety and order (integrity)
+                backtrace=settings.diagnose, # for debugging purposes
+                diagnose=settings.diagnose, # for debugging purposes
+                ),
+        ]
+
     @logger.catch
     def list_logs_files(self) -> list:
         """
@@ -66,13 +103,13 @@ class LoggerHandler:
                 service_name: Optional[str] = None
                 ):
         """
-        Return the logger instance
+        Return the logger bound to the task. Binding only applies to the messages logged through
+        the returned logger, so unlike a context it takes no lock and nothing is restored on exit.
         """
-        # create a dict from the args "request", "slug", "hash", "url", "text_content", "force_reprocess" that are not None
-        args = {k: str(v) for k, v in locals().items() if v is not None and k != 'self' and k != 'task'}
-        args = '' if args == {} else args
-        with logger.contextualize(task=task, args=args):
-            yield logger
+        args = ''
+        if request is not None or service_name is not None:
+            args = {k: str(v) for k, v in (('request', request), ('service_name', service_name)) if v is not None}
+        yield logger.bind(task=task, args=args)
 
     def log_spacers(self, separator: str = '-') -> None:
         """
@@ -91,23 +128,70 @@ class LoggerHandler:
     @logger.catch
     def get_logs(self, log_file: str = None, last_n_lines: int = 10) -> list:
         """
-        Get the logs from the log file; by default, the last 10 lines and the current log file
+        Get the logs from the log file; by default, the last 10 lines and the current log file.
+        The file is read backwards from its end, only the blocks holding these lines are loaded.
         """
         try:
-            if not log_file:
-                log_file = settings.log_file
-            with open(settings.log_dir, 'r') as f: # pylint: disable=unspecified-encoding
-                lines = f.readlines()
-                return lines[-last_n_lines:]
+            log_file = os.path.join(settings.log_dir, os.path.basename(log_file)) if log_file else settings.current_log_file
+            return tail_lines(log_file, min(last_n_lines, settings.tail_max_lines))
         except Exception as e: # pylint: disable=unused-variable
             error_message = f"Failed to retrieve last {last_n_lines} lines from log file: {log_file}"
             logger.exception(error_message, last_n_lines=last_n_lines, log_file=log_file, task='logger', args='')
             return []
 
+    def search_logs(self,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None,
+                    level: Optional[str] = None,
+                    contains: Optional[str] = None,
+                    limit: Optional[int] = None) -> Iterator[str]:
+        """
+        Search the current and rotated log files, yielding the matching records as they are found
+        """
+        return search_logs(start=start, end=end, level=level, contains=contains,
+                           limit=min(limit or settings.search_max_matches, settings.search_max_matches))
+
 def get_logger(task: str = '',
                request: Optional[Request] = None,
                service_name: Optional[str] = None):
     """
     Get the logger instance
     """
-    return LoggerHandler().get_logger(task=task, request=request, service_name=service_name)
\ No newline at end of file
+    return LoggerHandler().get_logger(task=task, request=request, service_name=service_name)
+
+
+def sampled() -> bool:
+    """
+    Whether to write a hot path info log, true for LOG_INFO_SAMPLE_RATE of the calls
+    """
+    rate = settings.info_sample_rate
+    return rate >= 1 or random() < rate
+
+
+class RequestIdMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware setting the request id of the logs once per request: the one sent in the
+        LOG_REQUEST_ID_HEADER header, or a new one, also returned in that header of the response.
+        """
+        self.app = app
+        self.header = settings.request_id_header.lower().encode('latin-1')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request_id = next((value.decode('latin-1') for name, value in scope['headers'] if name == self.header), '')
+        if not request_id or len(request_id) > 64 or not request_id.isprintable():
+            request_id = uuid4().hex
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (self.header, request_id.encode('latin-1'))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
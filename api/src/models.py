@@ -24,9 +24,17 @@ class BoletimUrnaModel(Base):
     open_steps = Column(JSON, nullable=True)  # Stores list of open steps
     header = Column(JSON, nullable=False)  # JSON representation of the header
     content = Column(JSON, nullable=False)  # JSON representation of the content
+    document = Column(sa.Text, nullable=True)  # Canonical JSON of the whole bulletin, served as is by GET /bulletin/{phone_number}
+    etag = Column(String(64), nullable=True)  # sha256 of the document
+    payload_digest = Column(String(64), nullable=True)  # sha256 of the payload hashes of its QR codes, to find it from the journal
     created_at = Column(sa.DateTime, default=dt.now)
     updated_at = Column(sa.DateTime, default=dt.now, onupdate=dt.now)
 
+    __table_args__ = (
+        sa.Index('ix_boletim_urna_evaluator_phone_id', 'evaluator_phone', 'id'),
+        sa.Index('ix_boletim_urna_payload_digest', 'payload_digest'),
+    )
+
 class EvaluatorModel(Base):
     __tablename__ = 'evaluator'
     
@@ -36,4 +44,102 @@ class EvaluatorModel(Base):
     zone = Column(String(5), nullable=False)
     city = Column(String(50), nullable=False)
     created_at = Column(sa.DateTime, default=dt.now)
-    updated_at = Column(sa.DateTime, default=dt.now, onupdate=dt.now)
\ No newline at end of file
+    updated_at = Column(sa.DateTime, default=dt.now, onupdate=dt.now)
+
+    __table_args__ = (
+        sa.Index('ux_evaluator_phone_number', 'phone_number', unique=True),
+    )
+
+# Normalized vote tables, filled alongside the JSON columns of BoletimUrnaModel
+class BuSectionModel(Base):
+    __tablename__ = 'bu_section'
+
+    bulletin_id = Column(Integer, ForeignKey('boletim_urna.id', ondelete='CASCADE'), primary_key=True)
+    evaluator_phone = Column(String(15), nullable=False)
+    PLEI = Column(Integer, nullable=True)
+    TURN = Column(Integer, nullable=True)
+    UNFE = Column(String(2), nullable=True)
+    MUNI = Column(Integer, nullable=True)
+    ZONA = Column(Integer, nullable=True)
+    SECA = Column(Integer, nullable=True)
+    IDUE = Column(Integer, nullable=True)
+    APTO = Column(Integer, nullable=True)
+    COMP = Column(Integer, nullable=True)
+    FALT = Column(Integer, nullable=True)
+    created_at = Column(sa.DateTime, default=dt.now)
+
+    __table_args__ = (
+        sa.Index('ix_bu_section_muni_zona_seca', 'MUNI', 'ZONA', 'SECA'),
+        sa.Index('ix_bu_section_idue', 'IDUE'),
+    )
+
+class BuPositionModel(Base):
+    __tablename__ = 'bu_position'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bulletin_id = Column(Integer, ForeignKey('bu_section.bulletin_id', ondelete='CASCADE'), nullable=False)
+    CARG = Column(Integer, nullable=False)
+    TIPO = Column(Integer, nullable=True)
+    APTA = Column(Integer, nullable=True)
+    NOMI = Column(Integer, nullable=True)
+    LEGC = Column(Integer, nullable=True)
+    BRAN = Column(Integer, nullable=True)
+    NULO = Column(Integer, nullable=True)
+    TOTC = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        sa.Index('ix_bu_position_bulletin_carg', 'bulletin_id', 'CARG'),
+    )
+
+class BuPartyModel(Base):
+    __tablename__ = 'bu_party'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bulletin_id = Column(Integer, ForeignKey('bu_section.bulletin_id', ondelete='CASCADE'), nullable=False)
+    CARG = Column(Integer, nullable=False)
+    PART = Column(Integer, nullable=False)
+    LEGP = Column(Integer, nullable=True)
+    TOTP = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        sa.Index('ix_bu_party_bulletin_carg', 'bulletin_id', 'CARG'),
+        sa.Index('ix_bu_party_part_carg', 'PART', 'CARG'),
+    )
+
+class BuCandidateVotesModel(Base):
+    __tablename__ = 'bu_candidate_votes'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bulletin_id = Column(Integer, ForeignKey('bu_section.bulletin_id', ondelete='CASCADE'), nullable=False)
+    CARG = Column(Integer, nullable=False)
+    PART = Column(Integer, nullable=True)  # Not sent for majoritarian positions
+    code = Column(String(10), nullable=False)
+    votes = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        sa.Index('ix_bu_candidate_votes_code_bulletin', 'code', 'bulletin_id'),
+        sa.Index('ix_bu_candidate_votes_bulletin_carg', 'bulletin_id', 'CARG'),
+    )
+
+# Dedup index of the QR codes of the stored bulletins, one row per part and content
+class BuScanModel(Base):
+    __tablename__ = 'bu_scan'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bulletin_id = Column(Integer, ForeignKey('boletim_urna.id', ondelete='CASCADE'), nullable=False)
+    PLEI = Column(Integer, nullable=False)  # MISSING_FIELD when the metadata lacks the field, NULLs would never collide in the unique index
+    TURN = Column(Integer, nullable=False)
+    MUNI = Column(Integer, nullable=False)
+    ZONA = Column(Integer, nullable=False)
+    SECA = Column(Integer, nullable=False)
+    IDUE = Column(Integer, nullable=False)
+    part = Column(Integer, nullable=False)  # QRBU index
+    total_parts = Column(Integer, nullable=False)
+    payload_hash = Column(String(64), nullable=False)  # sha256 of the whitespace-normalized payload
+    conflict = Column(Boolean, nullable=False, default=False)  # Another content was stored before for this part of the section
+    created_at = Column(sa.DateTime, default=dt.now)
+
+    __table_args__ = (
+        sa.Index('ux_bu_scan_hash_section_part', 'payload_hash', 'PLEI', 'TURN', 'MUNI', 'ZONA', 'SECA', 'IDUE', 'part', unique=True),
+        sa.Index('ix_bu_scan_section_part', 'PLEI', 'TURN', 'MUNI', 'ZONA', 'SECA', 'IDUE', 'part'),
+    )
@@ -1,16 +1,43 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, status
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from typing import Annotated, List, Optional
+import hashlib
+import hmac
+from fastapi import APIRouter, Depends, Header, Query, Request, Response, status
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from .logger import LoggerHandler, get_logger, logger
-from .schemas import EvaluatorLogin, BulletinQrCode, EvaluatorPublic, BoletimUrna
-from .handlers import save_bulletin_qr_code, get_evaluator, get_bulletin
+from .schemas import EvaluatorLogin, BulletinQrCode, EvaluatorPublic, BoletimUrna, BulletinProgress, BulletinBatchResult
+from .schemas import PositionResult, ResultsPosition, EvaluatorImportResult, AuditReport
+from .handlers import save_bulletin_qr_code, save_bulletin_qr_code_batch, get_evaluator, get_bulletin_document, get_bulletin_progress, get_parser_trace
+from .handlers import save_bulletin_qr_code_async, save_bulletin_qr_code_stream, get_evaluator_async, get_bulletin_document_async
+from .handlers import audit_bulletins, get_results, get_results_positions, get_evaluator_cache_stats, import_evaluator_file, get_write_behind_stats
+from .utils.parser_trace import get_parser_trace_store
+from .settings import app_settings, database_settings, evaluator_import_settings
+from .utils.evaluator_import import format_from_name
+from .utils.log_reader import format_time
+from .utils.write_behind import WriteQueueFull
+from .utils.evaluator_locks import EvaluatorBusy, get_evaluator_locks
+from .utils.idempotency import IdempotencyKeyReused, get_idempotency_store, idempotency_key as idempotency_key_for
 
 
 application_router = APIRouter()
 
+IMPORT_CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+STREAM_CONTENT_TYPES = {'text/plain': 'text', 'application/x-ndjson': 'ndjson', 'application/ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+
+def require_security_token(x_security_token: Annotated[Optional[str], Header()] = None):
+    """
+    Description: Reject admin and debug requests without the configured SECURITY_TOKEN in the X-Security-Token header.
+    """
+    digest = hashlib.sha256((x_security_token or '').encode()).hexdigest()
+    if not x_security_token or not hmac.compare_digest(digest, app_settings.security_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid security token')
+
 @application_router.post('/evaluator/{phone_number}/login', status_code=status.HTTP_200_OK, response_model=EvaluatorPublic)
-def login(
+async def login(
     phone_number: str,
 ):
     """
@@ -19,29 +46,117 @@ def login(
     with get_logger(task="login") as logger:
         try:
             logger.debug('Login requested...')
-            logger.debug(f'Phone number: {phone_number}')
-            return get_evaluator(phone_number)
+            logger.debug('Phone number: {}', phone_number)
+            if database_settings.is_async:
+                return await get_evaluator_async(phone_number)
+            return await run_in_threadpool(get_evaluator, phone_number)
         except Exception as e:
             logger.exception('Login failed')
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
-@application_router.post('/bulletin/qrcode', status_code=status.HTTP_201_CREATED)
-def create_bulletin_qrcode(
+@application_router.post('/bulletin/qrcode', status_code=status.HTTP_201_CREATED, response_model=BulletinProgress)
+async def create_bulletin_qrcode(
     evaluator: EvaluatorPublic,
     bulletin: BulletinQrCode,
+    response: Response,
+    idempotency_key: Annotated[Optional[str], Header(alias='Idempotency-Key')] = None,
 ):
     """
     Description: Create a bulletin QR code.
+    A retry with the same Idempotency-Key (by default, of the same payload) gets the response of the
+    first attempt, without being processed again, with the Idempotent-Replayed header.
     """
     with get_logger(task="qrcode") as logger:
+        trace_headers = None
+
+        async def save() -> BulletinProgress:
+            nonlocal trace_headers
+            trace = get_parser_trace_store().start()
+            trace_headers = {'X-Parser-Trace-Id': trace.trace_id} if trace else None
+            if database_settings.is_async:
+                return await save_bulletin_qr_code_async(evaluator, bulletin, trace=trace)
+            return await run_in_threadpool(save_bulletin_qr_code, evaluator, bulletin, trace=trace)
+
+        try:
+            key = idempotency_key_for(evaluator.phone_number, bulletin.content, idempotency_key)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
         try:
             logger.debug('Bulletin QR code creation requested...')
-            logger.debug(f'Phone number: {evaluator.phone_number} is creating a bulletin...')
-            save_bulletin_qr_code(evaluator, bulletin)
+            logger.debug('Phone number: {} is creating a bulletin...', evaluator.phone_number)
+            # Sending a part again retries the storage of a complete session, so a bulletin still missing
+            # parts is not replayed under a key derived from the payload
+            progress, replayed = await get_idempotency_store().run(
+                key, save, keep=lambda progress: progress.finished or not key.derived)
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            if trace_headers:
+                response.headers.update(trace_headers)
+            return progress
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+        except WriteQueueFull as e:
+            logger.warning('Bulletin QR code rejected, the write-behind queue is full')
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Write queue is full, retry later',
+                                headers={'Retry-After': str(e.retry_after), **(trace_headers or {})})
+        except EvaluatorBusy as e:
+            logger.warning('Bulletin QR code rejected, the previous uploads of the evaluator are still running')
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                                headers={'Retry-After': str(e.retry_after)})
         except Exception as e:
             logger.exception('Bulletin QR code creation failed')
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e), headers=trace_headers)
         
+@application_router.post('/bulletin/qrcode/batch', status_code=status.HTTP_201_CREATED, response_model=BulletinBatchResult)
+def create_bulletin_qrcode_batch(
+    evaluator: EvaluatorPublic,
+    bulletins: List[BulletinQrCode],
+):
+    """
+    Description: Create bulletins from a batch of QR codes, reporting the result of each item.
+    """
+    with get_logger(task="qrcode") as logger:
+        if len(bulletins) > app_settings.batch_max_items:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f'O lote excede o limite de {app_settings.batch_max_items} QR codes')
+        try:
+            logger.debug('Phone number: {} is creating {} bulletins...', evaluator.phone_number, len(bulletins))
+            return save_bulletin_qr_code_batch(evaluator, bulletins)
+        except EvaluatorBusy as e:
+            logger.warning('Bulletin QR code batch rejected, the previous uploads of the evaluator are still running')
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                                headers={'Retry-After': str(e.retry_after)})
+        except Exception as e:
+            logger.exception('Bulletin QR code batch creation failed')
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@application_router.post('/bulletin/qrcode/stream', status_code=status.HTTP_201_CREATED, response_model=BulletinBatchResult)
+async def create_bulletin_qrcode_stream(
+    request: Request,
+    phone_number: str,
+    evaluator_id: Annotated[int, Query(alias='id')],
+    fmt: Annotated[Optional[str], Query(alias='format')] = None,
+):
+    """
+    Description: Create bulletins from a request body of QR codes, one per line: NDJSON ({"content": ...}
+    objects or strings) or plain text payloads, reporting the result of each line.
+    The format comes from the format parameter or the Content-Type, NDJSON by default.
+    The body is read and stored in batches as it arrives, without the BATCH_MAX_ITEMS limit.
+    """
+    with get_logger(task="qrcode") as logger:
+        content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+        fmt = fmt or STREAM_CONTENT_TYPES.get(content_type, 'ndjson')
+        evaluator = EvaluatorPublic(id=evaluator_id, phone_number=phone_number)
+        try:
+            logger.debug('Phone number: {} is streaming bulletins...', evaluator.phone_number)
+            # A batch failing midway is reported in the result, with the lines stored before it
+            return await save_bulletin_qr_code_stream(evaluator, request.stream(), fmt)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except Exception as e:
+            logger.exception('Bulletin QR code stream creation failed')
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
 @application_router.post('/bulletin/form', status_code=status.HTTP_201_CREATED)
 def create_bulletin_manually(
     evaluator: EvaluatorPublic,
@@ -53,26 +168,201 @@ def create_bulletin_manually(
     with get_logger(task="application") as logger:
         try:
             logger.debug('Bulletin creation requested...')
-            logger.debug(f'Phone number: {evaluator.phone_number} is creating a bulletin...')
-            logger.debug(f'Bulletin: {bulletin}')
+            logger.debug('Phone number: {} is creating a bulletin...', evaluator.phone_number)
+            logger.debug('Bulletin: {}', bulletin)
             # TODO: Implement bulletin creation logic
             return {'message': 'Bulletin created successfully'}
         except Exception as e:
             logger.exception('Bulletin creation failed')
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
         
-@application_router.get('/bulletin/{phone_number}', status_code=status.HTTP_200_OK, response_model=BoletimUrna)
-def get_bulletin_info(
+@application_router.get('/bulletin/{phone_number}', status_code=status.HTTP_200_OK, response_class=Response,
+                        responses={200: {'model': BoletimUrna}, 304: {'description': 'The bulletin did not change since the ETag sent'}})
+async def get_bulletin_info(
     phone_number:str,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
     """
     Description: Get the bulletin for the evaluator.
+    The stored JSON is sent as is, with an ETag: polling with If-None-Match gets a 304 while it is unchanged.
     """
     with get_logger(task="application") as logger:
         try:
             logger.debug('Bulletin retrieval requested...')
-            logger.debug(f'Phone number: {phone_number} is retrieving a bulletin...')
-            return get_bulletin(phone_number)
+            logger.debug('Phone number: {} is retrieving a bulletin...', phone_number)
+            if database_settings.is_async:
+                document = await get_bulletin_document_async(phone_number, if_none_match)
+            else:
+                document = await run_in_threadpool(get_bulletin_document, phone_number, if_none_match)
         except Exception as e:
             logger.exception('Bulletin retrieval failed')
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
\ No newline at end of file
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        headers = {'ETag': f'"{document.etag}"'}
+        if document.body is None:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=document.body, media_type='application/json', headers=headers)
+
+@application_router.get('/bulletin/{phone_number}/progress', status_code=status.HTTP_200_OK, response_model=List[BulletinProgress])
+def get_bulletin_progress_info(
+    phone_number: str,
+):
+    """
+    Description: Get the received and missing QR code parts of the evaluator's partial bulletins.
+    """
+    with get_logger(task="application") as logger:
+        try:
+            logger.debug('Phone number: {} is retrieving its bulletin progress...', phone_number)
+            return get_bulletin_progress(phone_number)
+        except Exception as e:
+            logger.exception('Bulletin progress retrieval failed')
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@application_router.get('/results', status_code=status.HTTP_200_OK, response_model=List[ResultsPosition])
+def get_results_positions_info():
+    """
+    Description: List the (turn, position) pairs with results.
+    """
+    with get_logger(task="results") as logger:
+        try:
+            return get_results_positions()
+        except Exception as e:
+            logger.exception('Results positions retrieval failed')
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@application_router.get('/results/{turn}/{carg}', status_code=status.HTTP_200_OK, response_model=PositionResult)
+def get_results_info(
+    turn: int,
+    carg: int,
+    uf: Optional[str] = None,
+    muni: Optional[int] = None,
+    zona: Optional[int] = None,
+):
+    """
+    Description: Get the running totals of a position, optionally for one state (uf), municipality (muni) or zone (uf and zona).
+    """
+    with get_logger(task="results") as logger:
+        try:
+            results = get_results(turn, carg, uf=uf, muni=muni, zona=zona)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except Exception as e:
+            logger.exception('Results retrieval failed')
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        if results is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No results found')
+        return results
+
+@application_router.get('/debug/parser/trace/{trace_id}', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def get_parser_trace_info(
+    trace_id: str,
+):
+    """
+    Description: Get the per-token parser events recorded for a traced QR code request.
+    """
+    trace = get_parser_trace(trace_id)
+    if not trace:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parser trace not found')
+    return trace
+
+@application_router.get('/debug/cache/evaluators', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def get_evaluator_cache_info():
+    """
+    Description: Get the size and hit/miss counters of the evaluator directory cache.
+    """
+    return get_evaluator_cache_stats()
+
+@application_router.get('/debug/idempotency', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def get_idempotency_info():
+    """
+    Description: Get the size and replay counters of the idempotency store of the QR code submissions.
+    """
+    return get_idempotency_store().stats()
+
+@application_router.get('/debug/evaluator-locks', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def get_evaluator_locks_info():
+    """
+    Description: Get the evaluators holding or waiting on the per-evaluator upload locks.
+    """
+    return get_evaluator_locks().stats()
+
+@application_router.get('/debug/write-behind', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def get_write_behind_info():
+    """
+    Description: Get the queue length and group commit counters of the write-behind queue.
+    """
+    return get_write_behind_stats()
+
+@application_router.post('/admin/evaluators/import', status_code=status.HTTP_200_OK, response_model=EvaluatorImportResult,
+                         dependencies=[Depends(require_security_token)])
+async def import_evaluators_info(
+    request: Request,
+    fmt: Annotated[Optional[str], Query(alias='format')] = None,
+    filename: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+):
+    """
+    Description: Import evaluators from a CSV (phone_number, section, zone, city header) or NDJSON request body.
+    The format comes from the format parameter, the file name extension or the Content-Type.
+    Existing phone numbers are updated, and invalid rows are reported without stopping the import.
+    """
+    with get_logger(task="evaluator_import") as logger:
+        content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+        fmt = fmt or (filename and format_from_name(filename)) or IMPORT_CONTENT_TYPES.get(content_type)
+        if not fmt:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail='Informe o formato do arquivo: csv ou ndjson')
+        with SpooledTemporaryFile(max_size=evaluator_import_settings.spool_bytes) as upload:
+            async for chunk in request.stream():
+                upload.write(chunk)
+            upload.seek(0)
+            try:
+                return await run_in_threadpool(import_evaluator_file, upload, fmt, chunk_size)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            except Exception as e:
+                logger.exception('Evaluator import failed')
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@application_router.get('/admin/audit', status_code=status.HTTP_200_OK, response_model=AuditReport,
+                        dependencies=[Depends(require_security_token)])
+def get_audit_info(
+    max_sections: Annotated[Optional[int], Query(ge=0)] = None,
+    chunk_size: Annotated[Optional[int], Query(ge=1)] = None,
+):
+    """
+    Description: Audit the totals of the stored bulletins: candidate votes + LEGP = TOTP, party totals
+    = NOMI + LEGC, NOMI + LEGC + BRAN + NULO = TOTC and COMP + FALT = APTO, reported by section.
+    """
+    with get_logger(task="audit") as logger:
+        try:
+            return audit_bulletins(max_sections, chunk_size)
+        except Exception as e:
+            logger.exception('Bulletin audit failed')
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@application_router.get('/admin/logs/tail', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def get_logs_tail_info(
+    lines: Annotated[int, Query(ge=1)] = 100,
+    log_file: Optional[str] = None,
+) -> List[str]:
+    """
+    Description: Get the last lines of the current log file, or of a rotated one given by its name.
+    """
+    return LoggerHandler().get_logs(log_file=log_file, last_n_lines=lines)
+
+@application_router.get('/admin/logs/search', status_code=status.HTTP_200_OK, dependencies=[Depends(require_security_token)])
+def search_logs_info(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    level: Optional[str] = None,
+    contains: Optional[str] = None,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+):
+    """
+    Description: Search the current and rotated log files by time range (local time when no offset is given),
+    level and text. The matching records, with their tracebacks, are streamed from the oldest as they are found.
+    """
+    if start and end and format_time(start) > format_time(end):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='start must not be after end')
+    records = LoggerHandler().search_logs(start=start, end=end, level=level, contains=contains, limit=limit)
+    return StreamingResponse(records, media_type='text/plain; charset=utf-8')
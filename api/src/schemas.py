@@ -108,6 +108,102 @@ class BoletimUrna(BaseModel):
 class BoletimUrnaForm(BaseModel):
     pass
 
+class AuditViolation(BaseModel):
+    check: str  # One of utils.audit.CHECKS
+    CARG: Optional[int] = None
+    PART: Optional[int] = None
+    expected: int  # The total stored in the bulletin
+    found: int  # The sum of the counters it totals
+
+class BulletinProgress(BaseModel):
+    phone_number: str
+    urn: Optional[int] = None  # IDUE, once part 1 is received
+    total_parts: int
+    received_parts: List[int] = []
+    missing_parts: List[int] = []
+    finished: bool = False
+    duplicate: bool = False  # Already received, or already stored from another scan of the same urn
+    conflict: bool = False  # Stored, but another content was stored before for the same section
+    violations: List[AuditViolation] = []  # Totals of the bulletin parsed that do not add up, see utils.audit
+
+class BatchItemStatus(str, Enum):
+    STORED: str = "stored"
+    BUFFERED: str = "buffered"
+    DUPLICATE: str = "duplicate"
+    CONFLICT: str = "conflict"
+    ERROR: str = "error"
+
+class BulletinBatchItem(BaseModel):
+    index: int
+    status: BatchItemStatus
+    progress: Optional[BulletinProgress] = None
+    error: Optional[str] = None
+
+class BulletinBatchResult(BaseModel):
+    stored: int = 0
+    failed: int = 0
+    items: List[BulletinBatchItem] = []
+
+class PartyResult(BaseModel):
+    TOTP: int = 0
+    LEGP: int = 0
+
+class PositionResult(BaseModel):
+    turn: int
+    carg: int
+    scope: str  # BR, UF, MUNI or ZONA
+    uf: Optional[str] = None
+    muni: Optional[int] = None
+    zona: Optional[int] = None
+    sections: int = 0
+    summary: Dict[str, int] = {}
+    parties: Dict[int, PartyResult] = {}
+    candidates: Dict[str, int] = {}
+
+class ResultsPosition(BaseModel):
+    turn: int
+    carg: int
+
+class EvaluatorImportRow(BaseModel):
+    phone_number: constr(strip_whitespace=True, pattern=r'^\d{10,15}$')
+    section: constr(strip_whitespace=True, min_length=1, max_length=5)
+    zone: constr(strip_whitespace=True, min_length=1, max_length=5)
+    city: constr(strip_whitespace=True, min_length=1, max_length=50)
+
+class EvaluatorImportError(BaseModel):
+    line: int  # Line of the file, the CSV header being line 1
+    error: str
+
+class EvaluatorImportResult(BaseModel):
+    total: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: List[EvaluatorImportError] = []  # The first EVALUATOR_IMPORT_MAX_ERRORS only
+
+class JournalReprocessResult(BaseModel):
+    records: int = 0
+    updated: int = 0  # Bulletin rows rewritten
+    unmatched: int = 0  # Parsed records without a stored bulletin, e.g. duplicate scans
+    failed: int = 0
+    errors: List[str] = []  # Unreadable segments, and the first records that failed to parse
+
+class SectionAudit(BaseModel):
+    bulletin_id: int
+    evaluator_phone: str
+    TURN: Optional[int] = None
+    UNFE: Optional[str] = None
+    MUNI: Optional[int] = None
+    ZONA: Optional[int] = None
+    SECA: Optional[int] = None
+    violations: List[AuditViolation] = []
+
+class AuditReport(BaseModel):
+    sections: int = 0  # Bulletins audited
+    inconsistent: int = 0  # Bulletins with at least one violation
+    checks: Dict[str, int] = {}  # Violations found by each check
+    items: List[SectionAudit] = []  # The first AUDIT_MAX_SECTIONS inconsistent bulletins only
+    seconds: float = 0.0
+
 class ProcessingStep(Enum):
         WAITING: str = "waiting"
         OPEN: str = "open"
@@ -1,7 +1,8 @@
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from datetime import datetime as dt
 from hashlib import sha256
+from sqlalchemy.engine import make_url
 import os
 import logging
 
@@ -28,6 +29,9 @@ class AppSettings(BaseSettings):
     CORS_ALLOW_HEADERS: str = '*'
     SECURITY_TOKEN: str = '123'
     DEFAULT_PROXY_URL: str = ''
+    BATCH_MAX_ITEMS: int = 500
+    BATCH_POOL_SIZE: int = 0 # 0 for one parser process per CPU, 1 to parse in the request process
+    BATCH_MAX_LINE_BYTES: int = 65536 # Longest line of a streamed batch, a QR code payload is a few KiB
 
     def __init__(self, **data):
         super().__init__(**data)
@@ -102,6 +106,18 @@ class AppSettings(BaseSettings):
     @property
     def default_proxy_url(self):
         return self.DEFAULT_PROXY_URL
+
+    @property
+    def batch_max_items(self) -> int:
+        return self.BATCH_MAX_ITEMS
+
+    @property
+    def batch_max_line_bytes(self) -> int:
+        return self.BATCH_MAX_LINE_BYTES
+
+    @property
+    def batch_pool_size(self) -> int:
+        return self.BATCH_POOL_SIZE or os.cpu_count() or 1
     
 app_settings = AppSettings()
 
@@ -116,6 +132,15 @@ class LoggerSettings(BaseSettings):
     IS_UNIFIED_LOG: bool = True
     LOG_FILE: str = "application_{time}.log"
     ROTATION: str = "200 MB"
+    # "debug": console at DEBUG, tracebacks with the locals of every frame.
+    # "production": console at LOG_LEVEL, plain tracebacks, hot path info logs sampled
+    LOG_PROFILE: str = "debug"
+    LOG_INFO_SAMPLE_RATE: Optional[float] = None # Share of the hot path info logs written, by default 1 in debug and 0.1 in production
+    LOG_REQUEST_ID_HEADER: str = "X-Request-ID"
+    LOG_READ_BLOCK_BYTES: int = 64 * 1024 # Reads of the log tail and search
+    LOG_INDEX_INTERVAL_BYTES: int = 1024 * 1024 # Bytes between two entries of the index of a rotated file
+    LOG_TAIL_MAX_LINES: int = 10000
+    LOG_SEARCH_MAX_MATCHES: int = 10000
 
     @property
     def log_dir(self) -> str:
@@ -136,6 +161,48 @@ class LoggerSettings(BaseSettings):
     @property
     def rotation(self) -> str:
         return self.ROTATION
+
+    @property
+    def is_production(self) -> bool:
+        return self.LOG_PROFILE.lower() == "production"
+
+    @property
+    def diagnose(self) -> bool:
+        return not self.is_production
+
+    @property
+    def console_level(self) -> int:
+        return logging.DEBUG if not self.is_production else self.level
+
+    @property
+    def info_sample_rate(self) -> float:
+        if self.LOG_INFO_SAMPLE_RATE is not None:
+            return self.LOG_INFO_SAMPLE_RATE
+        return 0.1 if self.is_production else 1.0
+
+    @property
+    def request_id_header(self) -> str:
+        return self.LOG_REQUEST_ID_HEADER
+
+    @property
+    def current_log_file(self) -> str:
+        return os.path.join(self.log_dir, "application.log")
+
+    @property
+    def read_block_bytes(self) -> int:
+        return self.LOG_READ_BLOCK_BYTES
+
+    @property
+    def index_interval_bytes(self) -> int:
+        return self.LOG_INDEX_INTERVAL_BYTES
+
+    @property
+    def tail_max_lines(self) -> int:
+        return self.LOG_TAIL_MAX_LINES
+
+    @property
+    def search_max_matches(self) -> int:
+        return self.LOG_SEARCH_MAX_MATCHES
     
     @property
     def log_filename(self) -> str:
@@ -160,14 +227,337 @@ class LoggerSettings(BaseSettings):
     
     @property
     def format_loguru(self) -> str:
-        return "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message} | {extra[task]} | {name} | {extra[args]}"
+        return "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message} | {extra[task]} | {name} | {extra[args]} | {extra[request_id]}"
     
     def ensure_dir(self):
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
 
 logger_settings = LoggerSettings()
-    
+
+class ParserSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    PARSER_TRACE_ENABLED: bool = False
+    PARSER_TRACE_MAX_EVENTS: int = 5000
+    PARSER_TRACE_MAX_REQUESTS: int = 100
+
+    @property
+    def trace_enabled(self) -> bool:
+        return self.PARSER_TRACE_ENABLED
+
+    @property
+    def trace_max_events(self) -> int:
+        return self.PARSER_TRACE_MAX_EVENTS
+
+    @property
+    def trace_max_requests(self) -> int:
+        return self.PARSER_TRACE_MAX_REQUESTS
+
+parser_settings = ParserSettings()
+
+class SessionSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    BU_SESSION_MAX_ENTRIES: int = 1000
+    BU_SESSION_TTL_SECONDS: int = 1800
+    BU_SESSION_SPILL_DIR: str = "data/sessions"
+
+    @property
+    def max_entries(self) -> int:
+        return self.BU_SESSION_MAX_ENTRIES
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self.BU_SESSION_TTL_SECONDS
+
+    @property
+    def spill_dir(self) -> str:
+        return self.BU_SESSION_SPILL_DIR
+
+    def ensure_dir(self):
+        if not os.path.exists(self.spill_dir):
+            os.makedirs(self.spill_dir)
+
+session_settings = SessionSettings()
+
+class TallySettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    TALLY_SYNC_INTERVAL_SECONDS: float = 1.0
+    TALLY_GAP_RETENTION_SECONDS: float = 60.0
+    TALLY_CHUNK_SIZE: int = 1000
+
+    @property
+    def sync_interval_seconds(self) -> float:
+        return self.TALLY_SYNC_INTERVAL_SECONDS
+
+    @property
+    def gap_retention_seconds(self) -> float:
+        return self.TALLY_GAP_RETENTION_SECONDS
+
+    @property
+    def chunk_size(self) -> int:
+        return self.TALLY_CHUNK_SIZE
+
+tally_settings = TallySettings()
+
+class EvaluatorCacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    EVALUATOR_CACHE_MAX_ENTRIES: int = 100000 # 0 disables the cache
+    EVALUATOR_CACHE_TTL_SECONDS: float = 600.0
+    EVALUATOR_CACHE_WARM_CHUNK_SIZE: int = 5000
+
+    @property
+    def max_entries(self) -> int:
+        return self.EVALUATOR_CACHE_MAX_ENTRIES
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self.EVALUATOR_CACHE_TTL_SECONDS
+
+    @property
+    def warm_chunk_size(self) -> int:
+        return self.EVALUATOR_CACHE_WARM_CHUNK_SIZE
+
+evaluator_cache_settings = EvaluatorCacheSettings()
+
+class EvaluatorImportSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    EVALUATOR_IMPORT_CHUNK_SIZE: int = 1000
+    EVALUATOR_IMPORT_MAX_ERRORS: int = 1000 # Errors listed in the result, all of them are counted
+    EVALUATOR_IMPORT_SPOOL_BYTES: int = 1024 * 1024 # Uploads larger than this are buffered on disk
+
+    @property
+    def chunk_size(self) -> int:
+        return self.EVALUATOR_IMPORT_CHUNK_SIZE
+
+    @property
+    def max_errors(self) -> int:
+        return self.EVALUATOR_IMPORT_MAX_ERRORS
+
+    @property
+    def spool_bytes(self) -> int:
+        return self.EVALUATOR_IMPORT_SPOOL_BYTES
+
+evaluator_import_settings = EvaluatorImportSettings()
+
+class ScanIndexSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    SCAN_INDEX_CAPACITY: int = 1000000 # Scans per Bloom filter before another one is added, 0 disables the prefilter
+    SCAN_INDEX_ERROR_RATE: float = 0.01
+    SCAN_INDEX_WARM_CHUNK_SIZE: int = 10000
+
+    @property
+    def capacity(self) -> int:
+        return self.SCAN_INDEX_CAPACITY
+
+    @property
+    def error_rate(self) -> float:
+        return self.SCAN_INDEX_ERROR_RATE
+
+    @property
+    def warm_chunk_size(self) -> int:
+        return self.SCAN_INDEX_WARM_CHUNK_SIZE
+
+scan_index_settings = ScanIndexSettings()
+
+class JournalSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    JOURNAL_ENABLED: bool = True
+    JOURNAL_DIR: str = "data/journal"
+    JOURNAL_SEGMENT_BYTES: int = 64 * 1024 * 1024
+    JOURNAL_SYNC_INTERVAL_SECONDS: float = 0.0 # 0 waits for the fsync of each record, shared by concurrent requests
+
+    @property
+    def enabled(self) -> bool:
+        return self.JOURNAL_ENABLED
+
+    @property
+    def directory(self) -> str:
+        return self.JOURNAL_DIR
+
+    @property
+    def segment_bytes(self) -> int:
+        return self.JOURNAL_SEGMENT_BYTES
+
+    @property
+    def sync_interval_seconds(self) -> float:
+        return self.JOURNAL_SYNC_INTERVAL_SECONDS
+
+    def ensure_dir(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+journal_settings = JournalSettings()
+
+class WriteBehindSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    WRITE_BEHIND_ENABLED: bool = False # Store the scanned bulletins in group commits from a background writer
+    WRITE_BEHIND_MAX_ITEMS: int = 5000 # Bulletins waiting to be written, requests get a 503 above it
+    WRITE_BEHIND_BATCH_SIZE: int = 200
+    WRITE_BEHIND_FLUSH_MS: float = 10.0
+    WRITE_BEHIND_RETRY_AFTER_SECONDS: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.WRITE_BEHIND_ENABLED
+
+    @property
+    def max_items(self) -> int:
+        return self.WRITE_BEHIND_MAX_ITEMS
+
+    @property
+    def batch_size(self) -> int:
+        return self.WRITE_BEHIND_BATCH_SIZE
+
+    @property
+    def flush_ms(self) -> float:
+        return self.WRITE_BEHIND_FLUSH_MS
+
+    @property
+    def retry_after_seconds(self) -> int:
+        return self.WRITE_BEHIND_RETRY_AFTER_SECONDS
+
+write_behind_settings = WriteBehindSettings()
+
+class MetricsSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    METRICS_ENABLED: bool = True # Request, parser stage and database timings exposed at /metrics
+    METRICS_LATENCY_BUCKETS: str = '0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10' # Seconds
+    METRICS_PARSER_BUCKETS: str = '0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1' # Seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.METRICS_ENABLED
+
+    @property
+    def latency_buckets(self) -> List[float]:
+        return sorted(float(bound) for bound in self.METRICS_LATENCY_BUCKETS.split(','))
+
+    @property
+    def parser_buckets(self) -> List[float]:
+        return sorted(float(bound) for bound in self.METRICS_PARSER_BUCKETS.split(','))
+
+metrics_settings = MetricsSettings()
+
+class IdempotencySettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    IDEMPOTENCY_MAX_ENTRIES: int = 100000 # Completed QR code submissions kept for replay, 0 disables it
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0 # For the Idempotency-Key header
+    IDEMPOTENCY_DERIVE_KEYS: bool = True # Without the header, the key is the phone number and the payload hash
+    IDEMPOTENCY_DERIVED_TTL_SECONDS: float = 300.0
+
+    @property
+    def max_entries(self) -> int:
+        return self.IDEMPOTENCY_MAX_ENTRIES
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self.IDEMPOTENCY_TTL_SECONDS
+
+    @property
+    def derive_keys(self) -> bool:
+        return self.IDEMPOTENCY_DERIVE_KEYS
+
+    @property
+    def derived_ttl_seconds(self) -> float:
+        return self.IDEMPOTENCY_DERIVED_TTL_SECONDS
+
+idempotency_settings = IdempotencySettings()
+
+class EvaluatorLockSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    EVALUATOR_LOCK_SHARDS: int = 64 # Shards of the lock table, each guarding the wait queues of its evaluators
+    EVALUATOR_LOCK_MODE: str = "local" # "local", or "database" to also take a PostgreSQL advisory lock per evaluator
+    EVALUATOR_LOCK_TIMEOUT_SECONDS: float = 30.0 # Wait for the previous uploads of the evaluator, then 503
+    EVALUATOR_LOCK_POOL_SIZE: int = 20 # Connections holding the advisory locks, in a pool apart from the writes
+
+    @property
+    def shards(self) -> int:
+        return max(1, self.EVALUATOR_LOCK_SHARDS)
+
+    @property
+    def database_locks(self) -> bool:
+        return self.EVALUATOR_LOCK_MODE.lower() == "database"
+
+    @property
+    def timeout_seconds(self) -> float:
+        return self.EVALUATOR_LOCK_TIMEOUT_SECONDS
+
+    @property
+    def engine_options(self) -> dict:
+        return {'pool_size': max(1, self.EVALUATOR_LOCK_POOL_SIZE), 'max_overflow': 0, 'pool_timeout': self.timeout_seconds}
+
+evaluator_lock_settings = EvaluatorLockSettings()
+
+class AuditSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+    AUDIT_ON_INGEST: bool = True # Check the totals of each bulletin parsed, reported in its BulletinProgress
+    AUDIT_CHUNK_SIZE: int = 5000 # Bulletins loaded from the vote tables and checked at once
+    AUDIT_MAX_SECTIONS: int = 1000 # Inconsistent bulletins listed in a report, all of them are counted
+
+    @property
+    def on_ingest(self) -> bool:
+        return self.AUDIT_ON_INGEST
+
+    @property
+    def chunk_size(self) -> int:
+        return max(1, self.AUDIT_CHUNK_SIZE)
+
+    @property
+    def max_sections(self) -> int:
+        return self.AUDIT_MAX_SECTIONS
+
+audit_settings = AuditSettings()
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
 class DatabaseSettings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -181,6 +571,9 @@ class DatabaseSettings(BaseSettings):
     DB_PORT: str = ''
     DB_NAME: str = ''
     DB_OVERRIDE_URL: str = None
+    DB_ASYNC: bool = False # Serve the request path with an async engine (aiosqlite / asyncpg)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
 
     @property
     def url(self) -> str:
@@ -188,5 +581,24 @@ class DatabaseSettings(BaseSettings):
             return self.DB_OVERRIDE_URL
         return f"{self.DB_DRIVER}://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def is_async(self) -> bool:
+        return self.DB_ASYNC
+
+    @property
+    def async_url(self) -> str:
+        url = make_url(self.url)
+        backend, driver = url.get_backend_name(), url.get_driver_name()
+        if backend in ASYNC_DRIVERS and driver != ASYNC_DRIVERS[backend]:
+            url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+        return url.render_as_string(hide_password=False)
+
+    @property
+    def engine_options(self) -> dict:
+        url = make_url(self.url)
+        if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+            return {}  # In-memory sqlite uses a single connection pool
+        return {'pool_size': self.DB_POOL_SIZE, 'max_overflow': self.DB_MAX_OVERFLOW}
+
 
 database_settings = DatabaseSettings()
\ No newline at end of file
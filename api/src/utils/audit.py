@@ -0,0 +1,206 @@
+"""
+Arithmetic consistency audit of the bulletins.
+
+A bulletin carries redundant totals. For each party, the votes of its candidates plus its
+legend votes (LEGP) give its total (TOTP). For each position, the votes of the candidates
+give the nominal votes (NOMI), the party totals give the nominal plus the legend votes
+(LEGC), and those with the blank and null votes give the total (TOTC). The attendance (COMP)
+plus the absences (FALT) give the voters of the section (APTO).
+
+Bulletins are loaded in NumPy arrays with one row per section, position, party and candidate,
+as in the vote tables, and each check is a grouped sum over every bulletin loaded at once.
+A counter missing from a bulletin is loaded as MISSING: the checks of a missing total are
+skipped, and a missing addend counts as zero, as in the tally.
+"""
+import time
+from itertools import chain
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from ..database import get_database_interface
+from ..logger import get_logger
+from ..models import BuSectionModel, BuPositionModel, BuPartyModel, BuCandidateVotesModel
+from ..schemas import AuditReport, AuditViolation, Content, SectionAudit
+from ..settings import audit_settings as settings
+from .vote_tables import vote_table_rows
+
+CHECKS = (
+    'party_votes',  # Candidate votes + LEGP = TOTP, per party
+    'nominal_votes',  # Candidate votes = NOMI, per position
+    'party_totals',  # Sum of TOTP = NOMI + LEGC, per position with party totals
+    'position_total',  # NOMI + LEGC + BRAN + NULO = TOTC, per position
+    'attendance',  # COMP + FALT = APTO, per section
+)
+MISSING = -1
+
+# Columns of the arrays, in the vote tables
+COLUMNS = {
+    BuSectionModel: ('bulletin_id', 'APTO', 'COMP', 'FALT'),
+    BuPositionModel: ('bulletin_id', 'CARG', 'NOMI', 'LEGC', 'BRAN', 'NULO', 'TOTC'),
+    BuPartyModel: ('bulletin_id', 'CARG', 'PART', 'LEGP', 'TOTP'),
+    BuCandidateVotesModel: ('bulletin_id', 'CARG', 'PART', 'votes'),
+}
+SECTION_INFO = ('evaluator_phone', 'TURN', 'UNFE', 'MUNI', 'ZONA', 'SECA')
+
+# Keys of a position (bulletin id, CARG) and a party (position key, PART) packed in an int64
+KEY_SPAN = 1 << 16
+
+
+def _addend(column: np.ndarray) -> np.ndarray:
+    return np.maximum(column, 0)
+
+
+def _lookup(keys: np.ndarray, wanted: np.ndarray) -> np.ndarray:
+    """
+    Row of each wanted key in keys, -1 when it is not there
+    """
+    if not len(keys):
+        return np.full(len(wanted), -1, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    index = np.minimum(np.searchsorted(ordered, wanted), len(keys) - 1)
+    return np.where(ordered[index] == wanted, order[index], -1)
+
+
+def _group_sum(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """
+    Sum of the values of each group, rows without a group (-1) left out
+    """
+    found = groups >= 0
+    # Float sums are exact below 2**53 votes
+    return np.bincount(groups[found], weights=values[found], minlength=size).astype(np.int64)
+
+
+def _violations(check: int, bulletin_id, carg, part, expected, found, applies) -> np.ndarray:
+    failed = applies & (expected != found)
+    count = int(failed.sum())
+    missing = np.full(count, MISSING, dtype=np.int64)
+    return np.column_stack((
+        bulletin_id[failed], np.full(count, check, dtype=np.int64),
+        missing if carg is None else carg[failed], missing if part is None else part[failed],
+        expected[failed], found[failed],
+    ))
+
+
+def find_violations(sections: np.ndarray, positions: np.ndarray, parties: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    Run every check over the arrays of the bulletins, laid out as in COLUMNS.
+    Returns a row per violation, ordered by bulletin: bulletin id, index in CHECKS, CARG, PART,
+    the total stored and the sum found, CARG and PART being MISSING where they do not apply.
+    """
+    position_keys = positions[:, 0] * KEY_SPAN + positions[:, 1]
+    party_positions = parties[:, 0] * KEY_SPAN + parties[:, 1]
+    candidate_positions = candidates[:, 0] * KEY_SPAN + candidates[:, 1]
+
+    nominal = _group_sum(_lookup(position_keys, candidate_positions), candidates[:, 3], len(positions))
+    party_candidates = _group_sum(
+        _lookup(party_positions * KEY_SPAN + parties[:, 2] + 1, candidate_positions * KEY_SPAN + candidates[:, 2] + 1),
+        candidates[:, 3], len(parties),
+    )
+    party_position = _lookup(position_keys, party_positions)
+    totp = parties[:, 4]
+    party_totals = _group_sum(party_position, _addend(totp), len(positions))
+    has_party_totals = _group_sum(party_position, (totp != MISSING).astype(np.int64), len(positions)) > 0
+
+    bulletin_id, carg = positions[:, 0], positions[:, 1]
+    nomi, legc, bran, nulo, totc = (positions[:, column] for column in range(2, 7))
+    apto = sections[:, 1]
+    found = np.concatenate((
+        _violations(0, parties[:, 0], parties[:, 1], parties[:, 2], totp, party_candidates + _addend(parties[:, 3]), totp != MISSING),
+        _violations(1, bulletin_id, carg, None, nomi, nominal, nomi != MISSING),
+        _violations(2, bulletin_id, carg, None, nomi + _addend(legc), party_totals, has_party_totals & (nomi != MISSING)),
+        _violations(3, bulletin_id, carg, None, totc, _addend(nomi) + _addend(legc) + _addend(bran) + _addend(nulo), totc != MISSING),
+        _violations(4, sections[:, 0], None, None, apto, _addend(sections[:, 2]) + _addend(sections[:, 3]), apto != MISSING),
+    ))
+    return found[np.lexsort((found[:, 1], found[:, 0]))]
+
+
+def group_violations(found: np.ndarray) -> Dict[int, List[AuditViolation]]:
+    """
+    Violations of find_violations by bulletin id
+    """
+    grouped = {}
+    for bulletin_id, check, carg, part, expected, total in found.tolist():
+        grouped.setdefault(bulletin_id, []).append(AuditViolation(
+            check=CHECKS[check],
+            CARG=None if carg == MISSING else carg,
+            PART=None if part == MISSING else part,
+            expected=expected,
+            found=total,
+        ))
+    return grouped
+
+
+def _array(rows: List[dict], columns: tuple) -> np.ndarray:
+    values = [[MISSING if row[column] is None else row[column] for column in columns] for row in rows]
+    return np.array(values, dtype=np.int64).reshape(-1, len(columns))
+
+
+def audit_contents(contents: List[Content]) -> List[List[AuditViolation]]:
+    """
+    Violations of each content, e.g. of the bulletins parsed by a request before they are stored
+    """
+    rows = vote_table_rows((index, '', content) for index, content in enumerate(contents))
+    grouped = group_violations(find_violations(*(_array(rows[model], columns) for model, columns in COLUMNS.items())))
+    return [grouped.get(index, []) for index in range(len(contents))]
+
+
+def _columns(model, columns: tuple) -> list:
+    table = model.__table__
+    return [func.coalesce(table.c[column], MISSING).label(column) if table.c[column].nullable else table.c[column]
+            for column in columns]
+
+
+def _select(model, columns: tuple, first_id: int, last_id: int):
+    return select(*_columns(model, columns)).where(model.__table__.c.bulletin_id.between(first_id, last_id))
+
+
+def _load(session, statement, width: int) -> np.ndarray:
+    # Straight from the result tuples, without a list of rows
+    values = np.fromiter(chain.from_iterable(session.execute(statement)), dtype=np.int64)
+    return values.reshape(-1, width)
+
+
+def audit_stored_bulletins(max_sections: Optional[int] = None, chunk_size: Optional[int] = None) -> AuditReport:
+    """
+    Audit every bulletin of the vote tables, in chunks of bulletins read by id, each loaded
+    with one query per table and checked at once
+    """
+    max_sections = settings.max_sections if max_sections is None else max_sections
+    chunk_size = chunk_size or settings.chunk_size
+    with get_logger(task="audit") as logger:
+        started = time.perf_counter()
+        report = AuditReport(checks=dict.fromkeys(CHECKS, 0))
+        interface = get_database_interface()
+        last_id = 0
+        while True:
+            with interface.get_session() as session:
+                columns = COLUMNS[BuSectionModel]
+                sections = session.execute(
+                    select(*_columns(BuSectionModel, columns), *(getattr(BuSectionModel, field) for field in SECTION_INFO))
+                    .where(BuSectionModel.bulletin_id > last_id).order_by(BuSectionModel.bulletin_id).limit(chunk_size)
+                ).all()
+                if not sections:
+                    break
+                first_id, last_id = sections[0].bulletin_id, sections[-1].bulletin_id
+                arrays = [np.array([row[:len(columns)] for row in sections], dtype=np.int64)]
+                arrays += [_load(session, _select(model, columns, first_id, last_id), len(columns))
+                           for model, columns in COLUMNS.items() if model is not BuSectionModel]
+            found = find_violations(*arrays)
+            report.sections += len(sections)
+            for check, count in zip(CHECKS, np.bincount(found[:, 1], minlength=len(CHECKS)).tolist()):
+                report.checks[check] += count
+            inconsistent = np.unique(found[:, 0])
+            report.inconsistent += len(inconsistent)
+            listed = inconsistent[:max(0, max_sections - len(report.items))]
+            if len(listed):
+                grouped = group_violations(found[np.isin(found[:, 0], listed)])
+                for section in sections:
+                    if section.bulletin_id in grouped:
+                        info = {field: getattr(section, field) for field in SECTION_INFO}
+                        report.items.append(SectionAudit(bulletin_id=section.bulletin_id, violations=grouped[section.bulletin_id], **info))
+            logger.debug('{} bulletins audited, up to bulletin {}...', report.sections, last_id)
+        report.seconds = time.perf_counter() - started
+        return report
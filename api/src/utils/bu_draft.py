@@ -0,0 +1,197 @@
+"""
+Compact structures the parser fills token by token.
+
+They mirror the public schemas with __slots__, keep the votes of a party in an array
+and are turned into the schemas once, when the bulletin is assembled, by validating
+their plain data in a single pass. Positions and parties resumed from a previous QR
+code stay schema instances unless the parser continues them, and pass through as is.
+"""
+from array import array
+from typing import Dict, Iterator
+
+from ..schemas import Candidate, Content, Details, Header, Metadata, Party, Position, SecurityData, VotingSummary
+
+
+class Record:
+    """
+    Flat section of a bulletin, one slot per field of its schema
+    """
+    __slots__ = ()
+    schema = None
+
+    def __init__(self):
+        for name, field in self.schema.model_fields.items():
+            setattr(self, name, field.get_default(call_default_factory=True))
+
+    @classmethod
+    def from_model(cls, model) -> "Record":
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, getattr(model, name))
+        return record
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _record(schema) -> type:
+    return type(f"{schema.__name__}Draft", (Record,), {"__slots__": tuple(schema.model_fields), "schema": schema})
+
+
+HeaderDraft = _record(Header)
+MetadataDraft = _record(Metadata)
+DetailsDraft = _record(Details)
+SummaryDraft = _record(VotingSummary)
+SecurityDraft = _record(SecurityData)
+
+
+class CandidatesDraft:
+    """
+    Votes of the candidates of a party: codes in order of appearance, votes in a parallel array
+    """
+    __slots__ = ("index", "votes")
+
+    def __init__(self):
+        self.index = {}  # code -> position of its votes
+        self.votes = array("i")
+
+    def __setitem__(self, code: str, votes: int):
+        # A repeated code keeps its place, as it did as a dict key
+        position = self.index.get(code)
+        if position is None:
+            self.index[code] = len(self.votes)
+            self.votes.append(votes)
+        else:
+            self.votes[position] = votes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.votes)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CandidatesDraft) and dict(self.items()) == dict(other.items())
+
+    def items(self):
+        return zip(self.index, self.votes)
+
+    def first(self) -> str:
+        for code in self.index:
+            return code
+        raise IndexError("Partido sem candidatos")
+
+    @classmethod
+    def from_model(cls, candidates: Dict[str, Candidate]) -> "CandidatesDraft":
+        draft = cls()
+        for code, candidate in candidates.items():
+            draft[code] = candidate.votes
+        return draft
+
+    def to_dict(self) -> dict:
+        return {code: {"code": code, "votes": votes} for code, votes in self.items()}
+
+
+def _to_data(item):
+    """
+    Plain data of a position draft or a party, schema instances are accepted as they are by the validation
+    """
+    if isinstance(item, PartyDraft):
+        return item.to_model()
+    return item if isinstance(item, (Party, Position)) else item.to_dict()
+
+
+class PartyDraft:
+    __slots__ = ("PART", "LEGP", "TOTP", "candidates")
+
+    def __init__(self):
+        self.PART = None
+        self.LEGP = None
+        self.TOTP = None
+        self.candidates = CandidatesDraft()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Party):
+            other = PartyDraft.from_model(other)
+        return isinstance(other, PartyDraft) and (self.PART, self.LEGP, self.TOTP, self.candidates) == (
+            other.PART, other.LEGP, other.TOTP, other.candidates
+        )
+
+    @classmethod
+    def from_model(cls, party: Party) -> "PartyDraft":
+        draft = cls()
+        draft.PART, draft.LEGP, draft.TOTP = party.PART, party.LEGP, party.TOTP
+        draft.candidates = CandidatesDraft.from_model(party.candidates)
+        return draft
+
+    def to_model(self) -> Party:
+        # Validated party by party, so the plain candidates of a single party exist at a time
+        return Party.model_validate(
+            {"PART": self.PART, "LEGP": self.LEGP, "TOTP": self.TOTP, "candidates": self.candidates.to_dict()}
+        )
+
+
+class PositionDraft:
+    __slots__ = ("CARG", "TIPO", "VERC", "summary", "party")
+
+    def __init__(self):
+        self.CARG = None
+        self.TIPO = None
+        self.VERC = None
+        self.summary = SummaryDraft()
+        self.party = []
+
+    @classmethod
+    def from_model(cls, position: Position) -> "PositionDraft":
+        # Parties are kept as schema instances, the parser turns the one it continues into a draft
+        draft = cls()
+        draft.CARG, draft.TIPO, draft.VERC = position.CARG, position.TIPO, position.VERC
+        draft.summary = SummaryDraft.from_model(position.summary)
+        draft.party = list(position.party)
+        return draft
+
+    def to_dict(self) -> dict:
+        return {
+            "CARG": self.CARG,
+            "TIPO": self.TIPO,
+            "VERC": self.VERC,
+            "summary": self.summary.to_dict(),
+            "party": [_to_data(party) for party in self.party],
+        }
+
+
+class VotingDraft:
+    __slots__ = ("IDEL", "position")
+
+    def __init__(self):
+        self.IDEL = None
+        self.position = []
+
+
+class ContentDraft:
+    __slots__ = ("metadata", "details", "voting", "security")
+
+    def __init__(self):
+        self.metadata = MetadataDraft()
+        self.details = DetailsDraft()
+        self.voting = VotingDraft()
+        self.security = SecurityDraft()
+
+    @classmethod
+    def from_model(cls, content: Content) -> "ContentDraft":
+        draft = cls.__new__(cls)
+        draft.metadata = MetadataDraft.from_model(content.metadata)
+        draft.details = DetailsDraft.from_model(content.details)
+        draft.voting = VotingDraft()
+        draft.voting.IDEL = content.voting.IDEL
+        draft.voting.position = list(content.voting.position)
+        draft.security = SecurityDraft.from_model(content.security)
+        return draft
+
+    def to_dict(self) -> dict:
+        return {
+            "metadata": self.metadata.to_dict(),
+            "details": self.details.to_dict(),
+            "voting": {"IDEL": self.voting.IDEL, "position": [_to_data(position) for position in self.voting.position]},
+            "security": self.security.to_dict(),
+        }
@@ -1,18 +1,207 @@
 from ..schemas import *
 import json
-from ..database import DatabaseInterface, get_database_interface
+from dataclasses import fields
+from time import perf_counter_ns
+from operator import attrgetter
+from typing import Callable, NamedTuple
+from .bu_draft import CandidatesDraft, ContentDraft, HeaderDraft, PartyDraft, PositionDraft
+from .parser_trace import ParserTrace
+
+
+# Processing steps are tracked as bit flags, one bit per ProcessingStatus field
+STEPS = tuple(f.name for f in fields(ProcessingStatus))
+STEP_BITS = {name: 1 << index for index, name in enumerate(STEPS)}
+INITIAL_OPEN_STEPS = sum(STEP_BITS[f.name] for f in fields(ProcessingStatus) if f.default == ProcessingStep.OPEN)
+
+
+def steps_to_mask(steps) -> int:
+    """
+    Convert a list of step names to a bitmask
+    """
+    mask = 0
+    for step in steps or ():
+        mask |= STEP_BITS[step]
+    return mask
+
+
+def mask_to_steps(mask: int) -> list:
+    """
+    Convert a bitmask to the list of step names, in ProcessingStatus order
+    """
+    return [step for step in STEPS if mask & STEP_BITS[step]]
+
+
+# Longer than any field, bounds the text buffered between the chunks fed to the parser
+MAX_TOKEN_LENGTH = 4096
+
+
+def _header_length(tokens: list) -> int:
+    length = 0
+    while length < len(tokens) and tokens[length].split(":", 1)[0] in HEADER_FIELDS:
+        length += 1
+    return length
+
+
+def _closing_length(tokens: list) -> int:
+    length = 0
+    while length < len(tokens) and tokens[-length - 1].startswith("HASH:"):
+        length += 1
+    return length
+
+
+def _format_date(value):
+    return datetime.strptime(value, '%Y%m%d').strftime('%Y-%m-%d')
+
+
+def _format_time(value):
+    return f"{value[:2]}:{value[2:4]}:{value[4:]}"
+
+
+class FieldSpec(NamedTuple):
+    group: str  # counter / section name
+    target: str  # parser attribute holding the object to set
+    parent: Callable | None  # getter from target to the object owning the field
+    attr: str
+    is_int: bool
+    fmt: Callable | None
+    required: int  # steps that must be open
+    step: int  # steps finished once parsed
+    next_step: int  # steps opened once parsed
+
+
+# Field tables: key -> (attribute path, is_int, formatter, finished steps, opened steps)
+HEADER_FIELDS = {
+    "QRBU": ("QRBU", False, lambda v: [int(k) for k in v], None, None),
+    "VRQR": ("VRQR", False, None, None, None),
+    "VRCH": ("VRCH", False, None, ["header"], ["context_setup"]),
+}
+
+METADATA_FIELDS = {
+    "ORIG": ("metadata.ORIG", False, None, None, None),
+    "ORLC": ("metadata.ORLC", False, None, None, None),
+    "PROC": ("metadata.PROC", True, None, None, None),
+    "DTPL": ("metadata.DTPL", False, _format_date, None, None),
+    "PLEI": ("metadata.PLEI", True, None, None, None),
+    "TURN": ("metadata.TURN", True, None, None, None),
+    "FASE": ("metadata.FASE", False, None, None, None),
+    "UNFE": ("metadata.UNFE", False, None, None, None),
+    "MUNI": ("metadata.MUNI", True, None, None, None),
+    "ZONA": ("metadata.ZONA", True, None, None, None),
+    "SECA": ("metadata.SECA", True, None, None, None),
+    "AGRE": ("metadata.AGRE", False, lambda v: [int(k) for k in v.split(".")], None, None),
+    "IDUE": ("metadata.IDUE", True, None, None, None),
+    "IDCA": ("metadata.IDCA", True, None, None, None),
+    "HIQT": ("metadata.HIQT", True, None, None, None),
+    "HICA": ("metadata.HICA", False, None, None, None),
+    "VERS": ("metadata.VERS", False, None, ["metadata"], ["details"]),
+}
+
+DETAILS_FIELDS = {
+    "LOCA": ("details.LOCA", True, None, None, None),
+    "APTO": ("details.APTO", True, None, None, None),
+    "APTS": ("details.APTS", True, None, None, None),
+    "APTT": ("details.APTT", True, None, None, None),
+    "COMP": ("details.COMP", True, None, None, None),
+    "FALT": ("details.FALT", True, None, None, None),
+    "HBBM": ("details.HBBM", True, None, None, None),
+    "HBBG": ("details.HBBG", True, None, None, None),
+    "HBSB": ("details.HBSB", True, None, None, None),
+    "DTAB": ("details.DTAB", False, _format_date, None, None),
+    "HRAB": ("details.HRAB", False, _format_time, None, None),
+    "DTFC": ("details.DTFC", False, _format_date, None, None),
+    "HRFC": ("details.HRFC", False, _format_time, ["details"], ["voting"]),
+}
+
+VOTING_FIELDS = {
+    "IDEL": ("voting.IDEL", True, None, None, ["position"]),
+}
+
+POSITION_FIELDS = {
+    "CARG": ("CARG", True, None, None, None),
+    "TIPO": ("TIPO", True, None, None, None),
+    "VERC": ("VERC", True, None, None, ["party"]),
+}
+
+PARTY_FIELDS = {
+    "PART": ("PART", True, None, None, ["candidate"]),
+}
+
+POST_PARTY_FIELDS = {
+    "LEGP": ("LEGP", True, None, None, None),
+    "TOTP": ("TOTP", True, None, None, None),
+}
+
+SUMMARY_FIELDS = {
+    "APTA": ("summary.APTA", True, None, None, None),
+    "APTS": ("summary.APTS", True, None, None, None),
+    "APTT": ("summary.APTT", True, None, None, None),
+    "NOMI": ("summary.NOMI", True, None, None, None),
+    "BRAN": ("summary.BRAN", True, None, None, None),
+    "NULO": ("summary.NULO", True, None, None, None),
+    "LEGC": ("summary.LEGC", True, None, None, None),
+    "TOTC": ("summary.TOTC", True, None, ["summary"], None),
+}
+
+SECURITY_FIELDS = {
+    "HASH": ("security.HASH", False, None, None, None),
+    "ASSI": ("security.ASSI", False, None, ["content", "position", "party", "security"], None),
+}
+
+CANDIDATE_REQUIRED_STEPS = steps_to_mask(["content", "voting", "position", "party", "candidate", "security"])
+
+
+def _compile_fields(group: str, target: str, required_steps: list, field_mapping: dict) -> dict:
+    """
+    Compile a field table into FieldSpec entries, resolving paths and step masks once
+    """
+    required = steps_to_mask(required_steps)
+    compiled = {}
+    for key, (attr, is_int, fmt, step, next_step) in field_mapping.items():
+        *parents, leaf = attr.split(".")
+        compiled[key] = FieldSpec(
+            group=group,
+            target=target,
+            parent=attrgetter(".".join(parents)) if parents else None,
+            attr=leaf,
+            is_int=is_int,
+            fmt=fmt,
+            required=required,
+            step=steps_to_mask(step),
+            next_step=steps_to_mask(next_step),
+        )
+    return compiled
+
+
+# Tables in the order the state machine tries them for a token
+HEADER_TABLE = _compile_fields("header", "header", ["header", "security"], HEADER_FIELDS)
+METADATA_TABLE = _compile_fields("metadata", "content", ["content", "metadata", "security"], METADATA_FIELDS)
+DETAILS_TABLE = _compile_fields("details", "content", ["content", "details", "security"], DETAILS_FIELDS)
+VOTING_TABLE = _compile_fields("voting", "content", ["content", "voting", "security"], VOTING_FIELDS)
+POSITION_TABLE = _compile_fields("position", "current_position", ["content", "voting", "position", "security"], POSITION_FIELDS)
+PARTY_TABLE = _compile_fields("party", "current_party", ["content", "voting", "position", "party", "security"], PARTY_FIELDS)
+POST_PARTY_TABLE = _compile_fields("party", "current_party", ["content", "voting", "position", "party", "summary", "security"], POST_PARTY_FIELDS)
+SUMMARY_TABLE = _compile_fields("summary", "current_position", ["content", "voting", "position", "party", "summary", "security"], SUMMARY_FIELDS)
+SECURITY_TABLE = _compile_fields("security", "content", ["content", "security"], SECURITY_FIELDS)
+
 
 class BulletinUrnaParser:
-    def __init__(self, phone_number: str):
+    def __init__(self, phone_number: str, trace: Optional[ParserTrace] = None, last_bulletin: Optional[BoletimUrna] = None):
         self.phone_number = phone_number
-        self.parsing_processing_status = ProcessingStatus()
-        self.header = Header()
-        self.content = Content()
+        self.trace = trace
+        self.last_bulletin = last_bulletin  # Bulletin returned for the previous QR code of a "large" bulletin
+        self.open_steps_mask = INITIAL_OPEN_STEPS
+        # Filled as compact drafts, turned into the schemas once by _assemble
+        self.header = HeaderDraft()
+        self.content = ContentDraft()
         self.current_position = None
         self.current_party = None
-        self.current_candidates = {}
+        self.current_candidates = CandidatesDraft()
+        # Positions by CARG, in output order: replacing one moves it to the end, as removing and appending it did
+        self.positions = {}
+        self._index_parties(None)
         self.parsed_bulletin = None
         self.empty_party = False
+        self.next_part = None
         self.counters = {
             "header": [3, 0],
             "metadata": [17, 0],
@@ -25,380 +214,386 @@ class BulletinUrnaParser:
             "security": [0, 0]
         }
         self.counter = 0
+        self._reset_stream()
+        # Nanoseconds spent in each section of the counters, filled by _run
+        self.stage_ns = dict.fromkeys(self.counters, 0)
 
-    def _get_last_bu(self):
-        # Lazy load from mock DB or real DB
-        with get_database_interface().get_session() as session:
-            query = """
-                SELECT type, finished, last_carg, last_party, open_steps, header, content FROM boletim_urna WHERE evaluator_phone = :evaluator_phone
-            """
-            result = session.execute(query, {'evaluator_phone': self.phone_number})
-            if not result:
-                raise Exception('No bulletin found')
-            return BoletimUrna(
-                type=result[0],
-                finished=result[1],
-                last_carg=result[2],
-                last_party=result[3],
-                open_steps=result[4],
-                header=Header(**result[5]),
-                content=Content(**result[6])
-            )
-        return bulletin
-
-    def _update_status(self, step:list = None, next_step:list = None):
-        if step:
-            for s in step:
-                self.parsing_processing_status.__setattr__(s, ProcessingStep.FINISHED)
-                print(f"Finished processing step: {s}")
-        if next_step:
-            for s in next_step:
-                self.parsing_processing_status.__setattr__(s, ProcessingStep.OPEN)
-                print(f"Opened processing step: {s}")
+    def _reset_stream(self):
+        self._tail = ""  # Text after the last whitespace fed, the start of a token
+        self._pending = None  # Last token read, dispatched once the token following it is known
+
+    def _update_status(self, step: int = 0, next_step: int = 0):
+        self.open_steps_mask = (self.open_steps_mask & ~step) | next_step
 
     def _update_counter(self, step):
         self.counters[step][1] += 1
-        #if self.counters[step][1] == self.counters[step][0]:
-            #self._update_status([step], [self.counters[step][0]])
 
-    def _parse_field(self, key_value, field_mapping, steps_status: list, obj_nickname=str):
-        key = key_value[0]
+    def _is_open(self, mask: int) -> bool:
+        return self.open_steps_mask & mask == mask
+
+    def _parse_field(self, key_value, spec: FieldSpec):
         value = key_value[1:] if len(key_value) > 2 else key_value[1]
-        if key in field_mapping and self._validate_open_steps(steps_status):
-            attr, is_int, fmt, step, next_step = field_mapping[key]
-            value = int(value) if is_int else value
-            if fmt:  # If there's formatting to apply (e.g., date formatting)
-                value = fmt(value)
-    
-            obj_nicknames = {
-                "header": self.header,
-                "content": self.content,
-                "position": self.current_position,
-                "party": self.current_party,
-            }
-            obj = obj_nicknames[obj_nickname]
-            attr_parts = attr.split(".")
-            for part in attr_parts[:-1]:
-                obj = getattr(obj, part)
-            setattr(obj, attr_parts[-1], value)
-
-            self._update_status(step, next_step)
-            return True
-        return False
-    
+        if spec.is_int:
+            value = int(value)
+        if spec.fmt:  # If there's formatting to apply (e.g., date formatting)
+            value = spec.fmt(value)
+        obj = getattr(self, spec.target)
+        if spec.parent:
+            obj = spec.parent(obj)
+        setattr(obj, spec.attr, value)
+        if spec.step or spec.next_step:
+            self.open_steps_mask = (self.open_steps_mask & ~spec.step) | spec.next_step
+
     def _code_size(self):
         return "large" if self.header.QRBU[1] > 1 else "small"
-    
+
     def _is_first_code(self):
         return self.header.QRBU[0] == 1
-    
+
     def _is_finished(self):
         return (self.header.QRBU[0] == self.header.QRBU[1]) and self.content.security.ASSI is not None
-    
+
     def _check_continuity(self, last_QRBU, current_QRBU):
         if not last_QRBU[0] + 1 == current_QRBU[0]:
             raise ValueError(f"Boletim não está em sequencia, esperado {last_QRBU[0] + 1}, recebeu {current_QRBU[0]}")
-        
-    def _set_open_steps_in_context(self, open_steps:list):
-        for step in open_steps:
-            self.parsing_processing_status.__setattr__(step, ProcessingStep.OPEN)
 
     def _get_open_steps(self):
-        return [k for k, v in self.parsing_processing_status.__dict__.items() if v == ProcessingStep.OPEN]
-    
-    def _validate_open_steps(self, steps):
-        open_steps = self._get_open_steps()
-        n_ok = 0
-        for step in steps:
-            if step in open_steps:
-                n_ok += 1
-        if n_ok == len(steps):
-            return True
-        return False
-    
-    # Parsing Header Fields
-    def _parse_header(self, key_value):
-        field_mapping = {
-            "QRBU": ("QRBU", False, lambda v: [int(k) for k in v], None, None),
-            "VRQR": ("VRQR", False, None, None, None),
-            "VRCH": ("VRCH", False, None, ["header"], ["context_setup"]),
-        }
-        return self._parse_field(key_value, field_mapping, ["header", "security"], "header")
-    
-    def _set_context(self):
-        if self.parsing_processing_status.context_setup == ProcessingStep.OPEN:
+        return mask_to_steps(self.open_steps_mask)
+
+    def _get_last_bu(self) -> BoletimUrna:
+        # The handlers parse the parts of a "large" bulletin at once with execute_parts
+        if self.last_bulletin is None:
+            part = self.header.QRBU[0]
+            raise ValueError(f"Parte {part - 1} do boletim não encontrada para continuar a parte {part}")
+        return self.last_bulletin
+
+    def _set_context(self, key_value):
+        if self.open_steps_mask & STEP_BITS["context_setup"]:
             if self._code_size() == "large" and not self._is_first_code():
-                print("Attempting to continue")
                 last_bulletin = self._get_last_bu()
                 last_carg = last_bulletin.last_carg
                 last_party = last_bulletin.last_party
                 open_steps = last_bulletin.open_steps
-                print(f"Retrieved last bulletin with last_carg: {last_carg} and last_party: {last_party} and QRBU: {last_bulletin.header.QRBU} to continue parsing")
                 self._check_continuity(last_bulletin.header.QRBU, self.header.QRBU)
-                last_bulletin.header.QRBU[0] = self.header.QRBU[0] # Update last bulletin QRBU to current QRBU
-                self.header = last_bulletin.header
-                self.content = last_bulletin.content
-                self._update_status(next_step=open_steps)
+                qrbu = self.header.QRBU
+                self.header = HeaderDraft.from_model(last_bulletin.header)
+                self.header.QRBU = qrbu  # The last bulletin is left at its own QR code
+                self.content = ContentDraft.from_model(last_bulletin.content)
+                self._update_status(next_step=steps_to_mask(open_steps))
                 # current position is the object that contains CARG == last_carg
-                for p in self.content.voting.position:
-                    if p.CARG == last_carg:
-                        self.current_position = p
+                self.positions = {p.CARG: p for p in self.content.voting.position}
+                if last_carg in self.positions:
+                    # only the position and party being continued become drafts, the rest is kept as parsed
+                    self.current_position = self.positions[last_carg] = PositionDraft.from_model(self.positions[last_carg])
+                self._index_parties(self.current_position)
                 # current party if it is not None is the last_party or where PART == last_party
                 if last_party:
-                    for p in self.current_position.party:
+                    for slot, p in reversed(self.parties.items()):
                         if p.PART == last_party:
-                            self.current_party = p
-                    if not self.current_party:
-                        self.current_party = self.current_position.party[-1]
+                            self.current_party_slots.append(slot)
+                            break
+                    if not self.current_party_slots:
+                        self.current_party_slots.append(list(self.parties)[-1])
+                    slot = self.current_party_slots[0]
+                    self.current_party = self.parties[slot] = PartyDraft.from_model(self.parties[slot])
                     self.current_candidates = self.current_party.candidates
-                self._update_status(step=["context_setup"])
+                self._update_status(step=STEP_BITS["context_setup"])
             else:
-                print("small or first large")
-                self._update_status(step=["context_setup"], next_step=["content", "metadata"])
+                self._update_status(step=STEP_BITS["context_setup"], next_step=STEP_BITS["content"] | STEP_BITS["metadata"])
         return False
 
-    # Parsing Metadata Fields
-    def _parse_metadata(self, key_value):
-        field_mapping = {
-            "ORIG": ("metadata.ORIG", False, None, None, None),
-            "ORLC": ("metadata.ORLC", False, None, None, None),
-            "PROC": ("metadata.PROC", True, None, None, None),
-            "DTPL": ("metadata.DTPL", False, lambda v: datetime.strptime(v, '%Y%m%d').strftime('%Y-%m-%d'), None, None),
-            "PLEI": ("metadata.PLEI", True, None, None, None),
-            "TURN": ("metadata.TURN", True, None, None, None),
-            "FASE": ("metadata.FASE", False, None, None, None),
-            "UNFE": ("metadata.UNFE", False, None, None, None),
-            "MUNI": ("metadata.MUNI", True, None, None, None),
-            "ZONA": ("metadata.ZONA", True, None, None, None),
-            "SECA": ("metadata.SECA", True, None, None, None),
-            "AGRE": ("metadata.AGRE", False, lambda v: [int(k) for k in v.split(".")], None, None),
-            "IDUE": ("metadata.IDUE", True, None, None, None),
-            "IDCA": ("metadata.IDCA", True, None, None, None),
-            "HIQT": ("metadata.HIQT", True, None, None, None),
-            "HICA": ("metadata.HICA", False, None, None, None),
-            "VERS": ("metadata.VERS", False, None, ["metadata"], ["details"]),
-        }
-        return self._parse_field(key_value, field_mapping, ["content", "metadata", "security"], "content")
-
-    # Parsing Details Fields
-    def _parse_details(self, key_value):
-        field_mapping = {
-            "LOCA": ("details.LOCA", True, None, None, None),
-            "APTO": ("details.APTO", True, None, None, None),
-            "APTS": ("details.APTS", True, None, None, None),
-            "APTT": ("details.APTT", True, None, None, None),
-            "COMP": ("details.COMP", True, None, None, None),
-            "FALT": ("details.FALT", True, None, None, None),
-            "HBBM": ("details.HBBM", True, None, None, None),
-            "HBBG": ("details.HBBG", True, None, None, None),
-            "HBSB": ("details.HBSB", True, None, None, None),
-            "DTAB": ("details.DTAB", False, lambda v: datetime.strptime(v, '%Y%m%d').strftime('%Y-%m-%d'), None, None),
-            "HRAB": ("details.HRAB", False, lambda v: f"{v[:2]}:{v[2:4]}:{v[4:]}", None, None),
-            "DTFC": ("details.DTFC", False, lambda v: datetime.strptime(v, '%Y%m%d').strftime('%Y-%m-%d'), None, None),
-            "HRFC": ("details.HRFC", False, lambda v: f"{v[:2]}:{v[2:4]}:{v[4:]}", ["details"], ["voting"]),
-        }
-        return self._parse_field(key_value, field_mapping, ["content", "details", "security"], "content")
+    def _index_parties(self, position: Optional[PositionDraft]):
+        """
+        Index the parties of the position being parsed: by slot in output order, and the slots by first candidate code
+        """
+        self.parties = {}
+        self.party_keys = {}
+        self.party_slots = {}
+        self.current_party_slots = []  # Slots holding the current party object, listed before it was finished
+        self.next_slot = 0
+        for party in position.party if position else ():
+            self._list_party(party)
 
-    # Parsing Voting Fields
-    def _parse_voting(self, key_value):
-        field_mapping = {
-            "IDEL": ("voting.IDEL", True, None, None, ["position"]),
-        }
-        return self._parse_field(key_value, field_mapping, ["content", "voting", "security"], "content")
-
-    # Parsing Position Fields
-    def _parse_position(self, key_value):
-        field_mapping = {
-            "CARG": ("CARG", True, None, None, None),
-            "TIPO": ("TIPO", True, None, None, None),
-            "VERC": ("VERC", True, None, None, ["party"]),
-        }
-        if key_value[0] == "CARG":
-                self.empty_party = True if int(key_value[1]) == 11 else False
-                print(f"Empty party: {self.empty_party}")
-                if (self.current_position and self.current_position.CARG != int(key_value[1])):
-                    print("ATTENTION: New CARG found")
-                    # check if the current_position CARG exits in the content.voting.position if not append if yes delete and append
-                    if self.current_party:
-                        self.current_position.party.append(self.current_party)
-                    if not any(p.CARG == self.current_position.CARG for p in self.content.voting.position):
-                        self.content.voting.position.append(self.current_position)
-                    else:
-                        self.content.voting.position = [p for p in self.content.voting.position if p.CARG != self.current_position.CARG]
-                        self.content.voting.position.append(self.current_position)
-                self.current_position = Position()
-                self.current_party = None
-                self.current_candidates = {}
-        return self._parse_field(key_value, field_mapping, ["content", "voting", "position", "security"], "position")
-
-    # Parsing Party Fields
-    def _parse_party(self, key_value):
-        field_mapping = {
-            "PART": ("PART", True, None, None, ["candidate"]),
-        }
-        print((self.empty_party and self.parsing_processing_status.candidate == ProcessingStep.WAITING))
-        if key_value[0] == "PART" or (self.empty_party and self.parsing_processing_status.candidate != ProcessingStep.OPEN and self.parsing_processing_status.summary != ProcessingStep.OPEN and key_value[0] != "HASH"):
-            print("ATTENTION: New PART found")
-            if self.empty_party and self.parsing_processing_status.candidate != ProcessingStep.OPEN:
-                self._update_status(next_step=["candidate"])
+    def _list_party(self, party: PartyDraft) -> int:
+        slot = self.next_slot
+        self.next_slot += 1
+        key = next(iter(party.candidates), None)
+        self.parties[slot] = party
+        self.party_keys[slot] = key
+        self.party_slots.setdefault(key, {})[slot] = None
+        return slot
+
+    def _unlist_party(self, slot: int):
+        del self.parties[slot]
+        del self.party_slots[self.party_keys.pop(slot)][slot]
+
+    def _store_position(self):
+        """
+        Write back the parties of the current position and move it to the end of the positions
+        """
+        self.current_position.party = list(self.parties.values())
+        self.positions.pop(self.current_position.CARG, None)
+        self.positions[self.current_position.CARG] = self.current_position
+
+    def _open_position(self, key_value):
+        self.empty_party = True if int(key_value[1]) == 11 else False
+        if (self.current_position and self.current_position.CARG != int(key_value[1])):
+            # a position already parsed with the same CARG is replaced by the current one, at the end
+            # a party resumed from the previous QR code is listed already
+            if self.current_party and not self.current_party_slots:
+                self._list_party(self.current_party)
+            self._store_position()
+        self.current_position = PositionDraft()
+        self.current_party = None
+        self.current_candidates = CandidatesDraft()
+        self._index_parties(self.current_position)
+        return False
+
+    def _open_party(self, key_value):
+        candidate_open = self.open_steps_mask & STEP_BITS["candidate"]
+        if key_value[0] == "PART" or (self.empty_party and not candidate_open and not self.open_steps_mask & STEP_BITS["summary"] and key_value[0] != "HASH"):
+            if self.empty_party and not candidate_open:
+                self._update_status(next_step=STEP_BITS["candidate"])
             if self.current_party:
-                current_party_first_candidate = list(self.current_party.candidates.keys())[0]
-                party_to_delete = None
-                for party in self.current_position.party:
-                    first_candidate = list(party.candidates.keys())[0]
-                    print(f"Current party first candidate: {current_party_first_candidate}, First candidate: {first_candidate}")
-                    if current_party_first_candidate == first_candidate:
-                        print("ATTENTION: same party found")
-                        party_to_delete = party
-                if party_to_delete:
-                    print("Deleting party")
-                    self.current_position.party = [p for p in self.current_position.party if p != party_to_delete]
-                self.current_position.party.append(self.current_party)
-            print("Creating party")
-            self.current_party = Party()
-            self.current_candidates = {}
-        return self._parse_field(key_value, field_mapping, ["content", "voting", "position", "party", "security"], "party")
-
-    def _is_candidate(self, key_value):
-        try:
-            int(key_value[0])
-            return True
-        except:
-            return False
+                # the current party may be listed already, its candidates grew since then
+                for slot in self.current_party_slots:
+                    self._unlist_party(slot)
+                    self.parties[slot] = self.current_party
+                    self.party_keys[slot] = key = next(iter(self.current_party.candidates), None)
+                    self.party_slots.setdefault(key, {})[slot] = None
+                current_party_first_candidate = self.current_party.candidates.first()
+                if self.party_slots.get(None):
+                    raise IndexError("Partido sem candidatos")
+                # a party listed with the same first candidate is replaced by the current one, at the end
+                slots = self.party_slots.get(current_party_first_candidate)
+                if slots:
+                    party_to_delete = self.parties[next(reversed(slots))]
+                    for slot in [slot for slot in slots if self.parties[slot] == party_to_delete]:
+                        self._unlist_party(slot)
+                self._list_party(self.current_party)
+            self.current_party = PartyDraft()
+            self.current_candidates = CandidatesDraft()
+            self.current_party_slots = []
+        return False
 
     def _verify_next_candidate_exists(self):
-        return self.next_part and self._is_candidate(self.next_part.split(":"))
+        return self.next_part and self.next_part.split(":", 1)[0].isdigit()
 
-    # Parsing Candidate Fields
     def _parse_candidate(self, key_value):
-        if self._is_candidate(key_value) and self._validate_open_steps(["content", "voting", "position", "party", "candidate", "security"]):
-            self.current_candidates[key_value[0]] = Candidate(code=key_value[0], votes=int(key_value[1]))
+        if self._is_open(CANDIDATE_REQUIRED_STEPS):
+            self.current_candidates[key_value[0]] = int(key_value[1])
             if not self._verify_next_candidate_exists():
-                self._update_status(step=["candidate"], next_step=["summary"])
+                self._update_status(step=STEP_BITS["candidate"], next_step=STEP_BITS["summary"])
                 self.current_party.candidates = self.current_candidates
-                self.current_candidates = {}
+                self.current_candidates = CandidatesDraft()
             return True
         return False
-    
-    # Parsing POST Party Fields
-    def _parse_post_party(self, key_value):
-        field_mapping = {
-            "LEGP": ("LEGP", True, None, None, None),
-            "TOTP": ("TOTP", True, None, None, None),
-        }
-        return self._parse_field(key_value, field_mapping, ["content", "voting", "position", "party", "summary", "security"], "party")
-
-    # Parsing Summary Fields
-    def _parse_summary(self, key_value):
-        field_mapping = {
-            "APTA": ("summary.APTA", True, None, None, None),
-            "APTS": ("summary.APTS", True, None, None, None),
-            "APTT": ("summary.APTT", True, None, None, None),
-            "NOMI": ("summary.NOMI", True, None, None, None),
-            "BRAN": ("summary.BRAN", True, None, None, None),
-            "NULO": ("summary.NULO", True, None, None, None),
-            "LEGC": ("summary.LEGC", True, None, None, None),
-            "TOTC": ("summary.TOTC", True, None, ["summary"], None),
-        }
-        return self._parse_field(key_value, field_mapping, ["content", "voting", "position", "party", "summary", "security"], "position")
 
-    # Parsing Security Fields
-    def _parse_security(self, key_value):
-        field_mapping = {
-            "HASH": ("security.HASH", False, None, None, None),
-            "ASSI": ("security.ASSI", False, None, ["content", "position", "party", "security"], None),
-        }
-        if key_value[0] == "HASH":
-            if self.current_party:
-                self.current_position.party.append(self.current_party)
-            if self.current_position:
-                if any(p.CARG == self.current_position.CARG for p in self.content.voting.position):
-                    self.content.voting.position = [p for p in self.content.voting.position if p.CARG != self.current_position.CARG]
-                self.content.voting.position.append(self.current_position)
-            if self.next_part == None: 
-                self._update_status(next_step=["candidate"])
-        return self._parse_field(key_value, field_mapping, ["content", "security"], "content")
+    def _close_position(self, key_value):
+        if self.current_party and not self.current_party_slots:
+            self.current_party_slots.append(self._list_party(self.current_party))
+        if self.current_position:
+            self._store_position()
+        if self.next_part == None:
+            self._update_status(next_step=STEP_BITS["candidate"])
+        return False
 
-    # Main execute function
-    def execute(self, bu_string: str) -> BoletimUrna:
-        parts = re.split(r'\s+', bu_string)
-        print(f"Initiating parsing of bulletin")
-        print(f"Opened processing step: header")
-        print(f"Processing steps with OPEN status on start: {self._get_open_steps()}")
-        for part in parts:
-            print(f"Counter: {self.counters}")
-            key_value = part.split(":")
-            print(f"Processing key_value: {key_value}")
-
-            self.next_part = parts[self.counter + 1] if self.counter + 1 < len(parts) else None
-            self.counter += 1
-
-            # Parse in order and skip if handled
-            if self._parse_header(key_value):
-                print(f"executed header")
-                self._update_counter("header")
-                continue
-
-            elif self._set_context():
-                pass
-
-            elif self._parse_metadata(key_value):
-                print(f"executed metadata")
-                self._update_counter("metadata")
-                continue
-
-            elif self._parse_details(key_value):
-                print(f"executed details")
-                self._update_counter("details")
-                continue
-
-            elif self._parse_voting(key_value):
-                print(f"executed voting")
-                self._update_counter("voting")
-                continue
-
-            elif self._parse_position(key_value):
-                print(f"executed position")
-                self._update_counter("position")
-                continue
-
-            elif self._parse_party(key_value):
-                print(f"executed party")
-                self._update_counter("party")
-                continue
-
-            elif self._parse_candidate(key_value):
-                print(f"executed candidate")
-                self._update_counter("candidate")
-                continue
-
-            elif self._parse_post_party(key_value):
-                self._update_counter("party")
-                continue
-
-            elif self._parse_summary(key_value):
-                self._update_counter("summary")
-                continue
-
-            elif self._parse_security(key_value):
-                self._update_counter("security")
-                continue
-        
-        print("FINISHED PARSING")
-        print(f"Processing steps with OPEN status on start: {self._get_open_steps()}")
-        
-        # At the end, assemble the bulletin
-        self.parsed_bulletin = BoletimUrna(
+    def _dispatch(self, key_value) -> Optional[str]:
+        """
+        Walk the stages registered for the token key, the first one that accepts the token wins
+        """
+        key = key_value[0]
+        route = ROUTES.get(key)
+        if route is None:
+            route = CANDIDATE_ROUTE if key.isdigit() else UNKNOWN_ROUTE
+        for stage in route:
+            if stage.__class__ is FieldSpec:
+                if self.open_steps_mask & stage.required == stage.required:
+                    self._parse_field(key_value, stage)
+                    section = stage.group
+                    break
+            elif stage(self, key_value):
+                section = "candidate"
+                break
+        else:
+            return None
+        self._update_counter(section)
+        return section
+
+    def _run(self, parts: list, lookahead: Optional[str] = None):
+        """
+        Dispatch the tokens, lookahead being the token following the last one when it was held back
+        """
+        trace = self.trace
+        # The clock is read when the section changes, not per token: the time between the
+        # tokens opening two consecutive sections goes to the first one
+        stage, since = None, perf_counter_ns()
+        try:
+            last = len(parts) - 1
+            for index, part in enumerate(parts):
+                key_value = part.split(":")
+                if len(key_value) < 2:
+                    if trace is not None:
+                        trace.error = f"Campo inválido no boletim: {part}"
+                    raise ValueError(f"Campo inválido no boletim: {part}")
+
+                self.next_part = parts[index + 1] if index < last else lookahead
+                self.counter += 1
+
+                section = self._dispatch(key_value) if trace is None else self._dispatch_traced(key_value, trace)
+                if section != stage and section is not None:
+                    now = perf_counter_ns()
+                    if stage is not None:
+                        self.stage_ns[stage] += now - since
+                    stage, since = section, now
+        finally:
+            if stage is not None:
+                self.stage_ns[stage] += perf_counter_ns() - since
+
+    def _dispatch_traced(self, key_value: list, trace: ParserTrace) -> Optional[str]:
+        before, started = self.open_steps_mask, perf_counter_ns()
+        section = None
+        try:
+            section = self._dispatch(key_value)
+            return section
+        except Exception as e:
+            trace.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            after = self.open_steps_mask
+            trace.record(
+                self.counter,
+                key_value[0],
+                section,
+                mask_to_steps(after & ~before),
+                mask_to_steps(before & ~after),
+                perf_counter_ns() - started,
+            )
+
+    def stage_timings(self) -> dict:
+        """
+        Seconds spent and tokens read in each section, for the metrics
+        """
+        return {stage: (self.stage_ns[stage] / 1e9, self.counters[stage][1]) for stage in self.counters}
+
+    def _assemble(self) -> BoletimUrna:
+        if self.current_position:
+            self.current_position.party = list(self.parties.values())
+        self.content.voting.position = list(self.positions.values())
+        # A single validation pass over plain data, instead of a model per candidate
+        self.parsed_bulletin = BoletimUrna.model_validate(dict(
             type=self._code_size(),
             finished=self._is_finished(),
             last_carg=self.current_position.CARG,
             last_party=self.current_party.PART if self.current_party else None,
             open_steps=self._get_open_steps(),
-            header=self.header,
-            content=self.content
-        )
+            header=self.header.to_dict(),
+            content=self.content.to_dict()
+        ))
         return self.parsed_bulletin
 
+    def _stream(self, tokens: list):
+        """
+        Dispatch the tokens read, holding the last one back until the token following it is known
+        """
+        if not tokens:
+            return
+        if self._pending is not None:
+            tokens = [self._pending] + tokens
+        self._pending = tokens.pop()
+        self._run(tokens, lookahead=self._pending)
+
+    def feed(self, chunk: str):
+        """
+        Parse the next chunk of a QR code payload, as it arrives. Tokens are dispatched as soon
+        as the token following them is read, and only the token being read is kept as text.
+        """
+        text = self._tail + chunk
+        tokens = text.split()
+        self._tail = tokens.pop() if tokens and not text[-1].isspace() else ""
+        if len(self._tail) > MAX_TOKEN_LENGTH:
+            raise ValueError(f"Campo do boletim excede {MAX_TOKEN_LENGTH} caracteres: {self._tail[:32]}...")
+        self._stream(tokens)
+
+    def close(self) -> BoletimUrna:
+        """
+        Parse the end of the QR code payload fed
+        """
+        self._stream([self._tail] if self._tail else [])
+        pending = self._pending
+        self._reset_stream()
+        self._run([pending] if pending else [])
+        return self._assemble()
+
+    # Main execute function
+    def execute(self, bu_string: str) -> BoletimUrna:
+        """
+        Parse a QR code, fed whole. The following QR codes of a "large" bulletin continue from
+        the bulletin returned for the previous one, handed over as last_bulletin.
+        """
+        self.feed(bu_string)
+        return self.close()
+
+    def execute_parts(self, bu_strings: list) -> BoletimUrna:
+        """
+        Parse every QR code of a "large" bulletin, ordered by QRBU index, as a single token stream.
+        The header of the following parts and the HASH closing each part but the last are skipped.
+        """
+        last = len(bu_strings) - 1
+        for index, bu_string in enumerate(bu_strings):
+            tokens = bu_string.split()
+            if index:
+                tokens = tokens[_header_length(tokens):]
+            if index < last:
+                tokens = tokens[:len(tokens) - _closing_length(tokens)]
+            self._stream(tokens)
+        pending, self._pending = self._pending, None
+        self._run([pending] if pending else [])
+        # Every part was consumed, the bulletin now stands at its last QR code
+        self.header.QRBU = [self.header.QRBU[1], self.header.QRBU[1]]
+        return self._assemble()
+
     def export_json(self, name: str):
         with open(name, 'w') as f:
-            json.dump(self.parsed_bulletin.dict(), f, indent=4)
\ No newline at end of file
+            json.dump(self.parsed_bulletin.dict(), f, indent=4)
+
+
+def _compile_route(key: str) -> tuple:
+    """
+    Build the ordered stages a token key goes through: field specs and the hooks that open or close sections
+    """
+    route = []
+    for table in (HEADER_TABLE,):
+        if key in table:
+            route.append(table[key])
+    route.append(BulletinUrnaParser._set_context)
+    for table in (METADATA_TABLE, DETAILS_TABLE, VOTING_TABLE):
+        if key in table:
+            route.append(table[key])
+    if key == "CARG":
+        route.append(BulletinUrnaParser._open_position)
+    if key in POSITION_TABLE:
+        route.append(POSITION_TABLE[key])
+    route.append(BulletinUrnaParser._open_party)
+    if key in PARTY_TABLE:
+        route.append(PARTY_TABLE[key])
+    if key.isdigit():
+        route.append(BulletinUrnaParser._parse_candidate)
+    for table in (POST_PARTY_TABLE, SUMMARY_TABLE):
+        if key in table:
+            route.append(table[key])
+    if key == "HASH":
+        route.append(BulletinUrnaParser._close_position)
+    if key in SECURITY_TABLE:
+        route.append(SECURITY_TABLE[key])
+    return tuple(route)
+
+
+ROUTES = {
+    key: _compile_route(key)
+    for table in (HEADER_TABLE, METADATA_TABLE, DETAILS_TABLE, VOTING_TABLE, POSITION_TABLE,
+                  PARTY_TABLE, POST_PARTY_TABLE, SUMMARY_TABLE, SECURITY_TABLE)
+    for key in table
+}
+CANDIDATE_ROUTE = _compile_route("0")
+UNKNOWN_ROUTE = _compile_route("")
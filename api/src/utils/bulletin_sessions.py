@@ -0,0 +1,271 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from ..logger import get_logger
+from ..settings import session_settings as settings
+
+
+class PartStatus:
+    ACCEPTED: str = "accepted"
+    DUPLICATE: str = "duplicate"
+    RESTARTED: str = "restarted"  # Did not match the parts buffered, a new bulletin was started
+
+
+@dataclass
+class BulletinSession:
+    """
+    QR code parts of a "large" bulletin received so far, in any order
+    """
+    phone_number: str
+    total_parts: int
+    urn: Optional[int] = None  # IDUE, known once part 1 arrives
+    parts: Dict[int, str] = field(default_factory=dict)
+    hashes: Dict[int, str] = field(default_factory=dict)
+    finished: bool = False
+    updated_at: float = field(default_factory=time.monotonic)
+    following: Optional['BulletinSession'] = None  # Parts of the next bulletin, received before its part 1
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return (self.phone_number, self.total_parts)
+
+    @property
+    def received_parts(self) -> List[int]:
+        return sorted(self.hashes)
+
+    @property
+    def missing_parts(self) -> List[int]:
+        return [index for index in range(1, self.total_parts + 1) if index not in self.hashes]
+
+    @property
+    def is_complete(self) -> bool:
+        return len(self.parts) == self.total_parts
+
+    def ordered_payloads(self) -> List[str]:
+        return [self.parts[index] for index in range(1, self.total_parts + 1)]
+
+
+def read_qrbu(bu_string: str) -> Tuple[int, int]:
+    """
+    Read the QRBU (part index, total parts) of a QR code payload without parsing it
+    """
+    match = re.search(r'(?:^|\s)QRBU:(\d+):(\d+)(?:\s|$)', bu_string)
+    if not match:
+        raise ValueError('Campo QRBU não encontrado no boletim')
+    index, total_parts = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= total_parts:
+        raise ValueError(f'Campo QRBU inválido: {index}:{total_parts}')
+    return index, total_parts
+
+
+def read_urn(bu_string: str) -> Optional[int]:
+    match = re.search(r'(?:^|\s)IDUE:(\d+)(?:\s|$)', bu_string)
+    return int(match.group(1)) if match else None
+
+
+def payload_hash(bu_string: str) -> str:
+    """
+    Content hash of a QR code payload, insensitive to whitespace differences between scans
+    """
+    return sha256(' '.join(bu_string.split()).encode()).hexdigest()
+
+
+class BulletinSessionStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(BulletinSessionStore, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Bounded LRU reassembly buffer of "large" bulletins keyed by (evaluator phone, total parts)
+        """
+        if not hasattr(self, 'initialized'):
+            self.sessions = OrderedDict()
+            self.completed = OrderedDict()  # (phone, part hash) -> finished session, to acknowledge late retries
+            self.dropped = 0  # Partial bulletins left behind for another bulletin
+            self.lock = Lock()
+            self.initialized = True
+
+    def _spill_prefix(self, phone_number: str) -> str:
+        return re.sub(r'[^0-9A-Za-z]', '_', phone_number) + '__'
+
+    def _spill_path(self, phone_number: str, total_parts: int) -> str:
+        return os.path.join(settings.spill_dir, f'{self._spill_prefix(phone_number)}{total_parts}.json')
+
+    def _dump(self, session: BulletinSession) -> dict:
+        age = time.monotonic() - session.updated_at
+        return {'phone_number': session.phone_number, 'total_parts': session.total_parts, 'urn': session.urn,
+                'parts': session.parts, 'updated_at': time.time() - age,
+                'following': session.following and self._dump(session.following)}
+
+    def _restore(self, data: dict) -> BulletinSession:
+        parts = {int(index): bu_string for index, bu_string in data['parts'].items()}
+        hashes = {index: payload_hash(bu_string) for index, bu_string in parts.items()}
+        session = BulletinSession(data['phone_number'], data['total_parts'], data['urn'], parts, hashes)
+        session.updated_at = time.monotonic() - (time.time() - data['updated_at'])
+        if data['following']:
+            session.following = self._restore(data['following'])
+        return session
+
+    def _spill(self, session: BulletinSession):
+        """
+        Write the parts of an evicted session to disk so it can be resumed later
+        """
+        settings.ensure_dir()
+        path = self._spill_path(session.phone_number, session.total_parts)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._dump(session), f)
+        os.replace(path + '.tmp', path)
+
+    def _read_spilled(self, path: str) -> BulletinSession:
+        with open(path, 'r', encoding='utf-8') as f:
+            return self._restore(json.load(f))
+
+    def _load_spilled(self, phone_number: str, total_parts: int) -> Optional[BulletinSession]:
+        path = self._spill_path(phone_number, total_parts)
+        if not os.path.exists(path):
+            return None
+        session = self._read_spilled(path)
+        os.remove(path)
+        return session
+
+    def _discard_spilled(self, session: BulletinSession):
+        path = self._spill_path(session.phone_number, session.total_parts)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _pop_expired(self) -> List[BulletinSession]:
+        expired, deadline = [], time.monotonic() - settings.ttl_seconds
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.updated_at > deadline:
+                break
+            expired.append(self.sessions.popitem(last=False)[1])
+        return expired
+
+    def _drop(self, session: BulletinSession, reason: str):
+        """
+        Count and log the parts of a partial bulletin left behind
+        """
+        self.dropped += 1
+        with get_logger(task="sessions") as logger:
+            logger.warning('Partial bulletin of {} parts of {} dropped ({}), parts received: {}.',
+                           session.total_parts, session.phone_number, reason, session.received_parts)
+
+    def add_part(self, phone_number: str, bu_string: str) -> Tuple[BulletinSession, str]:
+        """
+        Buffer a QR code part, dropping exact duplicates by content hash.
+        Parts are never overwritten: a part 1 of another bulletin (IDUE) starts a new session, and a
+        part that does not match the session of a known part 1 is buffered for the next bulletin.
+        Returns the session that took the part.
+        """
+        index, total_parts = read_qrbu(bu_string)
+        digest = payload_hash(bu_string)
+        with self.lock:
+            finished = self.completed.get((phone_number, digest))
+            if finished is not None:
+                return finished, PartStatus.DUPLICATE
+
+            key = (phone_number, total_parts)
+            session = self.sessions.pop(key, None) or self._load_spilled(phone_number, total_parts) \
+                or BulletinSession(phone_number, total_parts)
+            current, target, status = session, session, PartStatus.ACCEPTED
+            following = session.following
+            if session.hashes.get(index) == digest:
+                status = PartStatus.DUPLICATE
+            elif following is not None and following.hashes.get(index) == digest:
+                target, status = following, PartStatus.DUPLICATE
+            elif index == 1:
+                if 1 in session.hashes:
+                    self._drop(session, 'part 1 of another bulletin received')
+                    current = target = following or BulletinSession(phone_number, total_parts)
+                    status = PartStatus.RESTARTED
+            elif 1 in session.hashes and (following is not None or index in session.hashes):
+                if following is None or index in following.hashes:
+                    if following is not None:
+                        self._drop(following, f'another part {index} received')
+                        status = PartStatus.RESTARTED
+                    session.following = following = BulletinSession(phone_number, total_parts)
+                target = following
+            elif index in session.hashes:
+                self._drop(session, f'another part {index} received')
+                current = target = BulletinSession(phone_number, total_parts)
+                status = PartStatus.RESTARTED
+
+            if status != PartStatus.DUPLICATE:
+                target.parts[index] = bu_string
+                target.hashes[index] = digest
+                if index == 1:
+                    target.urn = read_urn(bu_string)
+            current.updated_at = target.updated_at = time.monotonic()
+            self.sessions[key] = current
+            evicted = self._pop_expired()
+            while len(self.sessions) > settings.max_entries:
+                evicted.append(self.sessions.popitem(last=False)[1])
+            for item in evicted:
+                self._spill(item)
+        return target, status
+
+    def complete(self, session: BulletinSession):
+        """
+        Drop an assembled session, remembering its part hashes so retried scans are acknowledged
+        """
+        finished = BulletinSession(session.phone_number, session.total_parts, session.urn,
+                                   hashes=dict(session.hashes), finished=True)
+        with self.lock:
+            if self.sessions.get(session.key) is session:
+                del self.sessions[session.key]
+                if session.following is not None:
+                    # Inserted last, so the sessions stay ordered by update time
+                    session.following.updated_at = time.monotonic()
+                    self.sessions[session.key] = session.following
+                    self.sessions.move_to_end(session.key)
+            for digest in session.hashes.values():
+                self.completed[(session.phone_number, digest)] = finished
+            while len(self.completed) > settings.max_entries:
+                self.completed.popitem(last=False)
+            self._discard_spilled(session)
+
+    def pending(self, phone_number: str) -> List[BulletinSession]:
+        """
+        Partial bulletins of an evaluator, in memory or spilled to disk
+        """
+        with self.lock:
+            sessions = [session for session in self.sessions.values() if session.phone_number == phone_number]
+            known = {session.key for session in sessions}
+            if os.path.isdir(settings.spill_dir):
+                prefix = self._spill_prefix(phone_number)
+                for name in sorted(os.listdir(settings.spill_dir)):
+                    if name.startswith(prefix) and name.endswith('.json'):
+                        session = self._read_spilled(os.path.join(settings.spill_dir, name))
+                        if session.key not in known:
+                            sessions.append(session)
+        return sessions + [session.following for session in sessions if session.following is not None]
+
+    def drain(self) -> List[BulletinSession]:
+        """
+        Remove and spill every session, e.g. on shutdown
+        """
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+            for session in sessions:
+                self._spill(session)
+        return sessions
+
+
+def get_bulletin_session_store() -> BulletinSessionStore:
+    """
+    Get the bulletin session store, specially for dependency injection
+    """
+    return BulletinSessionStore()
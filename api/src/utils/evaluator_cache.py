@@ -0,0 +1,141 @@
+import random
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy import event, inspect, select
+
+from ..database import get_database_interface
+from ..logger import get_logger
+from ..models import EvaluatorModel
+from ..schemas import EvaluatorPublic
+from ..settings import evaluator_cache_settings as settings
+
+
+class EvaluatorDirectory:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(EvaluatorDirectory, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        In-process LRU cache of evaluators by phone number, so a login does not query the database.
+        Entries expire after a TTL (with some jitter, so a warmed cache does not expire at once)
+        and are invalidated when an evaluator is updated or deleted through the ORM.
+        """
+        if not hasattr(self, 'initialized'):
+            self.lock = Lock()
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        with self.lock:
+            self.entries = OrderedDict()  # phone number -> (evaluator, expiry time), least recently used first
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.max_entries > 0
+
+    def _expiry(self, now: float) -> float:
+        return now + settings.ttl_seconds * random.uniform(0.9, 1.0)
+
+    def get(self, phone_number: str) -> Optional[EvaluatorPublic]:
+        """
+        Cached evaluator of a phone number, None on a miss
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(phone_number)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[phone_number]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(phone_number)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, evaluator: EvaluatorPublic):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries[evaluator.phone_number] = (evaluator, self._expiry(time.monotonic()))
+            self.entries.move_to_end(evaluator.phone_number)
+            while len(self.entries) > settings.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, phone_number: str):
+        with self.lock:
+            self.entries.pop(phone_number, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def warm(self) -> int:
+        """
+        Load the evaluators in bulk, in chunks by id, up to the cache size
+        """
+        if not self.enabled:
+            return 0
+        with get_logger(task="evaluator_cache") as logger:
+            last_id, loaded = 0, {}
+            with get_database_interface().get_session() as session:
+                while len(loaded) < settings.max_entries:
+                    rows = session.execute(
+                        select(EvaluatorModel.id, EvaluatorModel.phone_number)
+                        .where(EvaluatorModel.id > last_id)
+                        .order_by(EvaluatorModel.id)
+                        .limit(min(settings.warm_chunk_size, settings.max_entries - len(loaded)))
+                    ).all()
+                    if not rows:
+                        break
+                    for row in rows:
+                        loaded.setdefault(row.phone_number, EvaluatorPublic(id=row.id, phone_number=row.phone_number))
+                    last_id = rows[-1].id
+            now = time.monotonic()
+            with self.lock:
+                for phone_number, evaluator in loaded.items():
+                    self.entries[phone_number] = (evaluator, self._expiry(now))
+                while len(self.entries) > settings.max_entries:
+                    self.entries.popitem(last=False)
+            logger.info('Evaluator cache warmed with {} evaluators.', len(loaded))
+            return len(loaded)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': settings.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def get_evaluator_directory() -> EvaluatorDirectory:
+    """
+    Get the evaluator directory, specially for dependency injection
+    """
+    return EvaluatorDirectory()
+
+
+@event.listens_for(EvaluatorModel, 'after_update')
+@event.listens_for(EvaluatorModel, 'after_delete')
+def _invalidate_evaluator(mapper, connection, target):
+    # The phone number the evaluator had before the update is dropped too
+    directory = get_evaluator_directory()
+    for phone_number in inspect(target).attrs.phone_number.history.deleted or ():
+        directory.invalidate(phone_number)
+    directory.invalidate(target.phone_number)
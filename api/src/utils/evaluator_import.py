@@ -0,0 +1,148 @@
+import csv
+import json
+from datetime import datetime as dt
+from typing import Iterable, Iterator, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..database import get_database_interface
+from ..models import EvaluatorModel
+from ..schemas import EvaluatorImportError, EvaluatorImportResult, EvaluatorImportRow
+from ..settings import evaluator_import_settings as settings
+from .evaluator_cache import get_evaluator_directory
+
+FORMATS = ('csv', 'ndjson')
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+UPDATED_COLUMNS = ('section', 'zone', 'city', 'updated_at')
+
+
+def format_from_name(name: str) -> Optional[str]:
+    """
+    Import format of a file name, from its extension
+    """
+    for extension, fmt in EXTENSIONS.items():
+        if name.lower().endswith(extension):
+            return fmt
+    return None
+
+
+def read_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    (line number, record) of each row of a CSV file with a header line, or of an NDJSON file.
+    A line that cannot be read gives its error in place of the record.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        missing = set(EvaluatorImportRow.model_fields) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Colunas ausentes no CSV: {', '.join(sorted(missing))}")
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f'JSON inválido: {e}')
+    else:
+        raise ValueError(f"Formato de importação inválido: {fmt}, use {' ou '.join(FORMATS)}")
+
+
+def _validation_message(error: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(part) for part in item['loc']) or 'linha'}: {item['msg']}" for item in error.errors())
+
+
+def _upsert_statement(dialect: str):
+    insert = UPSERT_INSERTS.get(dialect)
+    if insert is None:
+        raise ValueError(f'Importação de avaliadores não suportada no banco {dialect}')
+    statement = insert(EvaluatorModel)
+    return statement.on_conflict_do_update(
+        index_elements=[EvaluatorModel.phone_number],
+        set_={column: statement.excluded[column] for column in UPDATED_COLUMNS},
+    )
+
+
+class EvaluatorImport:
+    def __init__(self, chunk_size: Optional[int] = None):
+        """
+        Validate evaluator records and upsert them by phone number, one executemany per chunk.
+        Only the current chunk and the first errors are kept, whatever the size of the file.
+        """
+        self.chunk_size = chunk_size or settings.chunk_size
+        self.interface = get_database_interface()
+        self.statement = _upsert_statement(self.interface.engine.dialect.name)
+        self.result = EvaluatorImportResult()
+        self.pending = {}  # phone number -> (line, row), a phone number repeated in a chunk keeps its last row
+        self.pending_lines = 0
+
+    def _fail(self, line: int, error: str):
+        self.result.failed += 1
+        if len(self.result.errors) < settings.max_errors:
+            self.result.errors.append(EvaluatorImportError(line=line, error=error))
+
+    def add(self, line: int, record):
+        self.result.total += 1
+        if isinstance(record, Exception):
+            self._fail(line, str(record))
+            return
+        if not isinstance(record, dict):
+            self._fail(line, 'O registro deve ser um objeto')
+            return
+        try:
+            row = EvaluatorImportRow.model_validate(record)
+        except ValidationError as e:
+            self._fail(line, _validation_message(e))
+            return
+        self.pending.pop(row.phone_number, None)
+        self.pending[row.phone_number] = (line, {**row.model_dump(), 'updated_at': dt.now()})
+        self.pending_lines += 1
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Upsert the pending rows in one transaction. When the chunk is rejected, its rows are
+        retried one by one so only the faulty ones are reported.
+        """
+        if not self.pending:
+            return
+        rows = list(self.pending.values())
+        imported = self.pending_lines
+        try:
+            with self.interface.get_session() as session:
+                session.execute(self.statement, [row for _, row in rows])
+                session.commit()
+        except SQLAlchemyError:
+            imported -= len(rows)
+            for line, row in rows:
+                try:
+                    with self.interface.get_session() as session:
+                        session.execute(self.statement, [row])
+                        session.commit()
+                    imported += 1
+                except SQLAlchemyError as e:
+                    self._fail(line, str(getattr(e, 'orig', None) or e))
+        self.result.imported += imported
+        # The upsert bypasses the ORM events, the cached entries are dropped here
+        directory = get_evaluator_directory()
+        for phone_number in self.pending:
+            directory.invalidate(phone_number)
+        self.pending = {}
+        self.pending_lines = 0
+
+
+def import_evaluators(lines: Iterable[str], fmt: str, chunk_size: Optional[int] = None) -> EvaluatorImportResult:
+    """
+    Stream the lines of a CSV or NDJSON file of evaluators into the evaluator table
+    """
+    job = EvaluatorImport(chunk_size)
+    for line, record in read_records(lines, fmt):
+        job.add(line, record)
+    job.flush()
+    return job.result
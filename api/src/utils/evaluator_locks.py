@@ -0,0 +1,252 @@
+"""
+Per-evaluator ordered execution of the QR code uploads.
+
+The parts of a bulletin are sent one request each, concurrently when the app retries or
+uploads a queue of scans, and a part completing a bulletin parses and stores it. The uploads
+of an evaluator run one at a time, in the order they arrive, while the uploads of different
+evaluators run in parallel.
+
+The lock table is sharded by phone number: a shard lock only guards the wait queues of its
+evaluators, and is held while queueing or handing over, never while an upload runs. The
+waiting upload is handed the ownership by the one leaving, so waiters are served first in,
+first out, and only the next one in the queue is woken. Threads (sync mode and batches) and
+event loop tasks (async mode) wait in the same queues.
+
+With several worker processes, EVALUATOR_LOCK_MODE=database also takes a PostgreSQL
+advisory lock per evaluator, held while the upload runs on a connection of the lock pool,
+apart from the pool of the writes, so an upload never waits for a second connection of the
+pool it holds one of.
+"""
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from hashlib import sha256
+from threading import Event, Lock
+from typing import Deque, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeout
+
+from ..database import get_database_interface
+from ..settings import evaluator_lock_settings as settings
+
+
+class EvaluatorBusy(Exception):
+    """
+    The previous uploads of the evaluator did not finish within EVALUATOR_LOCK_TIMEOUT_SECONDS
+    """
+    def __init__(self, retry_after: int = 1):
+        super().__init__('Envios anteriores do avaliador ainda em processamento, tente novamente')
+        self.retry_after = retry_after
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.granted = False
+        self.event = Event()
+
+    def grant(self):
+        self.event.set()
+
+
+class _TaskWaiter:
+    def __init__(self):
+        self.granted = False
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def grant(self):
+        # The owner leaving may be a thread of the threadpool
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = Lock()
+        self.queues: Dict[str, Deque] = {}  # Phone number of an owned key -> waiters, in arrival order
+
+
+def advisory_key(phone_number: str) -> int:
+    """
+    Signed 64 bits PostgreSQL advisory lock key of a phone number
+    """
+    return int.from_bytes(sha256(phone_number.encode()).digest()[:8], 'big', signed=True)
+
+
+class EvaluatorLocks:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(EvaluatorLocks, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        self.shards = [_Shard() for _ in range(settings.shards)]
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+
+    def _shard(self, phone_number: str) -> _Shard:
+        return self.shards[hash(phone_number) % len(self.shards)]
+
+    def _enqueue(self, shard: _Shard, phone_number: str, waiter_class) -> Optional[object]:
+        """
+        Own the key when free, otherwise queue a waiter and return it
+        """
+        with shard.lock:
+            self.acquired += 1
+            queue = shard.queues.get(phone_number)
+            if queue is None:
+                shard.queues[phone_number] = deque()
+                return None
+            waiter = waiter_class()
+            queue.append(waiter)
+            self.waited += 1
+            return waiter
+
+    def _abandon(self, shard: _Shard, phone_number: str, waiter) -> bool:
+        """
+        Leave the queue after a timeout or a cancellation, False when the key was handed over meanwhile
+        """
+        with shard.lock:
+            if waiter.granted:
+                return False
+            shard.queues[phone_number].remove(waiter)
+            self.timeouts += 1
+            return True
+
+    def _release(self, shard: _Shard, phone_number: str):
+        with shard.lock:
+            queue = shard.queues[phone_number]
+            if not queue:
+                del shard.queues[phone_number]
+                return
+            waiter = queue.popleft()
+            waiter.granted = True
+        waiter.grant()
+
+    @contextmanager
+    def hold(self, phone_number: str):
+        """
+        Run the block after the uploads of the evaluator that arrived before, from a thread
+        """
+        shard = self._shard(phone_number)
+        waiter = self._enqueue(shard, phone_number, _ThreadWaiter)
+        if waiter is not None and not waiter.event.wait(settings.timeout_seconds):
+            if self._abandon(shard, phone_number, waiter):
+                raise EvaluatorBusy()
+        try:
+            with self._database_lock(phone_number):
+                yield
+        finally:
+            self._release(shard, phone_number)
+
+    @asynccontextmanager
+    async def hold_async(self, phone_number: str):
+        """
+        Run the block after the uploads of the evaluator that arrived before, from the event loop
+        """
+        shard = self._shard(phone_number)
+        waiter = self._enqueue(shard, phone_number, _TaskWaiter)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), settings.timeout_seconds)
+            except asyncio.TimeoutError:
+                if self._abandon(shard, phone_number, waiter):
+                    raise EvaluatorBusy()
+            except BaseException:
+                if not self._abandon(shard, phone_number, waiter):
+                    self._release(shard, phone_number)
+                raise
+        try:
+            async with self._database_lock_async(phone_number):
+                yield
+        finally:
+            self._release(shard, phone_number)
+
+    @staticmethod
+    def _lock_statements(dialect: str) -> bool:
+        # SQLite allows a single writer and is served by a single process
+        return settings.database_locks and dialect == 'postgresql'
+
+    @contextmanager
+    def _database_lock(self, phone_number: str):
+        engine = get_database_interface().lock_engine
+        if engine is None or not self._lock_statements(engine.dialect.name):
+            yield
+            return
+        parameters = {'key': advisory_key(phone_number), 'timeout': f'{int(settings.timeout_seconds * 1000)}ms'}
+        try:
+            connection = engine.connect()
+        except PoolTimeout as e:
+            raise EvaluatorBusy() from e
+        with connection:
+            try:
+                connection.execute(text("SELECT set_config('lock_timeout', :timeout, false)"), parameters)
+                connection.execute(text('SELECT pg_advisory_lock(:key)'), parameters)
+            except DBAPIError as e:
+                raise EvaluatorBusy() from e
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), parameters)
+                connection.commit()
+
+    @asynccontextmanager
+    async def _database_lock_async(self, phone_number: str):
+        engine = get_database_interface().async_lock_engine
+        if engine is None or not self._lock_statements(engine.dialect.name):
+            yield
+            return
+        parameters = {'key': advisory_key(phone_number), 'timeout': f'{int(settings.timeout_seconds * 1000)}ms'}
+        connection = engine.connect()
+        try:
+            await connection.start()
+        except PoolTimeout as e:
+            raise EvaluatorBusy() from e
+        try:
+            try:
+                await connection.execute(text("SELECT set_config('lock_timeout', :timeout, false)"), parameters)
+                await connection.execute(text('SELECT pg_advisory_lock(:key)'), parameters)
+            except DBAPIError as e:
+                raise EvaluatorBusy() from e
+            try:
+                yield
+            finally:
+                await connection.execute(text('SELECT pg_advisory_unlock(:key)'), parameters)
+                await connection.commit()
+        finally:
+            await connection.close()
+
+    def stats(self) -> dict:
+        held, waiting = 0, 0
+        for shard in self.shards:
+            with shard.lock:
+                held += len(shard.queues)
+                waiting += sum(len(queue) for queue in shard.queues.values())
+        return {
+            'shards': len(self.shards),
+            'mode': 'database' if settings.database_locks else 'local',
+            'held': held,
+            'waiting': waiting,
+            'acquired': self.acquired,
+            'waited': self.waited,
+            'timeouts': self.timeouts,
+        }
+
+
+def get_evaluator_locks() -> EvaluatorLocks:
+    """
+    Get the evaluator lock table, specially for dependency injection
+    """
+    return EvaluatorLocks()
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Tuple
+
+from ..settings import idempotency_settings as settings
+from .bulletin_sessions import payload_hash
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(Exception):
+    """
+    The Idempotency-Key of a submission was used before for another payload
+    """
+    def __init__(self):
+        super().__init__('Chave de idempotência já usada com outro conteúdo')
+
+
+class IdempotencyKey(NamedTuple):
+    key: str
+    fingerprint: str  # Hash of the payload submitted with the key
+    ttl_seconds: float
+    derived: bool = False  # Derived from the payload, not sent by the client
+
+
+def idempotency_key(phone_number: str, bu_string: str, header: Optional[str] = None) -> Optional[IdempotencyKey]:
+    """
+    Key of a QR code submission: the Idempotency-Key header, or the phone number and the payload
+    hash when keys are derived. Keys are scoped by phone number, so evaluators cannot collide.
+    """
+    fingerprint = payload_hash(bu_string)
+    if header:
+        if len(header) > MAX_KEY_LENGTH:
+            raise ValueError(f'Chave de idempotência maior que {MAX_KEY_LENGTH} caracteres')
+        return IdempotencyKey(f'{phone_number}:key:{header}', fingerprint, settings.ttl_seconds)
+    if settings.derive_keys:
+        return IdempotencyKey(f'{phone_number}:payload:{fingerprint}', fingerprint, settings.derived_ttl_seconds, derived=True)
+    return None
+
+
+class IdempotencyStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(IdempotencyStore, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Results of the completed submissions by idempotency key, in an LRU with a TTL per entry,
+        and the submissions in flight: a retry arriving while the first attempt runs waits for
+        its result instead of running again (single-flight). Failures are not kept, so a retry
+        after a failure runs again.
+        """
+        if not hasattr(self, 'initialized'):
+            self.lock = Lock()
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        with self.lock:
+            self.entries = OrderedDict()  # key -> (fingerprint, result, expiry time), least recently used first
+            self.in_flight = {}  # key -> (fingerprint, future)
+            self.replayed = 0
+            self.coalesced = 0
+            self.executed = 0
+            self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.max_entries > 0
+
+    def _begin(self, key: IdempotencyKey) -> Tuple[Future, bool]:
+        """
+        The future of the result of a key, and whether the caller has to run the submission
+        """
+        with self.lock:
+            entry = self.entries.get(key.key)
+            if entry is not None and entry[2] <= time.monotonic():
+                del self.entries[key.key]
+                entry = None
+            if entry is not None:
+                if entry[0] != key.fingerprint:
+                    raise IdempotencyKeyReused()
+                self.entries.move_to_end(key.key)
+                self.replayed += 1
+                future = Future()
+                future.set_result(entry[1])
+                return future, False
+            flight = self.in_flight.get(key.key)
+            if flight is not None:
+                if flight[0] != key.fingerprint:
+                    raise IdempotencyKeyReused()
+                self.coalesced += 1
+                return flight[1], False
+            future = Future()
+            self.in_flight[key.key] = (key.fingerprint, future)
+            self.executed += 1
+            return future, True
+
+    def _complete(self, key: IdempotencyKey, future: Future, result: Any, keep: bool = True):
+        with self.lock:
+            del self.in_flight[key.key]
+            if keep:
+                self.entries[key.key] = (key.fingerprint, result, time.monotonic() + key.ttl_seconds)
+                self.entries.move_to_end(key.key)
+            while len(self.entries) > settings.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        future.set_result(result)
+
+    def _fail(self, key: IdempotencyKey, future: Future, error: BaseException):
+        with self.lock:
+            del self.in_flight[key.key]
+        if not isinstance(error, Exception):  # The first attempt was cancelled, not the ones waiting for it
+            error = RuntimeError('Submissão original interrompida, tente novamente')
+        future.set_exception(error)
+
+    async def run(self, key: Optional[IdempotencyKey], call: Callable[[], Awaitable[Any]],
+                  keep: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """
+        Run a submission once per key, returning its result and whether it was replayed
+        from a previous or concurrent attempt. Raises IdempotencyKeyReused for a known key
+        submitted with another payload. A result that keep rejects is only shared with the
+        concurrent attempts, and a later one runs again.
+        """
+        if key is None or not self.enabled:
+            return await call(), False
+        future, leader = self._begin(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await call()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._complete(key, future, result, keep is None or keep(result))
+        return result, False
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_entries': settings.max_entries,
+                'in_flight': len(self.in_flight),
+                'executed': self.executed,
+                'replayed': self.replayed,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+            }
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """
+    Get the idempotency store, specially for dependency injection
+    """
+    return IdempotencyStore()
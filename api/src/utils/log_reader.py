@@ -0,0 +1,257 @@
+"""
+Reading the log files in blocks, without loading them.
+
+The live file is logs/application.log, loguru renames it on rotation to
+application.<creation time>.log, so the files sort by time by name with the live one last.
+A record starts with a "YYYY-MM-DD HH:mm:ss | " line, followed by the lines of its traceback.
+
+A rotated file gets a sparse index next to it, application.<creation time>.log.idx:
+
+    {"size": bytes indexed, "first": time, "last": time, "entries": [[offset, time], ...]}
+
+with an entry every LOG_INDEX_INTERVAL_BYTES at the start of a record. A search skips the
+files out of its time range and starts reading at the last entry before it. Files without an
+index (the live one) are bisected by seeking, records are in time order within a file.
+"""
+import json
+import os
+import re
+import sys
+from bisect import bisect_left
+from datetime import datetime
+from itertools import islice
+from threading import Thread
+from typing import Iterator, List, Optional, Tuple
+
+from ..settings import logger_settings as settings
+
+RECORD_TIME = re.compile(rb'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \| ')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+INDEX_SUFFIX = '.idx'
+
+
+def record_time(line: bytes) -> Optional[str]:
+    """
+    Time of the record a line starts, None for the lines continuing a record
+    """
+    match = RECORD_TIME.match(line)
+    return match.group(1).decode() if match else None
+
+
+def format_time(value: Optional[datetime]) -> Optional[str]:
+    """
+    A datetime as written in the logs, in local time
+    """
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.strftime(TIME_FORMAT)
+
+
+def log_files(directory: Optional[str] = None) -> List[str]:
+    """
+    Log files from the oldest to the live one
+    """
+    directory = directory or settings.log_dir
+    stem, suffix = os.path.splitext(os.path.basename(settings.current_log_file))
+    if not os.path.isdir(directory):
+        return []
+    rotated = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(f'{stem}.') and name.endswith(suffix) and name != stem + suffix
+    )
+    files = [os.path.join(directory, name) for name in rotated]
+    live = os.path.join(directory, stem + suffix)
+    return files + [live] if os.path.isfile(live) else files
+
+
+def reverse_lines(path: str, block_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Lines of a file from the last one, read backwards in blocks from the end of the file
+    """
+    block_size = block_size or settings.read_block_bytes
+    with open(path, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        if not position:
+            return
+        partial, skip_empty = b'', True  # The line being read backwards, and the end of the last line
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            file.seek(position)
+            lines = (file.read(size) + partial).split(b'\n')
+            partial = lines[0]
+            for line in reversed(lines[1:]):
+                if skip_empty and not line:
+                    skip_empty = False
+                    continue
+                skip_empty = False
+                yield line
+        yield partial
+
+
+def tail_lines(path: str, count: int, block_size: Optional[int] = None) -> List[str]:
+    """
+    The last count lines of a file, reading only the blocks that hold them
+    """
+    lines = list(islice(reverse_lines(path, block_size), count))
+    return [line.decode('utf-8', 'replace') for line in reversed(lines)]
+
+
+def build_index(path: str, interval: Optional[int] = None) -> dict:
+    """
+    Index a log file in one sequential pass and write it next to the file
+    """
+    interval = interval or settings.index_interval_bytes
+    entries, first, last, offset, next_entry = [], None, None, 0, 0
+    with open(path, 'rb') as file:
+        for line in file:
+            time = record_time(line)
+            if time is not None:
+                first = first or time
+                last = time
+                if offset >= next_entry:
+                    entries.append([offset, time])
+                    next_entry = offset + interval
+            offset += len(line)
+    index = {'size': offset, 'first': first, 'last': last, 'entries': entries}
+    temporary = f'{path}{INDEX_SUFFIX}.tmp'
+    with open(temporary, 'w') as file: # pylint: disable=unspecified-encoding
+        json.dump(index, file, separators=(',', ':'))
+    os.replace(temporary, path + INDEX_SUFFIX)
+    return index
+
+
+def _index_in_background(path: str):
+    try:
+        build_index(path)
+    except Exception as e: # pylint: disable=broad-except
+        # Logging from here would go through the handler being rotated
+        print(f'Failed to index log file {path}: {e}', file=sys.stderr)
+
+
+def index_rotated_file(path: str):
+    """
+    Called by loguru with the path of each rotated file (as its compression function),
+    the file is indexed in a thread so logging is not held meanwhile
+    """
+    Thread(target=_index_in_background, args=(path,), name='log-index', daemon=True).start()
+
+
+def load_index(path: str) -> Optional[dict]:
+    """
+    Index of a file, None when missing or when the file is smaller than what was indexed
+    """
+    try:
+        with open(path + INDEX_SUFFIX) as file: # pylint: disable=unspecified-encoding
+            index = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('size', 0) <= os.path.getsize(path) else None
+
+
+def _first_time(file) -> Optional[str]:
+    file.seek(0)
+    for line in file:
+        time = record_time(line)
+        if time is not None:
+            return time
+    return None
+
+
+def _time_range(path: str, file, index: Optional[dict]) -> Tuple[Optional[str], Optional[str]]:
+    if index is not None and index['size'] == os.path.getsize(path):
+        return index['first'], index['last']
+    first = index['first'] if index is not None else _first_time(file)
+    last = next((time for time in map(record_time, reverse_lines(path)) if time is not None), None)
+    return first, last
+
+
+def _bisect_offset(file, size: int, start: str, block_size: int) -> int:
+    """
+    Offset of a record starting before the first record at or after start, by seeking
+    """
+    low, high = 0, size
+    while high - low > block_size:
+        middle = (low + high) // 2
+        file.seek(middle)
+        file.readline()  # Rest of the line the seek fell into
+        offset, time = file.tell(), None
+        while offset < high:
+            line = file.readline()
+            time = record_time(line)
+            if time is not None:
+                break
+            offset += len(line)
+        if time is not None and time < start:
+            low = offset
+        else:
+            high = middle
+    return low
+
+
+def _start_offset(file, size: int, index: Optional[dict], start: Optional[str], block_size: int) -> int:
+    if start is None:
+        return 0
+    if index is None:
+        return _bisect_offset(file, size, start, block_size)
+    entries = index['entries']
+    position = bisect_left([time for _, time in entries], start)
+    offset = entries[position - 1][0] if position else 0
+    if index['size'] < size and position == len(entries):
+        # The start is after the indexed part, the rest of the file is bisected
+        offset = max(offset, _bisect_offset(file, size, start, block_size))
+    return offset
+
+
+def _records(file) -> Iterator[Tuple[str, bytes]]:
+    """
+    (time, record) from the current position, a record being its line and the lines continuing it
+    """
+    time, lines = None, []
+    for line in file:
+        line_time = record_time(line)
+        if line_time is None:
+            if time is not None:
+                lines.append(line)
+            continue
+        if time is not None:
+            yield time, b''.join(lines)
+        time, lines = line_time, [line]
+    if time is not None:
+        yield time, b''.join(lines)
+
+
+def search_logs(start: Optional[datetime] = None, end: Optional[datetime] = None, level: Optional[str] = None,
+                contains: Optional[str] = None, limit: Optional[int] = None, directory: Optional[str] = None) -> Iterator[str]:
+    """
+    Records in the time range with the level and the text, from the oldest, yielded as they are found
+    """
+    start, end = format_time(start), format_time(end)
+    level = f' | {level.upper()} | '.encode() if level else None  # Right after the time
+    text = contains.encode() if contains else None
+    limit = limit or settings.search_max_matches
+    block_size = settings.read_block_bytes
+    found = 0
+    for path in log_files(directory):
+        index = load_index(path)
+        with open(path, 'rb') as file:
+            first, last = _time_range(path, file, index)
+            if first is None or (start and last < start) or (end and first > end):
+                continue
+            size = os.path.getsize(path)
+            file.seek(_start_offset(file, size, index, start, block_size))
+            for time, record in _records(file):
+                if end and time > end:
+                    break
+                if start and time < start:
+                    continue
+                if level and not record.startswith(level, len(time)):
+                    continue
+                if text and text not in record:
+                    continue
+                yield record.decode('utf-8', 'replace')
+                found += 1
+                if found >= limit:
+                    return
@@ -0,0 +1,298 @@
+"""
+In-process metrics, exposed at /metrics in the Prometheus text format (version 0.0.4):
+
+    http_request_duration_seconds{method, route, status}   ASGI middleware, route templates only
+    bu_parser_stage_duration_seconds{stage}                 time of each parser stage in a bulletin
+    bu_parser_stage_tokens_total{stage}                     tokens read by each parser stage
+    db_session_acquire_duration_seconds                     transaction begin until it holds a connection
+    db_session_commit_duration_seconds                      flush and commit of a session
+    db_pool_*{engine}                                       pool checkouts, connections and usage
+
+Each process keeps its own metrics: the parser worker processes send their stage timings
+back with the bulletins, so they are recorded by the process serving the request.
+"""
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..settings import metrics_settings as settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_BEGIN_KEY = 'metrics_begin_at'
+_COMMIT_KEY = 'metrics_commit_at'
+_CHECKOUT_KEY = 'metrics_checkout_at'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self.lock:
+            return self.values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        """
+        Cumulative histogram with fixed upper bounds, the +Inf bucket is implicit
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.bounds = tuple(float(bound) for bound in buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}  # label values -> [bucket counts, sum, count]
+        self.lock = Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        with self.lock:
+            series = self.series.get(label_values)
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label_values, (buckets, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.bounds + (float('inf'),), buckets):
+                    cumulative += bucket
+                    labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(MetricsRegistry, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Metrics of this process. The instrumented engines outlive reset, as their connections do.
+        """
+        if not hasattr(self, 'initialized'):
+            self.lock = Lock()
+            self.engines = {}  # name -> [engine, connections checked out]
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        latency, parser = settings.latency_buckets, settings.parser_buckets
+        self.http_requests = Histogram('http_request_duration_seconds', 'Time to answer an HTTP request, by route template.', latency, ('method', 'route', 'status'))
+        self.parser_stages = Histogram('bu_parser_stage_duration_seconds', 'Time spent by the parser in each stage of a bulletin.', parser, ('stage',))
+        self.parser_tokens = Counter('bu_parser_stage_tokens_total', 'Tokens read by the parser in each stage.', ('stage',))
+        self.audit_violations = Counter('bu_audit_violations_total', 'Totals of the bulletins parsed that do not add up, by audit check.', ('check',))
+        self.session_acquire = Histogram('db_session_acquire_duration_seconds', 'Time from the begin of a session transaction until it holds a connection.', latency)
+        self.session_commit = Histogram('db_session_commit_duration_seconds', 'Time to flush and commit a session.', latency)
+        self.pool_checkouts = Counter('db_pool_checkouts_total', 'Connections checked out of the pool.', ('engine',))
+        self.pool_connections = Counter('db_pool_connections_total', 'New connections opened by the pool.', ('engine',))
+        self.pool_hold = Histogram('db_pool_checkout_hold_duration_seconds', 'Time a connection stays checked out of the pool.', latency, ('engine',))
+
+    @property
+    def enabled(self) -> bool:
+        return settings.enabled
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        self.http_requests.observe(seconds, method, route, str(status))
+
+    def observe_parser_stages(self, stages: Optional[Dict[str, Tuple[float, int]]]):
+        """
+        Record the (seconds, tokens) of each stage of one parsed bulletin, as given by the parser
+        """
+        if not stages or not self.enabled:
+            return
+        for stage, (seconds, tokens) in stages.items():
+            if tokens:
+                self.parser_stages.observe(seconds, stage)
+                self.parser_tokens.inc(stage, amount=tokens)
+
+    def observe_audit(self, checks: List[str]):
+        """
+        Record the checks failed by the bulletins parsed, one entry per violation
+        """
+        if not self.enabled:
+            return
+        for check in checks:
+            self.audit_violations.inc(check)
+
+    def _pool_lines(self) -> List[str]:
+        lines = []
+        gauges = (
+            ('db_pool_checked_out', 'Connections currently checked out of the pool.', lambda pool, checked_out: checked_out),
+            ('db_pool_size', 'Connections the pool keeps open, when it has a fixed size.', lambda pool, _: pool.size() if hasattr(pool, 'overflow') else None),
+            ('db_pool_overflow', 'Connections opened above the pool size, negative while fewer than the pool size are open.', lambda pool, _: pool.overflow() if hasattr(pool, 'overflow') else None),
+        )
+        with self.lock:
+            engines = [(name, engine.pool, checked_out) for name, (engine, checked_out) in sorted(self.engines.items())]
+        for name, documentation, read in gauges:
+            values = [(engine, read(pool, checked_out)) for engine, pool, checked_out in engines]
+            values = [(engine, value) for engine, value in values if value is not None]
+            if not values:
+                continue
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+            lines += [f'{name}{_format_labels(("engine",), (engine,))} {value}' for engine, value in values]
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.http_requests, self.parser_stages, self.parser_tokens, self.audit_violations, self.session_acquire,
+                       self.session_commit, self.pool_checkouts, self.pool_connections, self.pool_hold):
+            lines += metric.render()
+        lines += self._pool_lines()
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """
+    Get the metrics registry, specially for dependency injection
+    """
+    return MetricsRegistry()
+
+
+def _transaction_created(session, transaction):
+    if transaction.parent is None:
+        session.info[_BEGIN_KEY] = perf_counter()
+
+
+def _transaction_began(session, transaction, connection):
+    started = session.info.pop(_BEGIN_KEY, None)
+    if started is not None and settings.enabled:
+        get_metrics_registry().session_acquire.observe(perf_counter() - started)
+
+
+def _before_commit(session):
+    session.info[_COMMIT_KEY] = perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop(_COMMIT_KEY, None)
+    if started is not None and settings.enabled:
+        get_metrics_registry().session_commit.observe(perf_counter() - started)
+
+
+def instrument_sessions():
+    """
+    Time the connection acquisition and the commits of every session, sync or async
+    """
+    for name, listener in (('after_transaction_create', _transaction_created), ('after_begin', _transaction_began),
+                           ('before_commit', _before_commit), ('after_commit', _after_commit)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
+
+def instrument_engine(engine, name: str):
+    """
+    Count the checkouts and new connections of the pool of an engine, and time how long
+    connections are held. An async engine is instrumented through its sync_engine.
+    """
+    registry, entry = get_metrics_registry(), [engine, 0]
+    with registry.lock:
+        registry.engines[name] = entry
+
+    def count_checkout(delta: int):
+        # The entry of a replaced engine is updated too, so its connections never count for the new one
+        with registry.lock:
+            entry[1] += delta
+
+    def connect(dbapi_connection, connection_record):
+        if settings.enabled:
+            get_metrics_registry().pool_connections.inc(name)
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info[_CHECKOUT_KEY] = perf_counter()
+        count_checkout(1)
+        if settings.enabled:
+            get_metrics_registry().pool_checkouts.inc(name)
+
+    def checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop(_CHECKOUT_KEY, None) if connection_record is not None else None
+        if started is None:
+            return
+        count_checkout(-1)
+        if settings.enabled:
+            get_metrics_registry().pool_hold.observe(perf_counter() - started, name)
+
+    event.listen(engine, 'connect', connect)
+    event.listen(engine, 'checkout', checkout)
+    event.listen(engine, 'checkin', checkin)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware timing each HTTP request until its response is sent. Requests are labeled
+        with the template of the route they matched, e.g. /bulletin/{phone_number}, so the number
+        of series stays bounded; requests matching no route are labeled "unmatched".
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.enabled:
+            await self.app(scope, receive, send)
+            return
+        started, status = perf_counter(), 500
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            get_metrics_registry().observe_request(scope['method'], route, status, perf_counter() - started)
@@ -0,0 +1,115 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ..schemas import BoletimUrna
+from ..settings import app_settings as settings
+from .bu_parser import BulletinUrnaParser
+from .metrics import get_metrics_registry
+from .parser_trace import ParserTrace
+
+
+def _execute(parser: BulletinUrnaParser, bu_strings: List[str]) -> BoletimUrna:
+    if len(bu_strings) == 1:
+        return parser.execute(bu_strings[0])
+    return parser.execute_parts(bu_strings)
+
+
+def parse_bulletin(phone_number: str, bu_strings: List[str], trace: Optional[ParserTrace] = None) -> BoletimUrna:
+    """
+    Parse one bulletin from its QR code payloads, ordered by QRBU index
+    """
+    parser = BulletinUrnaParser(phone_number, trace=trace)
+    try:
+        return _execute(parser, bu_strings)
+    finally:
+        get_metrics_registry().observe_parser_stages(parser.stage_timings())
+
+
+def parse_measured(phone_number: str, bu_strings: List[str]) -> Tuple[Optional[BoletimUrna], Optional[str], dict]:
+    """
+    Parse one bulletin, returning the bulletin or the error message and the parser stage timings.
+    Module level so it can run in the worker processes, the caller records the timings.
+    """
+    parser = BulletinUrnaParser(phone_number)
+    try:
+        return _execute(parser, bu_strings), None, parser.stage_timings()
+    except Exception as e:
+        return None, str(e) or type(e).__name__, parser.stage_timings()
+
+
+def parse_payloads(phone_number: str, bu_strings: List[str]) -> Tuple[Optional[BoletimUrna], Optional[str]]:
+    """
+    Parse one bulletin from its QR code payloads, returning the bulletin or the error message.
+    Module level so it can run in the worker processes.
+    """
+    bulletin, error, stages = parse_measured(phone_number, bu_strings)
+    get_metrics_registry().observe_parser_stages(stages)
+    return bulletin, error
+
+
+class ParserPool:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ParserPool, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Process pool parsing batches of bulletins outside the request process, started on first use
+        """
+        if not hasattr(self, 'initialized'):
+            self.executor = None
+            self.lock = Lock()
+            self.initialized = True
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=settings.batch_pool_size)
+            return self.executor
+
+    def parse_many(self, phone_number: str, bulletins: List[List[str]]) -> List[Tuple[Optional[BoletimUrna], Optional[str]]]:
+        """
+        Parse several bulletins, each given by its ordered QR code payloads, keeping the input order
+        """
+        if settings.batch_pool_size <= 1 or len(bulletins) <= 1:
+            return [parse_payloads(phone_number, bu_strings) for bu_strings in bulletins]
+        executor = self._get_executor()
+        chunksize = max(1, len(bulletins) // (settings.batch_pool_size * 4))
+        results = []
+        for bulletin, error, stages in executor.map(parse_measured, [phone_number] * len(bulletins), bulletins, chunksize=chunksize):
+            get_metrics_registry().observe_parser_stages(stages)
+            results.append((bulletin, error))
+        return results
+
+    async def parse_async(self, phone_number: str, bu_strings: List[str], trace: Optional[ParserTrace] = None) -> BoletimUrna:
+        """
+        Parse one bulletin off the event loop: in the process pool, or in a worker thread
+        when traced (the trace must be filled in this process) or when the pool is disabled
+        """
+        if trace is not None or settings.batch_pool_size <= 1:
+            return await run_in_threadpool(parse_bulletin, phone_number, bu_strings, trace)
+        bulletin, error, stages = await asyncio.get_running_loop().run_in_executor(self._get_executor(), parse_measured, phone_number, bu_strings)
+        get_metrics_registry().observe_parser_stages(stages)
+        if error is not None:
+            raise ValueError(error)
+        return bulletin
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+
+def get_parser_pool() -> ParserPool:
+    """
+    Get the parser pool, specially for dependency injection
+    """
+    return ParserPool()
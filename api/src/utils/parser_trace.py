@@ -0,0 +1,82 @@
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Optional
+from uuid import uuid4
+
+from ..settings import parser_settings as settings
+
+
+class ParserTrace:
+    """
+    Structured per-token events of a single parser execution, kept in a ring buffer
+    """
+    def __init__(self, trace_id: str, max_events: int):
+        self.trace_id = trace_id
+        self.events = deque(maxlen=max_events)
+        self.dropped = 0
+        self.error = None
+
+    def record(self, index: int, field: str, section: Optional[str], opened: list, finished: list, elapsed_ns: int):
+        """
+        Record one token event
+        """
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append({
+            'index': index,
+            'field': field,
+            'section': section,
+            'opened': opened,
+            'finished': finished,
+            'elapsed_us': elapsed_ns / 1000,
+        })
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'dropped': self.dropped,
+            'error': self.error,
+            'events': list(self.events),
+        }
+
+
+class ParserTraceStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ParserTraceStore, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Keep the most recent traces, oldest ones are evicted first
+        """
+        if not hasattr(self, 'initialized'):
+            self.traces = OrderedDict()
+            self.lock = Lock()
+            self.initialized = True
+
+    def start(self) -> Optional[ParserTrace]:
+        """
+        Start a new trace, or return None when tracing is disabled
+        """
+        if not settings.trace_enabled:
+            return None
+        trace = ParserTrace(uuid4().hex, settings.trace_max_events)
+        with self.lock:
+            self.traces[trace.trace_id] = trace
+            while len(self.traces) > settings.trace_max_requests:
+                self.traces.popitem(last=False)
+        return trace
+
+    def get(self, trace_id: str) -> Optional[ParserTrace]:
+        with self.lock:
+            return self.traces.get(trace_id)
+
+
+def get_parser_trace_store() -> ParserTraceStore:
+    """
+    Get the parser trace store, specially for dependency injection
+    """
+    return ParserTraceStore()
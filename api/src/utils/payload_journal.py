@@ -0,0 +1,208 @@
+"""
+Append-only journal of the raw QR code payloads of the bulletins accepted for parsing.
+
+Each process writes its own segments, named so they sort by creation:
+
+    journal-<UTC start time>-<pid>-<index>.seg
+
+A segment starts with MAGIC and holds records, each one a little-endian (length, crc32)
+header followed by `length` bytes of JSON: {"phone_number", "received_at", "payloads"}.
+A crash can leave a torn record at the end of a segment, the reader stops there.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime as dt, timezone
+from threading import Condition, Lock
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+from ..settings import journal_settings as settings
+
+MAGIC = b'BUJRNL01'
+RECORD_HEADER = struct.Struct('<II')  # body length, crc32 of the body
+SEGMENT_SUFFIX = '.seg'
+
+
+class JournalRecord(NamedTuple):
+    phone_number: str
+    received_at: str
+    payloads: List[str]
+
+
+def encode_record(phone_number: str, payloads: Sequence[str]) -> bytes:
+    body = json.dumps({
+        'phone_number': phone_number,
+        'received_at': dt.now(timezone.utc).isoformat(),
+        'payloads': list(payloads),
+    }, ensure_ascii=False, separators=(',', ':')).encode()
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+class PayloadJournal:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(PayloadJournal, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Writer of the segments of this process, opened on the first append.
+        With JOURNAL_SYNC_INTERVAL_SECONDS at 0 an append returns once its record is on disk:
+        the requests waiting meanwhile share the next fsync (group commit). Above 0 appends
+        do not wait and the file is synced at most once per interval, a crash can then lose
+        the records of the last interval.
+        """
+        if not hasattr(self, 'initialized'):
+            self.lock = Lock()
+            self.synced = Condition(self.lock)
+            self.file = None
+            self.segment_index = 0
+            self.segment_prefix = None
+            self.written = 0  # Records written to the file
+            self.durable = 0  # Records known to be on disk
+            self.syncing = False
+            self.synced_at = time.monotonic()
+            self.initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return settings.enabled
+
+    def _open_segment(self):
+        if self.segment_prefix is None:
+            settings.ensure_dir()
+            started = dt.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+            self.segment_prefix = os.path.join(settings.directory, f'journal-{started}-{os.getpid()}')
+        self.segment_index += 1
+        self.file = open(f'{self.segment_prefix}-{self.segment_index:04d}{SEGMENT_SUFFIX}', 'xb')
+        self.file.write(MAGIC)
+
+    def _close_segment(self):
+        # Called with the lock held and no fsync running
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        self.durable = self.written
+
+    def append(self, phone_number: str, payloads: Sequence[str]) -> int:
+        """
+        Append the payloads of one bulletin, returning the number of its record in this process
+        """
+        return self.append_many(phone_number, [payloads])
+
+    def append_many(self, phone_number: str, bulletins: Sequence[Sequence[str]]) -> int:
+        """
+        Append several bulletins with a single sync, returning the number of the last record
+        """
+        if not self.enabled or not bulletins:
+            return 0
+        data = b''.join(encode_record(phone_number, payloads) for payloads in bulletins)
+        with self.lock:
+            while self.syncing and self.file is not None and self.file.tell() + len(data) > settings.segment_bytes:
+                self.synced.wait()
+            if self.file is not None and self.file.tell() + len(data) > settings.segment_bytes:
+                self._close_segment()
+            if self.file is None:
+                self._open_segment()
+            self.file.write(data)
+            self.written += len(bulletins)
+            record = self.written
+        if settings.sync_interval_seconds <= 0:
+            self.sync(record)
+        elif time.monotonic() - self.synced_at >= settings.sync_interval_seconds:
+            self.sync()
+        return record
+
+    def sync(self, record: Optional[int] = None):
+        """
+        Wait until the given record (by default every record written so far) is on disk.
+        One caller runs the fsync for the records written up to then, the others wait for it.
+        """
+        with self.lock:
+            record = self.written if record is None else record
+            while self.durable < record:
+                if self.syncing:
+                    self.synced.wait()
+                    continue
+                self.syncing, target = True, self.written
+                self.file.flush()
+                descriptor = self.file.fileno()
+                self.lock.release()
+                try:
+                    os.fsync(descriptor)
+                finally:
+                    self.lock.acquire()
+                    self.syncing = False
+                    self.durable = max(self.durable, target)
+                    self.synced_at = time.monotonic()
+                    self.synced.notify_all()
+
+    def close(self):
+        with self.lock:
+            while self.syncing:
+                self.synced.wait()
+            if self.file is not None:
+                self._close_segment()
+            self.segment_prefix = None  # The segment index goes on, a new prefix may be the same
+
+
+def get_payload_journal() -> PayloadJournal:
+    """
+    Get the payload journal, specially for dependency injection
+    """
+    return PayloadJournal()
+
+
+def journal_segments(directory: Optional[str] = None) -> List[str]:
+    directory = directory or settings.directory
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+class SegmentError(ValueError):
+    pass
+
+
+def read_segment(path: str) -> Iterator[JournalRecord]:
+    """
+    Records of a segment, read through a memory map. Stops with a SegmentError at the first
+    record that is truncated or fails its checksum, after yielding the ones before it.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            if view[:len(MAGIC)] != MAGIC:
+                raise SegmentError(f'{path}: not a journal segment')
+            offset, size = len(MAGIC), len(view)
+            while offset < size:
+                if offset + RECORD_HEADER.size > size:
+                    raise SegmentError(f'{path}: truncated record at byte {offset}')
+                length, checksum = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                body = view[start:start + length]
+                if len(body) < length or zlib.crc32(body) != checksum:
+                    raise SegmentError(f'{path}: corrupted record at byte {offset}')
+                record = json.loads(body)
+                yield JournalRecord(record['phone_number'], record['received_at'], record['payloads'])
+                offset = start + length
+
+
+def journal_records(directory: Optional[str] = None, errors: Optional[List[str]] = None) -> Iterator[JournalRecord]:
+    """
+    Records of every segment in order. A segment that cannot be read to its end is reported
+    in errors, with the records before the damage still yielded.
+    """
+    for path in journal_segments(directory):
+        try:
+            yield from read_segment(path)
+        except (SegmentError, ValueError, KeyError) as e:
+            if errors is not None:
+                errors.append(str(e) if isinstance(e, SegmentError) else f'{path}: {e}')
@@ -0,0 +1,71 @@
+"""
+QR codes of a request body read as it arrives, one per line.
+
+The body is NDJSON, a {"content": ...} object or a JSON string per line, or plain text, a
+QR code payload per line. Lines are cut from the chunks of the stream and only the line being
+read is buffered, so a body of any size is read with the memory of its longest line; the
+caller stores them in groups, reading the next group once the previous one is stored.
+"""
+import json
+from typing import AsyncIterator, List, Optional, Tuple
+
+from ..schemas import BulletinQrCode
+
+FORMATS = ('ndjson', 'text')
+
+
+async def read_lines(chunks: AsyncIterator[bytes], max_length: int) -> AsyncIterator[Optional[bytes]]:
+    """
+    Non-blank lines of a byte stream, None for a line longer than max_length, which is skipped
+    """
+    buffer, overflow = b'', False
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b'\n')
+        for line in lines:
+            # The first line may end one whose start was dropped, the others arrived whole
+            if overflow or len(line) > max_length:
+                overflow = False
+                yield None
+            elif line.strip():
+                yield line
+        if len(buffer) > max_length:
+            buffer, overflow = b'', True
+    if overflow:
+        yield None
+    elif buffer.strip():
+        yield buffer
+
+
+def read_qr_code(line: bytes, fmt: str) -> BulletinQrCode:
+    if fmt == 'text':
+        return BulletinQrCode(content=line.decode('utf-8').strip())
+    try:
+        value = json.loads(line)
+    except ValueError:
+        raise ValueError(f'Linha NDJSON inválida: {line[:64].decode("utf-8", "replace")}')
+    if isinstance(value, str):
+        return BulletinQrCode(content=value)
+    return BulletinQrCode.model_validate(value)
+
+
+async def read_qr_codes(chunks: AsyncIterator[bytes], fmt: str, group_size: int,
+                        max_length: int) -> AsyncIterator[List[Tuple[Optional[BulletinQrCode], Optional[str]]]]:
+    """
+    (QR code, error) of each line, in groups of group_size lines
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Formato não suportado: {fmt}, use ndjson ou text')
+    group = []
+    async for line in read_lines(chunks, max_length):
+        if line is None:
+            group.append((None, f'Linha excede {max_length} bytes'))
+        else:
+            try:
+                group.append((read_qr_code(line, fmt), None))
+            except ValueError as e:  # pydantic's ValidationError included
+                group.append((None, str(e)))
+        if len(group) >= group_size:
+            yield group
+            group = []
+    if group:
+        yield group
@@ -0,0 +1,232 @@
+import math
+from collections import defaultdict
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+
+from ..database import get_database_interface
+from ..logger import get_logger
+from ..models import BuScanModel
+from ..schemas import BoletimUrna
+from ..settings import scan_index_settings as settings
+from .bulletin_sessions import payload_hash
+
+SECTION_FIELDS = ('PLEI', 'TURN', 'MUNI', 'ZONA', 'SECA', 'IDUE')
+MISSING_FIELD = -1  # Stored for a field missing from the metadata, so the unique index still matches it
+
+# (PLEI, TURN, MUNI, ZONA, SECA, IDUE) of a bulletin
+Section = Tuple[Optional[int], ...]
+
+
+class ScanStatus:
+    NEW: str = "new"
+    DUPLICATE: str = "duplicate"
+    CONFLICT: str = "conflict"
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        Set of sha256 hex digests that can answer "maybe" for an item never added, but never "no"
+        for an item added. The digests are uniform already, the bit positions come from two of
+        their 64 bit words by double hashing.
+        """
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: str):
+        first, second = int(digest[:16], 16), int(digest[16:32], 16) | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, digest: str):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class ScanIndex:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ScanIndex, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        In-process prefilter of the payload hashes in bu_scan: a bulletin with a part never stored
+        is told apart without a query, the others are looked up in the unique index of bu_scan.
+        Filled when the process starts and with the scans it stores, so a scan stored by another
+        process can be missed here, it is then recognized when its bulletin is stored.
+        When a filter reaches its capacity another one is added, so the error rate holds as it grows.
+        """
+        if not hasattr(self, 'initialized'):
+            self.lock = Lock()
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        with self.lock:
+            self.filters = []
+
+    @property
+    def enabled(self) -> bool:
+        return settings.capacity > 0
+
+    def _add(self, digest: str):
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            self.filters.append(BloomFilter(settings.capacity, settings.error_rate))
+        self.filters[-1].add(digest)
+
+    def add(self, digests: Iterable[str]):
+        if not self.enabled:
+            return
+        with self.lock:
+            for digest in digests:
+                self._add(digest)
+
+    def might_contain(self, digests: Sequence[str]) -> bool:
+        """
+        False when one of the digests was never stored, True when they may all have been
+        """
+        if not self.enabled:
+            return True
+        with self.lock:
+            return all(any(digest in bloom for bloom in self.filters) for digest in digests)
+
+    def warm(self) -> int:
+        """
+        Load the payload hashes of the stored scans, in chunks by id
+        """
+        if not self.enabled:
+            return 0
+        with get_logger(task="scan_index") as logger:
+            last_id, loaded = 0, 0
+            with get_database_interface().get_session() as session:
+                while True:
+                    rows = session.execute(
+                        select(BuScanModel.id, BuScanModel.payload_hash)
+                        .where(BuScanModel.id > last_id)
+                        .order_by(BuScanModel.id)
+                        .limit(settings.warm_chunk_size)
+                    ).all()
+                    if not rows:
+                        break
+                    self.add(row.payload_hash for row in rows)
+                    loaded += len(rows)
+                    last_id = rows[-1].id
+            logger.info('Scan index warmed with {} scans.', loaded)
+            return loaded
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'filters': len(self.filters),
+                'scans': sum(bloom.count for bloom in self.filters),
+                'bytes': sum(len(bloom.bits) for bloom in self.filters),
+            }
+
+
+def get_scan_index() -> ScanIndex:
+    """
+    Get the scan index, specially for dependency injection
+    """
+    return ScanIndex()
+
+
+def scan_hashes(payloads: List[str]) -> List[str]:
+    """
+    Payload hashes of the QR codes of a bulletin, in part order
+    """
+    return [payload_hash(payload) for payload in payloads]
+
+
+def bulletin_digest(digests: List[str]) -> str:
+    """
+    Digest of a bulletin from the payload hashes of its QR codes, in part order
+    """
+    return sha256(''.join(digests).encode()).hexdigest()
+
+
+def section_of(bulletin: BoletimUrna) -> Section:
+    metadata = bulletin.content.metadata
+    return tuple(MISSING_FIELD if getattr(metadata, field) is None else getattr(metadata, field) for field in SECTION_FIELDS)
+
+
+def _row_section(row) -> Section:
+    return tuple(getattr(row, field) for field in SECTION_FIELDS)
+
+
+_SCAN_COLUMNS = [getattr(BuScanModel, field) for field in SECTION_FIELDS] + [BuScanModel.part, BuScanModel.payload_hash]
+
+
+def known_scans_query(digests: Iterable[str]):
+    """
+    Stored scans with one of the payload hashes, served by the unique index
+    """
+    return select(*_SCAN_COLUMNS).where(BuScanModel.payload_hash.in_(set(digests)))
+
+
+def section_scans_query(sections: Iterable[Section]):
+    """
+    Stored scans of the sections
+    """
+    return select(*_SCAN_COLUMNS).where(tuple_(*_SCAN_COLUMNS[:len(SECTION_FIELDS)]).in_(set(sections)))
+
+
+def _scans_by_section(rows) -> Dict[Section, Dict[int, set]]:
+    scans = defaultdict(lambda: defaultdict(set))  # section -> part -> payload hashes
+    for row in rows:
+        scans[_row_section(row)][row.part].add(row.payload_hash)
+    return scans
+
+
+def stored_section(rows, digests: List[str]) -> Optional[Section]:
+    """
+    Section of which every part was already stored with this content, from the rows of known_scans_query
+    """
+    for section, parts in _scans_by_section(rows).items():
+        if all(digest in parts[part] for part, digest in enumerate(digests, 1)):
+            return tuple(None if value == MISSING_FIELD else value for value in section)
+    return None
+
+
+def classify_scans(rows, bulletins: List[BoletimUrna], hashes: List[Optional[List[str]]]) -> List[Tuple[str, List[Tuple[int, str]]]]:
+    """
+    Status of each bulletin against the stored scans of its section (rows of section_scans_query)
+    and the bulletins before it, with its (part, payload hash) not stored yet for the section.
+    Bulletins without hashes are stored as new, without scans.
+    """
+    scans = _scans_by_section(rows)
+    plans = []
+    for bulletin, digests in zip(bulletins, hashes):
+        if digests is None:
+            plans.append((ScanStatus.NEW, []))
+            continue
+        parts = scans[section_of(bulletin)]
+        new = [(part, digest) for part, digest in enumerate(digests, 1) if digest not in parts[part]]
+        if not new:
+            plans.append((ScanStatus.DUPLICATE, []))
+            continue
+        conflict = any(parts[part] for part, _ in new)
+        for part, digest in new:
+            parts[part].add(digest)
+        plans.append((ScanStatus.CONFLICT if conflict else ScanStatus.NEW, new))
+    return plans
+
+
+def scan_rows(bulletin_id: int, bulletin: BoletimUrna, total_parts: int, scans: List[Tuple[int, str]], conflict: bool) -> List[dict]:
+    section = dict(zip(SECTION_FIELDS, section_of(bulletin)))
+    return [
+        dict(bulletin_id=bulletin_id, part=part, total_parts=total_parts, payload_hash=digest, conflict=conflict, **section)
+        for part, digest in scans
+    ]
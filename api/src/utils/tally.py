@@ -0,0 +1,176 @@
+import time
+from collections import defaultdict
+from threading import RLock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+
+from ..database import get_database_interface
+from ..logger import get_logger
+from ..models import BuSectionModel, BuPositionModel, BuPartyModel, BuCandidateVotesModel
+from ..settings import tally_settings as settings
+
+SUMMARY_FIELDS = ('APTA', 'NOMI', 'LEGC', 'BRAN', 'NULO', 'TOTC')
+
+# Contribution of one bulletin: {(TURN, CARG): {counter name: {key: value}}}
+Contribution = Dict[Tuple[int, int], Dict[str, Dict]]
+
+
+def _empty_position() -> Dict[str, Dict]:
+    return {'summary': defaultdict(int), 'parties': defaultdict(int), 'legend': defaultdict(int), 'candidates': defaultdict(int)}
+
+
+def section_scopes(section) -> List[tuple]:
+    """
+    Every rollup a section counts in: whole country, state, municipality and electoral zone
+    """
+    return [('BR',), ('UF', section.UNFE), ('MUNI', section.MUNI), ('ZONA', section.UNFE, section.ZONA)]
+
+
+class TallyEngine:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(TallyEngine, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Running vote totals per (TURN, CARG) and rollup, fed by the vote tables.
+        Each voting section counts once, with its latest bulletin: a new bulletin of the
+        same section is applied as the difference to the one it replaces.
+        """
+        if not hasattr(self, 'initialized'):
+            self.lock = RLock()
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        with self.lock:
+            self.totals = defaultdict(lambda: defaultdict(_empty_position))  # scope -> (TURN, CARG) -> counters
+            self.sections = defaultdict(lambda: defaultdict(int))  # scope -> (TURN, CARG) -> counted sections
+            self.applied = {}  # section key -> (bulletin id, scopes) of the bulletin counted
+            self.watermark = 0  # Highest bulletin id read from the vote tables
+            self.gaps = {}  # Bulletin ids below the watermark not seen yet -> time they were found missing
+            self.synced_at = None
+            self.dirty = True
+
+    def notify(self):
+        """
+        Mark new bulletins as stored, so the next read catches up without waiting for the sync interval
+        """
+        self.dirty = True
+
+    def _apply(self, session, bulletin_id: int, section, contribution: Contribution):
+        key = (section.TURN, section.UNFE, section.MUNI, section.ZONA, section.SECA)
+        previous = self.applied.get(key)
+        if previous and previous[0] >= bulletin_id:
+            return  # An older (or the same) bulletin of a section already counted with a newer one
+        if previous:
+            # Replaced bulletins are rare, their contribution is read back instead of kept in memory
+            previous_id, previous_scopes = previous
+            self._add(previous_scopes, self._load(session, [(previous_id, section.TURN)])[previous_id], -1)
+        scopes = section_scopes(section)
+        self._add(scopes, contribution, 1)
+        self.applied[key] = (bulletin_id, scopes)
+
+    def _add(self, scopes: List[tuple], contribution: Contribution, sign: int):
+        for position_key, counters in contribution.items():
+            for scope in scopes:
+                totals = self.totals[scope][position_key]
+                for name, values in counters.items():
+                    target = totals[name]
+                    for field, value in values.items():
+                        target[field] += sign * value
+                self.sections[scope][position_key] += sign
+
+    def _load(self, session, bulletins: List[Tuple[int, int]]) -> Dict[int, Contribution]:
+        """
+        Contributions of (bulletin id, TURN) read from the vote tables
+        """
+        turns = dict(bulletins)
+        ids = list(turns)
+        contributions = {bulletin_id: defaultdict(_empty_position) for bulletin_id in ids}
+        for row in session.execute(select(BuPositionModel).where(BuPositionModel.bulletin_id.in_(ids))).scalars():
+            summary = contributions[row.bulletin_id][(turns[row.bulletin_id], row.CARG)]['summary']
+            for field in SUMMARY_FIELDS:
+                summary[field] += getattr(row, field) or 0
+        for row in session.execute(select(BuPartyModel).where(BuPartyModel.bulletin_id.in_(ids))).scalars():
+            counters = contributions[row.bulletin_id][(turns[row.bulletin_id], row.CARG)]
+            counters['parties'][row.PART] += row.TOTP or 0
+            counters['legend'][row.PART] += row.LEGP or 0
+        for row in session.execute(select(BuCandidateVotesModel).where(BuCandidateVotesModel.bulletin_id.in_(ids))).scalars():
+            contributions[row.bulletin_id][(turns[row.bulletin_id], row.CARG)]['candidates'][row.code] += row.votes
+        return contributions
+
+    def catch_up(self, force: bool = False) -> int:
+        """
+        Apply the bulletins written to the vote tables since the last call, by this or any other process.
+        Ids skipped by transactions still running are retried for a while, then given up.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not (force or self.dirty or self.synced_at is None or now - self.synced_at >= settings.sync_interval_seconds):
+                return 0
+            initial = self.synced_at is None  # Ids missing from the history are not waited for
+            self.dirty = False
+            self.synced_at = now
+            self.gaps = {gap: seen for gap, seen in self.gaps.items() if now - seen < settings.gap_retention_seconds}
+            applied = 0
+            with get_database_interface().get_session() as session:
+                while True:
+                    condition = BuSectionModel.bulletin_id > self.watermark
+                    if self.gaps:
+                        condition = or_(condition, BuSectionModel.bulletin_id.in_(list(self.gaps)))
+                    sections = session.execute(
+                        select(BuSectionModel).where(condition).order_by(BuSectionModel.bulletin_id).limit(settings.chunk_size)
+                    ).scalars().all()
+                    if not sections:
+                        break
+                    contributions = self._load(session, [(section.bulletin_id, section.TURN) for section in sections])
+                    for section in sections:
+                        self.gaps.pop(section.bulletin_id, None)
+                        if section.bulletin_id > self.watermark + 1 and not initial:
+                            self.gaps.update((gap, now) for gap in range(self.watermark + 1, section.bulletin_id))
+                        self.watermark = max(self.watermark, section.bulletin_id)
+                        self._apply(session, section.bulletin_id, section, contributions[section.bulletin_id])
+                        applied += 1
+                    if len(sections) < settings.chunk_size:
+                        break
+            if applied:
+                with get_logger(task="tally") as logger:
+                    logger.debug('{} bulletins applied to the tally, up to bulletin {}.', applied, self.watermark)
+            return applied
+
+    def result(self, scope: tuple, turn: int, carg: int) -> Optional[dict]:
+        """
+        Totals of a position in a rollup, straight from the running counters
+        """
+        self.catch_up()
+        with self.lock:
+            totals = self.totals.get(scope, {}).get((turn, carg))
+            sections = self.sections.get(scope, {}).get((turn, carg), 0)
+            if totals is None or not sections:
+                return None
+            return {
+                'sections': sections,
+                'summary': dict(totals['summary']),
+                'parties': {part: {'TOTP': votes, 'LEGP': totals['legend'].get(part, 0)} for part, votes in totals['parties'].items()},
+                'candidates': dict(totals['candidates']),
+            }
+
+    def positions(self, scope: tuple = ('BR',)) -> List[Tuple[int, int]]:
+        """
+        (TURN, CARG) pairs with at least one counted section in a rollup
+        """
+        self.catch_up()
+        with self.lock:
+            return sorted(key for key, count in self.sections.get(scope, {}).items() if count)
+
+
+def get_tally_engine() -> TallyEngine:
+    """
+    Get the tally engine, specially for dependency injection
+    """
+    return TallyEngine()
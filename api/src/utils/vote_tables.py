@@ -0,0 +1,137 @@
+import json
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, exists, insert, select
+
+from ..database import get_database_interface
+from ..logger import get_logger
+from ..models import BoletimUrnaModel, BuSectionModel, BuPositionModel, BuPartyModel, BuCandidateVotesModel
+from ..schemas import Content
+
+# In insertion order, parents first
+VOTE_TABLES = (BuSectionModel, BuPositionModel, BuPartyModel, BuCandidateVotesModel)
+
+
+def vote_table_rows(bulletins: Iterable[Tuple[int, str, Content]]) -> Dict[type, List[dict]]:
+    """
+    Rows of every normalized vote table for (bulletin id, evaluator phone, content) of finished bulletins
+    """
+    rows = {model: [] for model in VOTE_TABLES}
+    for bulletin_id, phone_number, content in bulletins:
+        metadata, details = content.metadata, content.details
+        rows[BuSectionModel].append(dict(
+            bulletin_id=bulletin_id,
+            evaluator_phone=phone_number,
+            PLEI=metadata.PLEI,
+            TURN=metadata.TURN,
+            UNFE=metadata.UNFE,
+            MUNI=metadata.MUNI,
+            ZONA=metadata.ZONA,
+            SECA=metadata.SECA,
+            IDUE=metadata.IDUE,
+            APTO=details.APTO,
+            COMP=details.COMP,
+            FALT=details.FALT,
+        ))
+        for position in content.voting.position:
+            if position.CARG is None:
+                continue
+            summary = position.summary
+            rows[BuPositionModel].append(dict(
+                bulletin_id=bulletin_id,
+                CARG=position.CARG,
+                TIPO=position.TIPO,
+                APTA=summary.APTA,
+                NOMI=summary.NOMI,
+                LEGC=summary.LEGC,
+                BRAN=summary.BRAN,
+                NULO=summary.NULO,
+                TOTC=summary.TOTC,
+            ))
+            for party in position.party:
+                if party.PART is not None:
+                    rows[BuPartyModel].append(dict(
+                        bulletin_id=bulletin_id, CARG=position.CARG, PART=party.PART, LEGP=party.LEGP, TOTP=party.TOTP
+                    ))
+                for code, candidate in party.candidates.items():
+                    rows[BuCandidateVotesModel].append(dict(
+                        bulletin_id=bulletin_id, CARG=position.CARG, PART=party.PART,
+                        code=candidate.code or code, votes=candidate.votes or 0
+                    ))
+    return rows
+
+
+def insert_vote_tables(session, bulletins: Iterable[Tuple[int, str, Content]]):
+    """
+    Insert the normalized rows of several bulletins, one bulk insert per table.
+    The inserts go to the tables, the ORM would split the rows in batches by their None columns.
+    """
+    for model, rows in vote_table_rows(bulletins).items():
+        if rows:
+            session.execute(insert(model.__table__), rows)
+
+
+async def insert_vote_tables_async(session, bulletins: Iterable[Tuple[int, str, Content]]):
+    """
+    Insert the normalized rows of several bulletins with an async session, one bulk insert per table
+    """
+    for model, rows in vote_table_rows(bulletins).items():
+        if rows:
+            await session.execute(insert(model.__table__), rows)
+
+
+def delete_vote_tables(session, bulletin_ids: List[int]):
+    """
+    Delete the normalized rows of several bulletins, children first
+    """
+    for model in reversed(VOTE_TABLES):
+        session.execute(delete(model).where(model.bulletin_id.in_(bulletin_ids)))
+
+
+def stored_content(value) -> Content:
+    """
+    Read back a content column, stored as a JSON encoded string inside the JSON column
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    return Content(**value)
+
+
+def backfill_vote_tables(chunk_size: int = 500, pause: float = 0.0) -> int:
+    """
+    Fill the vote tables from the finished bulletins stored before they existed.
+    Rows are read by id in chunks, each written in its own short transaction, so the
+    backfill can run while the API keeps serving and can be resumed at any time.
+    """
+    with get_logger(task="backfill") as logger:
+        interface = get_database_interface()
+        last_id, total = 0, 0
+        while True:
+            with interface.get_session() as session:
+                records = session.execute(
+                    select(BoletimUrnaModel.id, BoletimUrnaModel.evaluator_phone, BoletimUrnaModel.content)
+                    .where(
+                        BoletimUrnaModel.id > last_id,
+                        BoletimUrnaModel.finished.is_(True),
+                        ~exists().where(BuSectionModel.bulletin_id == BoletimUrnaModel.id),
+                    )
+                    .order_by(BoletimUrnaModel.id)
+                    .limit(chunk_size)
+                ).all()
+                if not records:
+                    break
+                bulletins = []
+                for record in records:
+                    try:
+                        bulletins.append((record.id, record.evaluator_phone, stored_content(record.content)))
+                    except Exception:
+                        logger.exception('Bulletin {} could not be read, skipping it', record.id)
+                insert_vote_tables(session, bulletins)
+                session.commit()
+            last_id = records[-1].id
+            total += len(bulletins)
+            logger.info('Vote tables backfilled up to bulletin {} ({} bulletins).', last_id, total)
+            if pause:
+                time.sleep(pause)
+        return total
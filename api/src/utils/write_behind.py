@@ -0,0 +1,158 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Callable, List, Optional
+
+from ..logger import get_logger
+from ..settings import write_behind_settings as settings
+
+
+class WriteQueueFull(Exception):
+    """
+    The write-behind queue holds WRITE_BEHIND_MAX_ITEMS items, the client should retry later
+    """
+    def __init__(self, retry_after: int):
+        super().__init__(f'Fila de gravação cheia, tente novamente em {retry_after}s')
+        self.retry_after = retry_after
+
+
+class WriteBehindQueue:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(WriteBehindQueue, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """
+        Bounded queue of items to persist, written by a background thread in group commits:
+        a batch is written once WRITE_BEHIND_BATCH_SIZE items are queued, or WRITE_BEHIND_FLUSH_MS
+        after its first item was queued. Each item gets a future, resolved with what the write
+        function returned for it once its batch is committed.
+        """
+        if not hasattr(self, 'initialized'):
+            self.condition = Condition()
+            self.thread = None
+            self.write = None
+            self.reset()
+            self.initialized = True
+
+    def reset(self):
+        with self.condition:
+            self.items = deque()  # (queued at, item, future)
+            self.closing = False
+            self.batches = 0
+            self.written = 0
+            self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.enabled
+
+    def start(self, write: Callable[[List], List]):
+        """
+        Run the writer thread with a function writing a list of items in one transaction and
+        returning one result per item. Does nothing while the thread is running.
+        """
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.write = write
+            self.closing = False
+            self.thread = Thread(target=self._run, name='write-behind', daemon=True)
+            self.thread.start()
+
+    def ensure_capacity(self):
+        """
+        Raise WriteQueueFull when no item can be queued now, to reject a request before working on it
+        """
+        with self.condition:
+            if len(self.items) >= settings.max_items:
+                self.rejected += 1
+                raise WriteQueueFull(settings.retry_after_seconds)
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self.condition:
+            if self.closing or self.thread is None:
+                raise RuntimeError('Write-behind queue is not running')
+            if len(self.items) >= settings.max_items:
+                self.rejected += 1
+                raise WriteQueueFull(settings.retry_after_seconds)
+            self.items.append((time.monotonic(), item, future))
+            if len(self.items) == 1 or len(self.items) >= settings.batch_size:
+                self.condition.notify_all()
+        return future
+
+    def _next_batch(self) -> Optional[list]:
+        with self.condition:
+            while not self.items and not self.closing:
+                self.condition.wait()
+            if not self.items:
+                return None
+            deadline = self.items[0][0] + settings.flush_ms / 1000
+            while len(self.items) < settings.batch_size and not self.closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return [self.items.popleft() for _ in range(min(settings.batch_size, len(self.items)))]
+
+    def _flush(self, batch: list):
+        try:
+            results = self.write([item for _, item, _ in batch])
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # One faulty item must not fail the others, they are written one by one
+            with get_logger(task="write_behind") as logger:
+                logger.warning('Group commit of {} items failed, writing them one by one: {}', len(batch), e)
+            for entry in batch:
+                self._flush([entry])
+            return
+        with self.condition:
+            self.batches += 1
+            self.written += len(batch)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def close(self):
+        """
+        Write the queued items and stop the writer thread
+        """
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        with self.condition:
+            self.thread = None
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'queued': len(self.items),
+                'max_items': settings.max_items,
+                'batches': self.batches,
+                'written': self.written,
+                'rejected': self.rejected,
+                'items_per_batch': self.written / self.batches if self.batches else 0.0,
+            }
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """
+    Get the write-behind queue, specially for dependency injection
+    """
+    return WriteBehindQueue()
@@ -0,0 +1,30 @@
+"""evaluator phone indexes
+
+Revision ID: 3e8d5b0c6f21
+Revises: 7c2f4a9e1b3d
+Create Date: 2026-10-18 12:20:37.662418
+
+The unique index fails while evaluator holds the same phone number twice,
+remove the duplicates before applying it.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8d5b0c6f21'
+down_revision: Union[str, None] = '7c2f4a9e1b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ux_evaluator_phone_number', 'evaluator', ['phone_number'], unique=True)
+    op.create_index('ix_boletim_urna_evaluator_phone_id', 'boletim_urna', ['evaluator_phone', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_boletim_urna_evaluator_phone_id', table_name='boletim_urna')
+    op.drop_index('ux_evaluator_phone_number', table_name='evaluator')
@@ -0,0 +1,29 @@
+"""bulletin document
+
+Revision ID: 7c2f4a9e1b3d
+Revises: df3ebdd6bc49
+Create Date: 2026-10-18 11:48:20.417093
+
+Rows stored before this revision get their document on their first read.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2f4a9e1b3d'
+down_revision: Union[str, None] = 'df3ebdd6bc49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('boletim_urna', sa.Column('document', sa.Text(), nullable=True))
+    op.add_column('boletim_urna', sa.Column('etag', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('boletim_urna', 'etag')
+    op.drop_column('boletim_urna', 'document')
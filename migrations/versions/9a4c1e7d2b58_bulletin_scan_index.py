@@ -0,0 +1,48 @@
+"""bulletin scan index
+
+Revision ID: 9a4c1e7d2b58
+Revises: 3e8d5b0c6f21
+Create Date: 2026-10-18 13:05:12.481930
+
+The QR code payloads of the bulletins stored before are not kept, so only
+the scans stored from now on are recognized as duplicates.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4c1e7d2b58'
+down_revision: Union[str, None] = '3e8d5b0c6f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('bu_scan',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('bulletin_id', sa.Integer(), nullable=False),
+    sa.Column('PLEI', sa.Integer(), nullable=True),
+    sa.Column('TURN', sa.Integer(), nullable=True),
+    sa.Column('MUNI', sa.Integer(), nullable=True),
+    sa.Column('ZONA', sa.Integer(), nullable=True),
+    sa.Column('SECA', sa.Integer(), nullable=True),
+    sa.Column('IDUE', sa.Integer(), nullable=True),
+    sa.Column('part', sa.Integer(), nullable=False),
+    sa.Column('total_parts', sa.Integer(), nullable=False),
+    sa.Column('payload_hash', sa.String(length=64), nullable=False),
+    sa.Column('conflict', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['bulletin_id'], ['boletim_urna.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ux_bu_scan_hash_section_part', 'bu_scan', ['payload_hash', 'PLEI', 'TURN', 'MUNI', 'ZONA', 'SECA', 'IDUE', 'part'], unique=True)
+    op.create_index('ix_bu_scan_section_part', 'bu_scan', ['PLEI', 'TURN', 'MUNI', 'ZONA', 'SECA', 'IDUE', 'part'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bu_scan_section_part', table_name='bu_scan')
+    op.drop_index('ux_bu_scan_hash_section_part', table_name='bu_scan')
+    op.drop_table('bu_scan')
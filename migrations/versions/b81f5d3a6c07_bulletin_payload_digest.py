@@ -0,0 +1,30 @@
+"""bulletin payload digest
+
+Revision ID: b81f5d3a6c07
+Revises: 9a4c1e7d2b58
+Create Date: 2026-10-18 14:02:48.917356
+
+Only bulletins stored from now on are journaled, `python -m api.cli reprocess`
+leaves the older rows as they are.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81f5d3a6c07'
+down_revision: Union[str, None] = '9a4c1e7d2b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('boletim_urna', sa.Column('payload_digest', sa.String(length=64), nullable=True))
+    op.create_index('ix_boletim_urna_payload_digest', 'boletim_urna', ['payload_digest'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_boletim_urna_payload_digest', table_name='boletim_urna')
+    op.drop_column('boletim_urna', 'payload_digest')
@@ -0,0 +1,95 @@
+"""normalized vote tables
+
+Revision ID: df3ebdd6bc49
+Revises: 51bb70713544
+Create Date: 2026-10-18 10:12:41.305218
+
+Existing bulletins are not copied here, run `python -m api.cli backfill-votes`
+once the migration is applied (it works in chunks while the API is serving).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'df3ebdd6bc49'
+down_revision: Union[str, None] = '51bb70713544'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('bu_section',
+    sa.Column('bulletin_id', sa.Integer(), nullable=False),
+    sa.Column('evaluator_phone', sa.String(length=15), nullable=False),
+    sa.Column('PLEI', sa.Integer(), nullable=True),
+    sa.Column('TURN', sa.Integer(), nullable=True),
+    sa.Column('UNFE', sa.String(length=2), nullable=True),
+    sa.Column('MUNI', sa.Integer(), nullable=True),
+    sa.Column('ZONA', sa.Integer(), nullable=True),
+    sa.Column('SECA', sa.Integer(), nullable=True),
+    sa.Column('IDUE', sa.Integer(), nullable=True),
+    sa.Column('APTO', sa.Integer(), nullable=True),
+    sa.Column('COMP', sa.Integer(), nullable=True),
+    sa.Column('FALT', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['bulletin_id'], ['boletim_urna.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('bulletin_id')
+    )
+    op.create_index('ix_bu_section_muni_zona_seca', 'bu_section', ['MUNI', 'ZONA', 'SECA'], unique=False)
+    op.create_index('ix_bu_section_idue', 'bu_section', ['IDUE'], unique=False)
+    op.create_table('bu_position',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('bulletin_id', sa.Integer(), nullable=False),
+    sa.Column('CARG', sa.Integer(), nullable=False),
+    sa.Column('TIPO', sa.Integer(), nullable=True),
+    sa.Column('APTA', sa.Integer(), nullable=True),
+    sa.Column('NOMI', sa.Integer(), nullable=True),
+    sa.Column('LEGC', sa.Integer(), nullable=True),
+    sa.Column('BRAN', sa.Integer(), nullable=True),
+    sa.Column('NULO', sa.Integer(), nullable=True),
+    sa.Column('TOTC', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['bulletin_id'], ['bu_section.bulletin_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bu_position_bulletin_carg', 'bu_position', ['bulletin_id', 'CARG'], unique=False)
+    op.create_table('bu_party',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('bulletin_id', sa.Integer(), nullable=False),
+    sa.Column('CARG', sa.Integer(), nullable=False),
+    sa.Column('PART', sa.Integer(), nullable=False),
+    sa.Column('LEGP', sa.Integer(), nullable=True),
+    sa.Column('TOTP', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['bulletin_id'], ['bu_section.bulletin_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bu_party_bulletin_carg', 'bu_party', ['bulletin_id', 'CARG'], unique=False)
+    op.create_index('ix_bu_party_part_carg', 'bu_party', ['PART', 'CARG'], unique=False)
+    op.create_table('bu_candidate_votes',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('bulletin_id', sa.Integer(), nullable=False),
+    sa.Column('CARG', sa.Integer(), nullable=False),
+    sa.Column('PART', sa.Integer(), nullable=True),
+    sa.Column('code', sa.String(length=10), nullable=False),
+    sa.Column('votes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['bulletin_id'], ['bu_section.bulletin_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bu_candidate_votes_code_bulletin', 'bu_candidate_votes', ['code', 'bulletin_id'], unique=False)
+    op.create_index('ix_bu_candidate_votes_bulletin_carg', 'bu_candidate_votes', ['bulletin_id', 'CARG'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bu_candidate_votes_bulletin_carg', table_name='bu_candidate_votes')
+    op.drop_index('ix_bu_candidate_votes_code_bulletin', table_name='bu_candidate_votes')
+    op.drop_table('bu_candidate_votes')
+    op.drop_index('ix_bu_party_part_carg', table_name='bu_party')
+    op.drop_index('ix_bu_party_bulletin_carg', table_name='bu_party')
+    op.drop_table('bu_party')
+    op.drop_index('ix_bu_position_bulletin_carg', table_name='bu_position')
+    op.drop_table('bu_position')
+    op.drop_index('ix_bu_section_idue', table_name='bu_section')
+    op.drop_index('ix_bu_section_muni_zona_seca', table_name='bu_section')
+    op.drop_table('bu_section')
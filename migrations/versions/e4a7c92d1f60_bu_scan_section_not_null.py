@@ -0,0 +1,44 @@
+"""bu_scan section not null
+
+Revision ID: e4a7c92d1f60
+Revises: b81f5d3a6c07
+Create Date: 2026-10-18 16:41:07.263518
+
+A field missing from the metadata was stored as NULL, and NULLs never collide
+in ux_bu_scan_hash_section_part, so those scans were stored again. The scans
+stored twice are dropped, keeping the first one, and the missing fields are
+stored as -1 (MISSING_FIELD).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c92d1f60'
+down_revision: Union[str, None] = 'b81f5d3a6c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SECTION_FIELDS = ('PLEI', 'TURN', 'MUNI', 'ZONA', 'SECA', 'IDUE')
+MISSING_FIELD = -1
+
+
+def upgrade() -> None:
+    section = ', '.join(f'COALESCE("{field}", {MISSING_FIELD})' for field in SECTION_FIELDS)
+    op.execute(f'DELETE FROM bu_scan WHERE id NOT IN '
+               f'(SELECT MIN(id) FROM bu_scan GROUP BY payload_hash, {section}, part)')
+    for field in SECTION_FIELDS:
+        op.execute(f'UPDATE bu_scan SET "{field}" = {MISSING_FIELD} WHERE "{field}" IS NULL')
+    with op.batch_alter_table('bu_scan') as batch_op:
+        for field in SECTION_FIELDS:
+            batch_op.alter_column(field, existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('bu_scan') as batch_op:
+        for field in SECTION_FIELDS:
+            batch_op.alter_column(field, existing_type=sa.Integer(), nullable=True)
+    for field in SECTION_FIELDS:
+        op.execute(f'UPDATE bu_scan SET "{field}" = NULL WHERE "{field}" = {MISSING_FIELD}')
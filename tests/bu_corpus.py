@@ -0,0 +1,32 @@
+"""
+Golden corpus of raw QR payloads with the bulletins the parser is expected to produce.
+
+Each file in tests/corpus holds one bulletin: its QR code parts in order and, for each
+part, the BoletimUrna returned once that part is parsed. Synthetic entries also keep the
+generate_bulletin arguments used to build them.
+"""
+import json
+from pathlib import Path
+from typing import List
+
+from api.src.schemas import BoletimUrna
+from api.src.utils.bu_parser import BulletinUrnaParser
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+PHONE_NUMBER = "5586999999999"
+
+
+def load_corpus() -> List[dict]:
+    return [json.loads(path.read_text(encoding="utf-8")) for path in sorted(CORPUS_DIR.glob("*.json"))]
+
+
+def parse_parts(payloads: List[str]) -> List[BoletimUrna]:
+    """
+    Parse the QR codes of a bulletin in order, each one with a new parser resuming from the
+    bulletin returned for the previous one
+    """
+    results = []
+    for payload in payloads:
+        parser = BulletinUrnaParser(PHONE_NUMBER, last_bulletin=results[-1] if results else None)
+        results.append(parser.execute(payload))
+    return results
@@ -0,0 +1,149 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The settings module requires a database URL at import time
+os.environ.setdefault("DB_OVERRIDE_URL", "sqlite://")
+# Payloads journaled and logs written by the tests stay out of the project tree
+os.environ.setdefault("JOURNAL_DIR", tempfile.mkdtemp(prefix="bu-journal-"))
+os.environ.setdefault("LOGS_DIR", tempfile.mkdtemp(prefix="bu-logs-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+benchmark_results_key = pytest.StashKey[list]()
+load_results_key = pytest.StashKey[list]()
+logging_results_key = pytest.StashKey[list]()
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: parser throughput benchmarks compared against tests/benchmark_baseline.json")
+    config.stash[benchmark_results_key] = []
+    config.stash[load_results_key] = []
+    config.stash[logging_results_key] = []
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request) -> list:
+    """
+    Collected benchmark measurements, reported at the end of the session
+    """
+    return request.config.stash[benchmark_results_key]
+
+
+@pytest.fixture
+def database():
+    """
+    Tables of the in-memory test database, emptied after the test
+    """
+    from sqlalchemy import delete
+
+    from api.src.database import get_database_interface
+    from api.src.models import Base
+    from api.src.utils.evaluator_cache import get_evaluator_directory
+    from api.src.utils.idempotency import get_idempotency_store
+    from api.src.utils.scan_index import get_scan_index
+    from api.src.utils.tally import get_tally_engine
+
+    interface = get_database_interface()
+    Base.metadata.create_all(interface.engine)
+    get_tally_engine().reset()
+    get_evaluator_directory().reset()
+    get_scan_index().reset()
+    get_idempotency_store().reset()
+    yield interface
+    with interface.get_session() as session:
+        for table in reversed(Base.metadata.sorted_tables):
+            session.execute(delete(table))
+        session.commit()
+    get_tally_engine().reset()
+    get_evaluator_directory().reset()
+    get_scan_index().reset()
+    get_idempotency_store().reset()
+
+
+@pytest.fixture
+def file_database(tmp_path, monkeypatch):
+    """
+    Tables in a sqlite file, as the in-memory database is not shared with the threadpool
+    running the sync routes
+    """
+    from api.src.database import get_database_interface
+    from api.src.models import Base
+    from api.src.settings import database_settings, session_settings
+    from api.src.utils.bulletin_sessions import get_bulletin_session_store
+    from api.src.utils.scan_index import get_scan_index
+    from api.src.utils.tally import get_tally_engine
+
+    monkeypatch.setattr(database_settings, "DB_OVERRIDE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(session_settings, "BU_SESSION_SPILL_DIR", str(tmp_path / "sessions"))
+    interface = get_database_interface()
+    interface.create_engines()
+    Base.metadata.create_all(interface.engine)
+    singletons = (get_tally_engine(), get_scan_index())
+    for singleton in singletons:
+        singleton.reset()
+    yield interface
+
+    interface.engine.dispose()
+    monkeypatch.undo()
+    interface.create_engines()
+    for singleton in singletons:
+        singleton.reset()
+    get_bulletin_session_store().sessions.clear()
+
+
+@pytest.fixture(scope="session")
+def load_results(request) -> list:
+    """
+    Collected request load test measurements, reported at the end of the session
+    """
+    return request.config.stash[load_results_key]
+
+
+@pytest.fixture(scope="session")
+def logging_results(request) -> list:
+    """
+    Collected logging overhead measurements, reported at the end of the session
+    """
+    return request.config.stash[logging_results_key]
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    _report_load_results(terminalreporter, config.stash.get(load_results_key, []))
+    _report_logging_results(terminalreporter, config.stash.get(logging_results_key, []))
+    results = config.stash.get(benchmark_results_key, [])
+    if not results:
+        return
+    terminalreporter.section("BulletinUrnaParser benchmark")
+    terminalreporter.write_line(f"{'workload':<34}{'scans':>6}{'tokens':>8}{'us/scan':>12}{'tokens/s':>14}{'peak KiB':>11}{'state KiB':>11}{'baseline us':>13}")
+    for result in results:
+        baseline = f"{result['baseline_us']:.1f}" if result.get("baseline_us") else "-"
+        terminalreporter.write_line(
+            f"{result['name']:<34}{result['scans']:>6}{result['tokens']:>8}{result['us_per_scan']:>12.1f}"
+            f"{result['tokens_per_sec']:>14.0f}{result['peak_kib']:>11.1f}{result['state_kib']:>11.1f}{baseline:>13}"
+        )
+
+
+def _report_load_results(terminalreporter, results: list):
+    if not results:
+        return
+    terminalreporter.section("Request load test")
+    terminalreporter.write_line(f"{'scenario':<28}{'requests':>9}{'concurrency':>13}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for result in results:
+        terminalreporter.write_line(
+            f"{result['name']:<28}{result['requests']:>9}{result['concurrency']:>13}{result['requests_per_sec']:>10.0f}"
+            f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+        )
+
+
+def _report_logging_results(terminalreporter, results: list):
+    if not results:
+        return
+    terminalreporter.section("Logging overhead")
+    terminalreporter.write_line(f"{'profile':<28}{'requests':>9}{'us/request':>12}{'us/exception':>14}")
+    for result in results:
+        terminalreporter.write_line(
+            f"{result['name']:<28}{result['requests']:>9}{result['us_per_request']:>12.1f}{result['us_per_exception']:>14.1f}"
+        )
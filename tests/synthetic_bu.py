@@ -0,0 +1,126 @@
+"""
+Seeded synthetic Boletim de Urna (BU) QR code generator.
+
+Emits the raw QR payloads of a bulletin, either as a single "small" code or split
+in several "large" codes (QRBU:n:m). Vote totals are kept arithmetically
+consistent (TOTP, NOMI, LEGC, TOTC, COMP/FALT) so the payloads are also usable
+by consistency checks.
+"""
+import random
+from typing import List, Sequence
+
+MAJORITARIAN_CARG = 11
+MAX_PARTIES = 90
+MAX_CANDIDATES = 999
+
+
+def _hex(rng: random.Random, size: int) -> str:
+    return f"{rng.getrandbits(size * 4):0{size}X}"
+
+
+def _position_votes(rng: random.Random, carg: int, parties: Sequence[int], candidates: int) -> tuple:
+    """
+    Vote tokens of a position, with its nominal and legend vote totals
+    """
+    tokens = [f"CARG:{carg}", f"TIPO:{0 if carg == MAJORITARIAN_CARG else 1}", "VERC:202406131529"]
+    nominal, legend = 0, 0
+    if carg == MAJORITARIAN_CARG:
+        for party in parties:
+            votes = rng.randint(0, 200)
+            nominal += votes
+            tokens.append(f"{party}:{votes}")
+    else:
+        for party in parties:
+            tokens.append(f"PART:{party}")
+            party_votes = 0
+            for code in sorted(rng.sample(range(1, MAX_CANDIDATES + 1), candidates)):
+                votes = rng.randint(1, 9)
+                party_votes += votes
+                tokens.append(f"{party}{code:03d}:{votes}")
+            legp = rng.randint(0, 3)
+            nominal += party_votes
+            legend += legp
+            tokens += [f"LEGP:{legp}", f"TOTP:{party_votes + legp}"]
+    return tokens, nominal, legend
+
+
+def _position_summary(rng: random.Random, carg: int, apto: int, turnout: int, nominal: int, legend: int) -> List[str]:
+    remaining = turnout - nominal - legend
+    blank = rng.randint(0, remaining)
+    summary = [f"APTA:{apto}", f"APTS:{apto}", "APTT:0", f"NOMI:{nominal}"]
+    if carg != MAJORITARIAN_CARG:
+        summary.append(f"LEGC:{legend}")
+    return summary + [f"BRAN:{blank}", f"NULO:{remaining - blank}", f"TOTC:{turnout}"]
+
+
+def _resumable_cuts(body: List[str]) -> List[int]:
+    """
+    Token indexes where a bulletin can be split in a way the parser resumes from:
+    inside a party candidate run or between two parties of a proportional position
+    """
+    cuts, carg = [], None
+    for index, token in enumerate(body):
+        key = token.split(":", 1)[0]
+        if key == "CARG":
+            carg = int(token.split(":")[1])
+        if index == 0 or carg == MAJORITARIAN_CARG:
+            continue
+        previous = body[index - 1].split(":", 1)[0]
+        if key.isdigit() and (previous.isdigit() or previous == "PART"):
+            cuts.append(index)
+        elif key == "PART" and previous == "TOTP":
+            cuts.append(index)
+    return cuts
+
+
+def generate_bulletin(seed: int = 0,
+                      parts: int = 1,
+                      positions: Sequence[int] = (13, MAJORITARIAN_CARG),
+                      parties: int = 3,
+                      candidates: int = 10) -> List[str]:
+    """
+    Generate the QR code payloads of a synthetic bulletin, one string per part.
+
+    positions: CARG codes in order; CARG 11 is majoritarian (candidate numbers without PART)
+    parties: number of parties (or majoritarian candidates) per position
+    candidates: number of candidates per party in proportional positions
+    """
+    if not 1 <= parties <= MAX_PARTIES:
+        raise ValueError(f"parties must be between 1 and {MAX_PARTIES}")
+    if not 1 <= candidates <= MAX_CANDIDATES:
+        raise ValueError(f"candidates must be between 1 and {MAX_CANDIDATES}")
+    rng = random.Random(seed)
+    party_numbers = sorted(rng.sample(range(10, 10 + MAX_PARTIES), parties))
+
+    body = [
+        "ORIG:VOTA", "ORLC:LEG", "PROC:1000", "DTPL:20241006", "PLEI:1100", "TURN:1", "FASE:S", "UNFE:AC",
+        f"MUNI:{rng.randint(1000, 9999)}", f"ZONA:{rng.randint(1, 99)}", f"SECA:{rng.randint(1, 500)}",
+        f"IDUE:{rng.randint(1000000, 9999999)}", "IDCA:216820571350570928893711", "HIQT:1",
+        "HICA:1:216820571350570928893711", "VERS:9.21.0.0",
+    ]
+    votes = [_position_votes(rng, carg, party_numbers, candidates) for carg in positions]
+    turnout = max((nominal + legend for _, nominal, legend in votes), default=0) + rng.randint(0, 10)
+    apto = turnout + rng.randint(0, turnout // 5 + 1)
+    body += [
+        "LOCA:4", f"APTO:{apto}", f"APTS:{apto}", "APTT:0", f"COMP:{turnout}", f"FALT:{apto - turnout}",
+        "DTAB:20241006", "HRAB:091502", "DTFC:20241006", "HRFC:170042", "IDEL:1101",
+    ]
+    for carg, (tokens, nominal, legend) in zip(positions, votes):
+        body += tokens + _position_summary(rng, carg, apto, turnout, nominal, legend)
+
+    if parts > 1:
+        available = _resumable_cuts(body)
+        if len(available) < parts - 1:
+            raise ValueError(f"Bulletin too small to be split in {parts} parts")
+        cuts = sorted(rng.sample(available, parts - 1))
+    else:
+        cuts = []
+
+    payloads, start = [], 0
+    for index, end in enumerate(cuts + [len(body)], start=1):
+        tokens = [f"QRBU:{index}:{parts}", "VRQR:1.5", "VRCH:20240507"] + body[start:end] + [f"HASH:{_hex(rng, 128)}"]
+        if index == parts:
+            tokens.append(f"ASSI:{_hex(rng, 128)}")
+        payloads.append(" ".join(tokens))
+        start = end
+    return payloads
@@ -0,0 +1,137 @@
+"""
+Arithmetic consistency audit of the bulletins, and its speed on arrays of many sections.
+
+    BU_AUDIT_SECTIONS=100000    sections of the vectorized audit benchmark
+"""
+import os
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src.handlers import _store_bulletins, audit_bulletins, save_bulletin_qr_code
+from api.src.schemas import BulletinQrCode, EvaluatorPublic
+from api.src.utils.audit import CHECKS, MISSING, audit_contents, find_violations
+from api.src.utils.metrics import get_metrics_registry
+from api.src.utils.parser_pool import parse_bulletin
+from bu_corpus import PHONE_NUMBER, load_corpus
+from synthetic_bu import generate_bulletin
+
+SECTIONS = int(os.environ.get("BU_AUDIT_SECTIONS", 100000))
+BU_BIG = next(entry for entry in load_corpus() if entry["name"] == "bu_big")
+
+
+def _checks(violations) -> list:
+    return [(violation.check, violation.CARG, violation.PART, violation.expected, violation.found) for violation in violations]
+
+
+def _bulletin(seed: int):
+    return parse_bulletin(PHONE_NUMBER, generate_bulletin(seed=seed, parties=3, candidates=4))
+
+
+def test_each_check_finds_its_violation():
+    bulletins = [_bulletin(seed) for seed in range(6)]
+    assert audit_contents([bulletin.content for bulletin in bulletins]) == [[]] * 6
+
+    contents = [bulletin.content for bulletin in bulletins]
+    proportional = [next(position for position in content.voting.position if position.CARG == 13) for content in contents]
+    party = proportional[0].party[1]
+    party.TOTP += 1
+    candidate = next(iter(proportional[1].party[0].candidates.values()))
+    candidate.votes += 2
+    proportional[2].summary.LEGC += 3
+    proportional[3].summary.BRAN += 4
+    contents[4].details.FALT += 5
+    proportional[5].summary.TOTC = None  # A missing total is not checked
+
+    found = audit_contents(contents)
+    assert _checks(found[0]) == [("party_votes", 13, party.PART, party.TOTP, party.TOTP - 1),
+                                 ("party_totals", 13, None, proportional[0].summary.NOMI + proportional[0].summary.LEGC,
+                                  proportional[0].summary.NOMI + proportional[0].summary.LEGC + 1)]
+    assert [violation.check for violation in found[1]] == ["party_votes", "nominal_votes"]
+    assert [violation.check for violation in found[2]] == ["party_totals", "position_total"]
+    assert [violation.check for violation in found[3]] == ["position_total"]
+    assert _checks(found[4]) == [("attendance", None, None, contents[4].details.APTO, contents[4].details.APTO + 5)]
+    assert found[5] == []
+
+
+def test_payload_with_missing_candidate_votes_is_flagged_at_ingest(database):
+    bulletin = parse_bulletin(PHONE_NUMBER, [part["qrcode"] for part in BU_BIG["parts"]])
+    # The candidates of party 95 in the payload add up to 70 votes, its total is 99 with 3 legend votes
+    assert _checks(audit_contents([bulletin.content])[0]) == [("party_votes", 13, 95, 99, 73), ("nominal_votes", 13, None, 499, 473)]
+
+    get_metrics_registry().reset()
+    evaluator = EvaluatorPublic(id=1, phone_number=PHONE_NUMBER)
+    for part in BU_BIG["parts"]:
+        progress = save_bulletin_qr_code(evaluator, BulletinQrCode(content=part["qrcode"]))
+    assert progress.finished and [violation.check for violation in progress.violations] == ["party_votes", "nominal_votes"]
+    assert get_metrics_registry().audit_violations.value("party_votes") == 1
+
+
+def test_stored_bulletins_are_audited_in_chunks(file_database):
+    bulletins = [_bulletin(seed) for seed in range(5)]
+    bulletins[1].content.details.COMP += 1
+    bulletins[3].content.voting.position[0].party[0].LEGP = None  # Counted as zero
+    bulletins[4].content.voting.position[0].summary.NOMI += 1
+    _store_bulletins(PHONE_NUMBER, bulletins)
+
+    report = audit_bulletins(max_sections=2, chunk_size=2)
+    assert report.sections == 5 and report.inconsistent == 3
+    assert report.checks["attendance"] == 1 and report.checks["nominal_votes"] == 1
+    assert [section.bulletin_id for section in report.items] == [2, 4]
+    assert report.items[0].MUNI == bulletins[1].content.metadata.MUNI
+    assert report.items[0].violations[0].check == "attendance"
+
+    response = TestClient(app).get("/admin/audit", headers={"X-Security-Token": "123"})
+    assert response.status_code == 200 and response.json()["inconsistent"] == 3
+    assert TestClient(app).get("/admin/audit").status_code == 401
+
+
+def _arrays(sections: int, rng: np.random.Generator):
+    """
+    Consistent bulletins: a proportional position (4 parties of 5 candidates) and a majoritarian one (4 candidates)
+    """
+    ids = np.arange(1, sections + 1)
+    party_votes = rng.integers(0, 50, size=(sections, 4, 5))
+    legend = rng.integers(0, 5, size=(sections, 4))
+    mayor_votes = rng.integers(0, 100, size=(sections, 4))
+    blank, null = rng.integers(0, 20, size=(2, sections))
+    nominal, legc = party_votes.sum(axis=(1, 2)), legend.sum(axis=1)
+    totc = nominal + legc + blank + null
+    absent = rng.integers(0, 100, size=sections)
+
+    section_rows = np.column_stack((ids, totc + absent, totc, absent))
+    positions = np.concatenate((
+        np.column_stack((ids, np.full(sections, 13), nominal, legc, blank, null, totc)),
+        np.column_stack((ids, np.full(sections, 11), totc - blank - null, np.full(sections, MISSING), blank, null, totc)),
+    ))
+    mayor_votes[:, 0] += totc - blank - null - mayor_votes.sum(axis=1)  # The first candidate takes the rest, may go negative
+    parts = np.arange(10, 14)
+    parties = np.column_stack((
+        np.repeat(ids, 4), np.full(sections * 4, 13), np.tile(parts, sections),
+        legend.ravel(), (party_votes.sum(axis=2) + legend).ravel(),
+    ))
+    candidates = np.concatenate((
+        np.column_stack((np.repeat(ids, 20), np.full(sections * 20, 13), np.tile(np.repeat(parts, 5), sections), party_votes.ravel())),
+        np.column_stack((np.repeat(ids, 4), np.full(sections * 4, 11), np.full(sections * 4, MISSING), mayor_votes.ravel())),
+    ))
+    return [array.astype(np.int64) for array in (section_rows, positions, parties, candidates)]
+
+
+def test_vectorized_audit_of_many_sections():
+    rng = np.random.default_rng(25)
+    sections, positions, parties, candidates = _arrays(SECTIONS, rng)
+    assert not len(find_violations(sections, positions, parties, candidates))
+
+    broken = rng.choice(SECTIONS, size=100, replace=False)
+    candidates[broken * 20, 3] += 1  # First candidate of the first party: party_votes and nominal_votes of CARG 13
+    sections[broken, 2] += 1  # attendance
+
+    started = time.perf_counter()
+    found = find_violations(sections, positions, parties, candidates)
+    seconds = time.perf_counter() - started
+
+    assert sorted(set(found[:, 0].tolist())) == sorted((broken + 1).tolist())
+    assert np.bincount(found[:, 1], minlength=len(CHECKS)).tolist() == [100, 100, 0, 0, 100]
+    assert seconds < 10, f"{SECTIONS} sections audited in {seconds:.2f}s"
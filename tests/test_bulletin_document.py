@@ -0,0 +1,66 @@
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from api.main import app
+from api.src.handlers import _store_bulletins, get_bulletin_document
+from api.src.models import BoletimUrnaModel
+from api.src.utils.parser_pool import parse_bulletin
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+
+def _store(seed: int = 1):
+    bulletin = parse_bulletin(PHONE_NUMBER, generate_bulletin(seed=seed, parts=2, parties=3, candidates=4))
+    _store_bulletins(PHONE_NUMBER, [bulletin])
+    return bulletin
+
+
+def test_document_is_served_as_stored(database):
+    bulletin = _store()
+    document = get_bulletin_document(PHONE_NUMBER)
+    assert json.loads(document.body) == json.loads(bulletin.model_dump_json())
+    assert len(document.etag) == 64
+
+
+def test_latest_bulletin_is_served(database):
+    _store(seed=1)
+    latest = _store(seed=2)
+    assert json.loads(get_bulletin_document(PHONE_NUMBER).body) == json.loads(latest.model_dump_json())
+
+
+def test_matching_etag_skips_the_document(database):
+    _store()
+    etag = get_bulletin_document(PHONE_NUMBER).etag
+    assert get_bulletin_document(PHONE_NUMBER, f'"{etag}"').body is None
+    assert get_bulletin_document(PHONE_NUMBER, f'"other", W/"{etag}"').body is None
+    assert get_bulletin_document(PHONE_NUMBER, '*').body is None
+    assert get_bulletin_document(PHONE_NUMBER, '"other"').body is not None
+
+
+def test_rows_without_document_are_filled_on_first_read(database):
+    bulletin = _store()
+    stored = get_bulletin_document(PHONE_NUMBER)
+    with database.get_session() as session:
+        session.execute(update(BoletimUrnaModel).values(document=None, etag=None))
+        session.commit()
+
+    document = get_bulletin_document(PHONE_NUMBER)
+    assert json.loads(document.body) == json.loads(bulletin.model_dump_json())
+    assert document.etag == stored.etag
+    with database.get_session() as session:
+        assert session.scalar(select(BoletimUrnaModel.etag)) == stored.etag
+
+
+def test_route_answers_304_for_the_current_etag(file_database):
+    bulletin = _store()
+    client = TestClient(app)
+    response = client.get(f"/bulletin/{PHONE_NUMBER}")
+    assert response.status_code == 200 and response.json() == json.loads(bulletin.model_dump_json())
+
+    response = client.get(f"/bulletin/{PHONE_NUMBER}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304 and not response.content
+    responses = app.openapi()["paths"]["/bulletin/{phone_number}"]["get"]["responses"]
+    assert responses["200"]["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/BoletimUrna"}
+    assert "304" in responses
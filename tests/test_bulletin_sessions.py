@@ -0,0 +1,130 @@
+import json
+import os
+
+import pytest
+
+from api.src.settings import session_settings
+from api.src.utils.bu_parser import BulletinUrnaParser
+from api.src.utils.bulletin_sessions import BulletinSessionStore, PartStatus, read_qrbu
+from bu_corpus import PHONE_NUMBER, load_corpus
+from synthetic_bu import generate_bulletin
+
+CORPUS = {entry["name"]: entry for entry in load_corpus()}
+BU_BIG = CORPUS["bu_big"]
+PAYLOADS = [part["qrcode"] for part in BU_BIG["parts"]]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_settings, "BU_SESSION_SPILL_DIR", str(tmp_path / "sessions"))
+    store = BulletinSessionStore()
+    store.sessions.clear()
+    store.completed.clear()
+    store.dropped = 0
+    yield store
+    store.sessions.clear()
+    store.completed.clear()
+
+
+def _submit_all(store, payloads, phone_number=PHONE_NUMBER):
+    statuses, bulletin = [], None
+    for payload in payloads:
+        session, status = store.add_part(phone_number, payload)
+        statuses.append(status)
+        if status != PartStatus.DUPLICATE and session.is_complete:
+            bulletin = BulletinUrnaParser(phone_number).execute_parts(session.ordered_payloads())
+            store.complete(session)
+    return statuses, bulletin
+
+
+def test_read_qrbu():
+    assert read_qrbu("QRBU:2:4 VRQR:1.5") == (2, 4)
+    with pytest.raises(ValueError):
+        read_qrbu("VRQR:1.5")
+    with pytest.raises(ValueError):
+        read_qrbu("QRBU:5:4 VRQR:1.5")
+
+
+@pytest.mark.parametrize("name", ["synthetic_small", "synthetic_multi_position"])
+def test_execute_parts_matches_sequential_parsing(name):
+    parts = CORPUS[name]["parts"]
+    bulletin = BulletinUrnaParser(PHONE_NUMBER).execute_parts([part["qrcode"] for part in parts])
+    assert json.loads(bulletin.model_dump_json()) == parts[-1]["expected"]
+
+
+def test_parts_are_assembled_in_any_order(store):
+    expected = json.loads(BulletinUrnaParser(PHONE_NUMBER).execute_parts(PAYLOADS).model_dump_json())
+    statuses, bulletin = _submit_all(store, [PAYLOADS[2], PAYLOADS[0], PAYLOADS[3], PAYLOADS[1]])
+    assert statuses == [PartStatus.ACCEPTED] * 4
+    assert bulletin.finished
+    assert bulletin.header.QRBU == [4, 4]
+    assert json.loads(bulletin.model_dump_json()) == expected
+    assert not store.sessions
+
+
+def test_duplicate_parts_are_dropped(store):
+    statuses, bulletin = _submit_all(store, [PAYLOADS[0], PAYLOADS[0], PAYLOADS[1]])
+    assert statuses == [PartStatus.ACCEPTED, PartStatus.DUPLICATE, PartStatus.ACCEPTED]
+    assert bulletin is None
+    session, = store.pending(PHONE_NUMBER)
+    assert session.received_parts == [1, 2]
+    assert session.missing_parts == [3, 4]
+    assert session.urn == 2033200
+
+    statuses, bulletin = _submit_all(store, PAYLOADS[2:] + [PAYLOADS[3]])
+    assert statuses == [PartStatus.ACCEPTED, PartStatus.ACCEPTED, PartStatus.DUPLICATE]
+    assert bulletin.finished
+    session, status = store.add_part(PHONE_NUMBER, PAYLOADS[1])
+    assert status == PartStatus.DUPLICATE and session.finished
+
+
+def test_evicted_session_spills_and_resumes(store, monkeypatch):
+    monkeypatch.setattr(session_settings, "BU_SESSION_MAX_ENTRIES", 0)
+    _submit_all(store, [PAYLOADS[3], PAYLOADS[1]])
+    assert not store.sessions
+    session, = store.pending(PHONE_NUMBER)
+    assert session.missing_parts == [1, 3]
+
+    _, bulletin = _submit_all(store, [PAYLOADS[0], PAYLOADS[2]])
+    assert bulletin.finished
+    assert os.listdir(session_settings.spill_dir) == []
+
+
+def test_parts_of_another_bulletin_are_not_mixed(store):
+    first, second = generate_bulletin(seed=1, parts=3), generate_bulletin(seed=2, parts=3)
+    expected = json.loads(BulletinUrnaParser(PHONE_NUMBER).execute_parts(second).model_dump_json())
+    # The first bulletin is left without its part 2, the parts of the second one arrive before its part 1
+    statuses, bulletin = _submit_all(store, [first[0], first[2], second[2], second[1], second[0]])
+    assert statuses == [PartStatus.ACCEPTED] * 4 + [PartStatus.RESTARTED]
+    assert json.loads(bulletin.model_dump_json()) == expected
+    assert not store.sessions
+
+    # The partial first bulletin was dropped when the second one started
+    session, status = store.add_part(PHONE_NUMBER, first[1])
+    assert status == PartStatus.ACCEPTED and session.received_parts == [2] and session.urn is None
+
+
+def test_expired_session_spills_and_resumes(store):
+    _submit_all(store, [PAYLOADS[0], PAYLOADS[2]])
+    store.sessions[(PHONE_NUMBER, 4)].updated_at -= session_settings.ttl_seconds + 1
+    _submit_all(store, generate_bulletin(seed=3, parts=2)[:1])
+    assert list(store.sessions) == [(PHONE_NUMBER, 2)]
+    session, = [session for session in store.pending(PHONE_NUMBER) if session.total_parts == 4]
+    assert session.missing_parts == [2, 4]
+
+    statuses, bulletin = _submit_all(store, [PAYLOADS[1], PAYLOADS[3]])
+    assert statuses == [PartStatus.ACCEPTED] * 2 and bulletin.finished
+
+
+def test_next_bulletin_waits_in_order_after_completion(store):
+    first, second = generate_bulletin(seed=1, parts=3), generate_bulletin(seed=2, parts=3)
+    _submit_all(store, [second[0], generate_bulletin(seed=4, parts=2)[0]])
+    # The first bulletin is complete but not stored yet, e.g. rejected with a 503
+    for payload in first + [second[2]]:
+        session, _ = store.add_part(PHONE_NUMBER, payload)
+    assert store.dropped == 1  # The part 1 of the first bulletin left the second one behind
+    store.complete(store.sessions[(PHONE_NUMBER, 3)])
+    # The part of the second bulletin received meanwhile is now the newest session
+    assert list(store.sessions) == [(PHONE_NUMBER, 2), (PHONE_NUMBER, 3)]
+    assert session.received_parts == [3] and store.sessions[(PHONE_NUMBER, 3)] is session
+    assert session.updated_at > store.sessions[(PHONE_NUMBER, 2)].updated_at
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import delete, insert, select
+
+from api.src.handlers import get_evaluator
+from api.src.models import EvaluatorModel
+from api.src.settings import evaluator_cache_settings
+from api.src.utils.evaluator_cache import get_evaluator_directory
+
+PHONES = ["5561900000001", "5561900000002", "5561900000003"]
+
+
+@pytest.fixture
+def evaluators(database):
+    with database.get_session() as session:
+        session.execute(insert(EvaluatorModel), [
+            dict(phone_number=phone, section="1", zone="1", city="Brasília") for phone in PHONES
+        ])
+        session.commit()
+    return database
+
+
+def _delete_rows(database):
+    # Bypasses the ORM, so the cache is not told
+    with database.get_session() as session:
+        session.execute(delete(EvaluatorModel))
+        session.commit()
+
+
+def test_warmed_login_does_not_query_the_database(evaluators):
+    assert get_evaluator_directory().warm() == 3
+    _delete_rows(evaluators)
+
+    assert get_evaluator(PHONES[1]).phone_number == PHONES[1]
+    stats = get_evaluator_directory().stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (3, 1, 0)
+
+
+def test_miss_loads_and_caches(evaluators):
+    first = get_evaluator(PHONES[0])
+    _delete_rows(evaluators)
+    assert get_evaluator(PHONES[0]) == first
+    stats = get_evaluator_directory().stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_entries_expire(evaluators, monkeypatch):
+    get_evaluator(PHONES[0])
+    monkeypatch.setattr(evaluator_cache_settings, "EVALUATOR_CACHE_TTL_SECONDS", 0)
+    get_evaluator_directory().put(get_evaluator(PHONES[0]))
+    _delete_rows(evaluators)
+    with pytest.raises(Exception, match="No evaluator found"):
+        get_evaluator(PHONES[0])
+
+
+def test_least_recently_used_is_evicted(evaluators, monkeypatch):
+    monkeypatch.setattr(evaluator_cache_settings, "EVALUATOR_CACHE_MAX_ENTRIES", 2)
+    directory = get_evaluator_directory()
+    get_evaluator(PHONES[0])
+    get_evaluator(PHONES[1])
+    get_evaluator(PHONES[0])
+    get_evaluator(PHONES[2])
+    assert list(directory.entries) == [PHONES[0], PHONES[2]]
+    assert directory.stats()["evictions"] == 1
+
+
+def test_orm_update_and_delete_invalidate(evaluators):
+    directory = get_evaluator_directory()
+    directory.warm()
+    with evaluators.get_session() as session:
+        evaluator = session.scalars(select(EvaluatorModel).where(EvaluatorModel.phone_number == PHONES[0])).one()
+        evaluator.phone_number = "5561900000009"
+        session.delete(session.scalars(select(EvaluatorModel).where(EvaluatorModel.phone_number == PHONES[1])).one())
+        session.commit()
+    assert list(directory.entries) == [PHONES[2]]
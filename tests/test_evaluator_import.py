@@ -0,0 +1,63 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import select
+
+from api.src.handlers import get_evaluator, import_evaluator_file
+from api.src.models import EvaluatorModel
+from api.src.utils.evaluator_cache import get_evaluator_directory
+
+CSV = """phone_number,section,zone,city
+5561900000001,1002,201,Parnaíba
+5561900000002,1003,201,Parnaíba
+123,1004,201,Parnaíba
+5561900000003,,201,Teresina
+5561900000001,1005,202,Parnaíba
+5561900000004,1006,203,"Teresina"
+"""
+
+
+def _import(text: str, fmt: str, **kwargs):
+    return import_evaluator_file(io.BytesIO(text.encode()), fmt, **kwargs)
+
+
+def _rows(database) -> dict:
+    with database.get_session() as session:
+        return {row.phone_number: (row.section, row.zone, row.city) for row in session.scalars(select(EvaluatorModel))}
+
+
+def test_csv_rows_are_upserted_and_errors_reported(database):
+    result = _import(CSV, "csv", chunk_size=2)
+
+    assert (result.total, result.imported, result.failed) == (6, 4, 2)
+    assert [error.line for error in result.errors] == [4, 5]
+    assert "phone_number" in result.errors[0].error and "section" in result.errors[1].error
+    assert _rows(database) == {
+        "5561900000001": ("1005", "202", "Parnaíba"),
+        "5561900000002": ("1003", "201", "Parnaíba"),
+        "5561900000004": ("1006", "203", "Teresina"),
+    }
+
+
+def test_ndjson_updates_existing_evaluators(database):
+    _import(CSV, "csv")
+    evaluator_id = get_evaluator("5561900000002").id
+    lines = [
+        json.dumps({"phone_number": "5561900000002", "section": "9", "zone": "9", "city": "Picos"}),
+        "",
+        "{not json",
+        json.dumps(["5561900000005"]),
+    ]
+    result = _import("\n".join(lines), "ndjson")
+
+    assert (result.total, result.imported, result.failed) == (3, 1, 2)
+    assert [error.line for error in result.errors] == [3, 4]
+    assert _rows(database)["5561900000002"] == ("9", "9", "Picos")
+    assert "5561900000002" not in get_evaluator_directory().entries
+    assert get_evaluator("5561900000002").id == evaluator_id
+
+
+def test_csv_without_required_columns_is_rejected(database):
+    with pytest.raises(ValueError, match="section, zone"):
+        _import("phone_number,city\n5561900000001,Picos\n", "csv")
@@ -0,0 +1,256 @@
+"""
+Per-evaluator ordered execution of the QR code uploads, and a stress test of the upload path.
+
+The stress test sends the parts of a multi-part bulletin per simulated evaluator, interleaved
+across evaluators and concurrently within each one, to a sqlite file, in the sync (threadpool)
+and async (DB_ASYNC) modes. Every bulletin must be parsed and stored exactly once.
+
+    BU_STRESS_EVALUATORS=200    simulated evaluators, each uploading one bulletin
+    BU_STRESS_PARTS=3           QR codes per bulletin
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event, func, select
+
+from api.src import handlers
+from api.src.database import get_database_interface
+from api.src.models import Base, BoletimUrnaModel
+from api.src.schemas import BulletinQrCode, EvaluatorPublic
+from api.src.settings import database_settings, evaluator_lock_settings, session_settings
+from api.src.utils.bulletin_sessions import get_bulletin_session_store
+from api.src.utils.evaluator_locks import EvaluatorBusy, EvaluatorLocks, get_evaluator_locks
+from api.src.utils.idempotency import get_idempotency_store
+from api.src.utils.scan_index import get_scan_index
+from api.src.utils.tally import get_tally_engine
+from synthetic_bu import generate_bulletin
+
+EVALUATORS = int(os.environ.get("BU_STRESS_EVALUATORS", 200))
+PARTS = int(os.environ.get("BU_STRESS_PARTS", 3))
+INTERLEAVED = 8  # Evaluators whose parts are shuffled together
+
+
+@pytest.fixture
+def locks():
+    locks = get_evaluator_locks()
+    locks.reset()
+    yield locks
+    locks.reset()
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_uploads_of_an_evaluator_run_in_arrival_order(locks):
+    order = []
+
+    def upload(number):
+        with locks.hold("5586999990001"):
+            order.append(number)
+
+    threads = [threading.Thread(target=upload, args=(number,)) for number in range(5)]
+    with locks.hold("5586999990001"):
+        for number, thread in enumerate(threads):
+            thread.start()
+            _wait_for(lambda: locks.stats()["waiting"] == number + 1)
+        with locks.hold("5586999990002"):  # Another evaluator is not held
+            order.append("other")
+    for thread in threads:
+        thread.join()
+    assert order == ["other", 0, 1, 2, 3, 4]
+    assert locks.stats()["held"] == 0
+
+
+def test_a_waiting_upload_times_out_and_leaves_the_queue(locks, monkeypatch):
+    monkeypatch.setattr(evaluator_lock_settings, "EVALUATOR_LOCK_TIMEOUT_SECONDS", 0.05)
+    errors = []
+
+    def upload():
+        try:
+            with locks.hold("5586999990001"):
+                pass
+        except EvaluatorBusy as e:
+            errors.append(e)
+
+    with locks.hold("5586999990001"):
+        thread = threading.Thread(target=upload)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1 and locks.stats()["timeouts"] == 1
+    upload()
+    assert len(errors) == 1 and locks.stats()["held"] == 0
+
+
+def test_tasks_and_threads_share_the_queues(locks):
+    order = []
+
+    async def upload(number):
+        async with locks.hold_async("5586999990001"):
+            order.append(number)
+            await asyncio.sleep(0.001)
+
+    async def main():
+        release = threading.Event()
+
+        def batch():
+            with locks.hold("5586999990001"):
+                order.append("batch")
+                release.wait(5)
+        thread = threading.Thread(target=batch)
+        thread.start()
+        _wait_for(lambda: order)
+        tasks = []
+        for number in range(3):
+            tasks.append(asyncio.create_task(upload(number)))
+            while locks.stats()["waiting"] < number + 1:
+                await asyncio.sleep(0.001)
+        cancelled = asyncio.create_task(upload("cancelled"))
+        while locks.stats()["waiting"] < 4:
+            await asyncio.sleep(0.001)
+        cancelled.cancel()
+        release.set()
+        await asyncio.gather(*tasks)
+        thread.join()
+
+    asyncio.run(main())
+    assert order == ["batch", 0, 1, 2]
+    assert locks.stats()["held"] == 0 and locks.stats()["waiting"] == 0
+
+
+@pytest.fixture(params=["sync", "async"])
+def stress_database(request, tmp_path, monkeypatch, locks):
+    """
+    A sqlite file, as the in-memory database is not shared between threads
+    """
+    monkeypatch.setattr(database_settings, "DB_OVERRIDE_URL", f"sqlite:///{tmp_path / 'stress.db'}")
+    monkeypatch.setattr(database_settings, "DB_ASYNC", request.param == "async")
+    monkeypatch.setattr(session_settings, "BU_SESSION_SPILL_DIR", str(tmp_path / "sessions"))
+    interface = get_database_interface()
+    interface.create_engines()
+    Base.metadata.create_all(interface.engine)
+    singletons = (get_tally_engine(), get_scan_index(), get_idempotency_store())
+    for singleton in singletons:
+        singleton.reset()
+    sessions = get_bulletin_session_store()
+    sessions.sessions.clear()
+    yield request.param
+
+    interface.engine.dispose()
+    asyncio.run(interface.dispose_async())
+    monkeypatch.undo()
+    interface.create_engines()
+    for singleton in singletons:
+        singleton.reset()
+    sessions.sessions.clear()
+    sessions.completed.clear()
+
+
+def _uploads():
+    """
+    (evaluator, part) of every evaluator and the retry of one of its parts, as sent by the app
+    on a dropped connection, the uploads of INTERLEAVED evaluators shuffled together
+    """
+    rng = random.Random(22)
+    evaluators = [EvaluatorPublic(id=number, phone_number=f"55869{number:08d}") for number in range(EVALUATORS)]
+    uploads = []
+    for first in range(0, EVALUATORS, INTERLEAVED):
+        group = []
+        for evaluator in evaluators[first:first + INTERLEAVED]:
+            payloads = generate_bulletin(seed=1000 + evaluator.id, parts=PARTS, parties=3, candidates=4)
+            group += [(evaluator, BulletinQrCode(content=payload)) for payload in payloads + [rng.choice(payloads)]]
+        rng.shuffle(group)
+        uploads += group
+    return uploads
+
+
+def test_interleaved_uploads_store_each_bulletin_once(stress_database, locks, monkeypatch):
+    stored = []
+    save_parsed, save_parsed_async = handlers._save_parsed, handlers._save_parsed_async
+
+    async def count_async(phone_number, *args):
+        stored.append(phone_number)
+        return await save_parsed_async(phone_number, *args)
+    monkeypatch.setattr(handlers, "_save_parsed", lambda phone_number, *args: stored.append(phone_number) or save_parsed(phone_number, *args))
+    monkeypatch.setattr(handlers, "_save_parsed_async", count_async)
+    uploads = _uploads()
+
+    if stress_database == "sync":
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            responses = list(executor.map(lambda upload: handlers.save_bulletin_qr_code(*upload), uploads))
+    else:
+        async def upload_all():
+            return await asyncio.gather(*(handlers.save_bulletin_qr_code_async(*upload) for upload in uploads))
+        responses = asyncio.run(upload_all())
+
+    phone_numbers = sorted(f"55869{number:08d}" for number in range(EVALUATORS))
+    assert sorted(stored) == phone_numbers
+    assert sorted(progress.phone_number for progress in responses if progress.finished and not progress.duplicate) == phone_numbers
+    assert not any(progress.conflict for progress in responses)
+    with get_database_interface().get_session() as session:
+        assert session.scalar(select(func.count()).select_from(BoletimUrnaModel)) == EVALUATORS
+    stats = locks.stats()
+    assert stats["acquired"] == EVALUATORS * (PARTS + 1) and stats["waited"] > 0
+    assert stats["held"] == 0 and stats["timeouts"] == 0
+
+
+def _count_checkouts(engine, counts: dict):
+    """
+    Count the checkouts of the pool of an engine, and the most connections held at once
+    """
+    held = [0]
+
+    def checkout(*args):
+        held[0] += 1
+        counts["checkouts"] += 1
+        counts["held"] = max(counts["held"], held[0])
+
+    def checkin(*args):
+        held[0] -= 1
+    event.listen(engine, "checkout", checkout)
+    event.listen(engine, "checkin", checkin)
+
+
+def test_database_locks_hold_a_connection_of_their_own_pool(stress_database, monkeypatch):
+    monkeypatch.setattr(evaluator_lock_settings, "EVALUATOR_LOCK_MODE", "database")
+    # The advisory lock statements run on sqlite functions standing for the PostgreSQL ones
+    monkeypatch.setattr(EvaluatorLocks, "_lock_statements", staticmethod(lambda dialect: True))
+    interface = get_database_interface()
+    interface.engine.dispose()
+    asyncio.run(interface.dispose_async())
+    interface.create_engines()
+    calls = []
+
+    def functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("set_config", 3, lambda name, value, local: value)
+        dbapi_connection.create_function("pg_advisory_lock", 1, lambda key: calls.append("lock"))
+        dbapi_connection.create_function("pg_advisory_unlock", 1, lambda key: calls.append("unlock") or 1)
+    is_async = stress_database == "async"
+    lock_engine = interface.async_lock_engine.sync_engine if is_async else interface.lock_engine
+    engine = interface.async_engine.sync_engine if is_async else interface.engine
+    event.listen(lock_engine, "connect", functions)
+    locks, writes = {"checkouts": 0, "held": 0}, {"checkouts": 0, "held": 0}
+    _count_checkouts(lock_engine, locks)
+    _count_checkouts(engine, writes)
+
+    evaluator = EvaluatorPublic(id=1, phone_number="5586999990001")
+    payloads = generate_bulletin(seed=22, parts=3, parties=3, candidates=4)
+    for payload in payloads:
+        if is_async:
+            progress = asyncio.run(handlers.save_bulletin_qr_code_async(evaluator, BulletinQrCode(content=payload)))
+        else:
+            progress = handlers.save_bulletin_qr_code(evaluator, BulletinQrCode(content=payload))
+    assert progress.finished
+    assert calls == ["lock", "unlock"] * len(payloads)
+    # One lock connection per upload, and the write never waits for a second connection of its pool
+    assert locks == {"checkouts": len(payloads), "held": 1}
+    assert writes["checkouts"] > 0 and writes["held"] == 1
+    interface.lock_engine.dispose()
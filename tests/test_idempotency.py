@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src import routes
+from api.src.schemas import BulletinProgress
+from api.src.settings import idempotency_settings
+from api.src.utils.idempotency import IdempotencyKeyReused, get_idempotency_store, idempotency_key
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+
+@pytest.fixture
+def store():
+    store = get_idempotency_store()
+    store.reset()
+    yield store
+    store.reset()
+
+
+def test_concurrent_retries_run_once(store):
+    calls = []
+
+    async def save():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def submit(key):
+        return await asyncio.gather(*(store.run(key, save) for _ in range(10)))
+
+    key = idempotency_key(PHONE_NUMBER, "QRBU:1:1 VRQR:1.5", "retry-1")
+    results = asyncio.run(submit(key))
+    assert results == [(1, False)] + [(1, True)] * 9
+    assert asyncio.run(store.run(key, save)) == (1, True)
+    assert len(calls) == 1
+    assert store.stats()["coalesced"] == 9 and store.stats()["replayed"] == 1
+
+    with pytest.raises(IdempotencyKeyReused):
+        asyncio.run(store.run(idempotency_key(PHONE_NUMBER, "QRBU:1:1 VRQR:1.6", "retry-1"), save))
+    # Keys are scoped by phone number, and derived from the payload without the header
+    assert asyncio.run(store.run(idempotency_key("5586999990000", "QRBU:1:1 VRQR:1.6", "retry-1"), save)) == (2, False)
+    assert idempotency_key(PHONE_NUMBER, "QRBU:1:1  VRQR:1.5") == idempotency_key(PHONE_NUMBER, "QRBU:1:1 VRQR:1.5")
+
+
+def test_failures_are_not_kept_and_entries_expire(store, monkeypatch):
+    monkeypatch.setattr(idempotency_settings, "IDEMPOTENCY_MAX_ENTRIES", 2)
+    monkeypatch.setattr(idempotency_settings, "IDEMPOTENCY_DERIVED_TTL_SECONDS", 0.05)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("timeout")
+        return "stored"
+
+    key = idempotency_key(PHONE_NUMBER, "QRBU:1:1")
+    with pytest.raises(ValueError):
+        asyncio.run(store.run(key, flaky))
+    assert asyncio.run(store.run(key, flaky)) == ("stored", False)
+    assert asyncio.run(store.run(key, flaky)) == ("stored", True)
+    time.sleep(0.06)
+    assert asyncio.run(store.run(key, flaky)) == ("stored", False)
+
+    for payload in ("QRBU:1:2", "QRBU:2:2"):
+        asyncio.run(store.run(idempotency_key(PHONE_NUMBER, payload), flaky))
+    assert store.stats()["size"] == 2 and store.stats()["evictions"] == 1
+
+
+def test_retried_submission_replays_the_response(store, monkeypatch):
+    saved, release = [], threading.Event()
+
+    def save_bulletin_qr_code(evaluator, bulletin, trace=None):
+        saved.append(bulletin.content)
+        release.wait(5)
+        return BulletinProgress(phone_number=evaluator.phone_number, urn=len(saved), total_parts=1, received_parts=[1], finished=True)
+    monkeypatch.setattr(routes, "save_bulletin_qr_code", save_bulletin_qr_code)
+    payload, = generate_bulletin(seed=51, parties=2, candidates=3)
+    request = {"evaluator": {"id": 1, "phone_number": PHONE_NUMBER}, "bulletin": {"content": payload}}
+    client = TestClient(app)
+
+    responses = []
+    with client:
+        first = threading.Thread(target=lambda: responses.append(client.post("/bulletin/qrcode", json=request)))
+        first.start()
+        while not saved:
+            time.sleep(0.001)
+        retry = threading.Thread(target=lambda: responses.append(client.post("/bulletin/qrcode", json=request)))
+        retry.start()
+        while not store.stats()["coalesced"]:
+            time.sleep(0.001)
+        release.set()
+        first.join()
+        retry.join()
+        responses.append(client.post("/bulletin/qrcode", json=request))
+
+    assert len(saved) == 1
+    assert [response.status_code for response in responses] == [201, 201, 201]
+    assert {response.json()["urn"] for response in responses} == {1}
+    assert sorted(response.headers.get("Idempotent-Replayed", "") for response in responses) == ["", "true", "true"]
+
+    headers = {"Idempotency-Key": "scan-7"}
+    assert client.post("/bulletin/qrcode", json=request, headers=headers).status_code == 201
+    request["bulletin"]["content"] = generate_bulletin(seed=52, parties=2, candidates=3)[0]
+    assert client.post("/bulletin/qrcode", json=request, headers=headers).status_code == 422
+    assert client.post("/bulletin/qrcode", json=request, headers={"Idempotency-Key": "k" * 256}).status_code == 400
+    assert len(saved) == 2
+
+
+def test_buffered_parts_are_not_replayed_under_derived_keys(store, monkeypatch):
+    saved = []
+
+    def save_bulletin_qr_code(evaluator, bulletin, trace=None):
+        saved.append(bulletin.content)
+        return BulletinProgress(phone_number=evaluator.phone_number, total_parts=2, received_parts=[1])
+    monkeypatch.setattr(routes, "save_bulletin_qr_code", save_bulletin_qr_code)
+    payload = generate_bulletin(seed=53, parts=2, parties=2, candidates=3)[0]
+    request = {"evaluator": {"id": 1, "phone_number": PHONE_NUMBER}, "bulletin": {"content": payload}}
+    client = TestClient(app)
+
+    responses = [client.post("/bulletin/qrcode", json=request) for _ in range(2)]
+    assert len(saved) == 2 and not any("Idempotent-Replayed" in response.headers for response in responses)
+    headers = {"Idempotency-Key": "scan-8"}
+    responses = [client.post("/bulletin/qrcode", json=request, headers=headers) for _ in range(2)]
+    assert len(saved) == 3 and responses[1].headers["Idempotent-Replayed"] == "true"
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src.settings import app_settings, logger_settings
+from api.src.utils import log_reader
+from api.src.utils.log_reader import build_index, load_index, log_files, search_logs, tail_lines
+
+STARTED = datetime(2026, 10, 1, 8, 0, 0)
+LEVELS = ("INFO", "DEBUG", "WARNING", "ERROR")
+
+
+def _record(second: int) -> str:
+    level = LEVELS[second % len(LEVELS)]
+    line = f"{STARTED + timedelta(seconds=second):%Y-%m-%d %H:%M:%S} | {level} | Scan {second} | qrcode | api.src.routes |  | req-{second}\n"
+    if level == "ERROR":
+        line += f"Traceback (most recent call last):\nValueError: scan {second}\n"
+    return line
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    """
+    Two rotated files, the first one indexed, and the live one: a record per second, 3000 in all
+    """
+    monkeypatch.setattr(logger_settings, "LOGS_DIR", str(tmp_path))
+    monkeypatch.setattr(logger_settings, "LOG_READ_BLOCK_BYTES", 512)
+    files = ["application.2026-10-01_08-00-00_000000.log", "application.2026-10-01_08-16-40_000000.log", "application.log"]
+    records = [_record(second) for second in range(3000)]
+    for number, name in enumerate(files):
+        (tmp_path / name).write_text("".join(records[number * 1000:(number + 1) * 1000]))
+    build_index(str(tmp_path / files[0]), interval=4096)
+    return records
+
+
+def test_tail_reads_lines_backwards(tmp_path):
+    path = tmp_path / "tail.log"
+    path.write_text("")
+    assert tail_lines(str(path), 3) == []
+    lines = [f"line {number} " + "x" * (number % 700) for number in range(500)]
+    path.write_text("\n".join(lines) + "\n")
+    for block_size in (16, 512, 1 << 20):
+        assert tail_lines(str(path), 7, block_size) == lines[-7:]
+    path.write_text("\n".join(lines))  # No newline at the end
+    assert tail_lines(str(path), 1000, 64) == lines
+
+
+def test_search_skips_files_and_seeks_to_the_time_range(logs, monkeypatch):
+    bisected = []
+    bisect_offset = log_reader._bisect_offset
+    monkeypatch.setattr(log_reader, "_bisect_offset", lambda *args: bisected.append(args[2]) or bisect_offset(*args))
+
+    first, _, live = log_files()
+    assert log_files()[-1].endswith("application.log")
+    assert load_index(first)["entries"][0] == [0, "2026-10-01 08:00:00"]
+
+    start, end = STARTED + timedelta(seconds=950), STARTED + timedelta(seconds=2100)
+    found = list(search_logs(start=start, end=end, level="error"))
+    assert found == [record for record in logs[950:2101] if " | ERROR | " in record]
+    assert len(bisected) == 2  # The unindexed files, the indexed one is read from its index
+
+    assert list(search_logs(contains="req-2999")) == [logs[2999]]
+    assert list(search_logs(start=STARTED + timedelta(seconds=2500), limit=3)) == logs[2500:2503]
+    assert list(search_logs(end=STARTED - timedelta(seconds=1))) == []
+
+
+def test_admin_endpoints_stream_the_logs(logs):
+    client = TestClient(app)
+    headers = {"X-Security-Token": app_settings.SECURITY_TOKEN}
+    assert client.get("/admin/logs/tail").status_code == 401
+
+    response = client.get("/admin/logs/tail", params={"lines": 2}, headers=headers)
+    assert response.json() == logs[-1].splitlines()[-2:]
+    response = client.get("/admin/logs/search", headers=headers, params={
+        "start": "2026-10-01T08:33:00", "end": "2026-10-01T08:33:05", "contains": "Scan",
+    })
+    assert response.text == "".join(logs[1980:1986])
+    assert client.get("/admin/logs/search", headers=headers, params={"start": "2026-10-02T00:00:00", "end": "2026-10-01T00:00:00"}).status_code == 400
@@ -0,0 +1,132 @@
+"""
+Request id propagation, the production logging profile, and its overhead against the debug one.
+
+The benchmark logs the calls a scan request makes (route and handler loggers, their DEBUG
+messages and the sampled info one) and a logged exception a few frames deep, in each profile.
+
+    BU_LOGGING_REQUESTS=2000    requests logged per profile
+"""
+import os
+import re
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src.logger import LoggerHandler, get_logger, logger, sampled
+from api.src.settings import app_settings, logger_settings
+from bu_corpus import PHONE_NUMBER
+
+REQUESTS = int(os.environ.get("BU_LOGGING_REQUESTS", 2000))
+EXCEPTIONS = REQUESTS // 10
+TOKEN = {"X-Security-Token": app_settings.SECURITY_TOKEN}
+
+
+@pytest.fixture
+def profile(monkeypatch):
+    """
+    Switch the logging profile, the handlers of the settings in place are restored after the test
+    """
+    handler = LoggerHandler()
+
+    def switch(name: str):
+        monkeypatch.setattr(logger_settings, "LOG_PROFILE", name)
+        handler.configure()
+    yield switch
+    monkeypatch.undo()
+    handler.configure()
+
+
+@pytest.fixture
+def records():
+    captured = []
+    handler_id = logger.add(lambda message: captured.append(message.record), level="DEBUG")
+    yield captured
+    logger.remove(handler_id)
+
+
+class Formatted:
+    def __init__(self):
+        self.count = 0
+
+    def __format__(self, spec):
+        self.count += 1
+        return "formatted"
+
+
+def test_the_request_id_is_set_once_per_request(records):
+    client = TestClient(app)
+    response = client.get("/debug/parser/trace/unknown", headers={"X-Request-ID": "scan-42", **TOKEN})
+    assert response.headers["X-Request-ID"] == "scan-42"
+    assert {record["extra"]["request_id"] for record in records} == {"scan-42"}
+
+    records.clear()
+    response = client.get("/debug/parser/trace/unknown", headers=TOKEN)
+    assert re.fullmatch(r"[0-9a-f]{32}", response.headers["X-Request-ID"])
+    assert {record["extra"]["request_id"] for record in records} == {response.headers["X-Request-ID"]}
+
+
+def test_production_profile_never_formats_debug_messages(profile, monkeypatch):
+    profile("production")
+    value = Formatted()
+    with get_logger(task="test") as bound:
+        bound.debug("Scan {}", value)
+        bound.info("Scan {}", value)
+    assert value.count == 1
+
+    monkeypatch.setattr(logger_settings, "LOG_INFO_SAMPLE_RATE", 0.0)
+    assert not any(sampled() for _ in range(100))
+    monkeypatch.setattr(logger_settings, "LOG_INFO_SAMPLE_RATE", None)
+    assert logger_settings.info_sample_rate == 0.1 and not logger_settings.diagnose
+
+
+def _log_request():
+    with get_logger(task="qrcode") as route_logger:
+        route_logger.debug("Bulletin QR code creation requested...")
+        route_logger.debug("Phone number: {} is creating a bulletin...", PHONE_NUMBER)
+        with get_logger(task="application") as handler_logger:
+            handler_logger.debug("Bulletin QR code saving requested...")
+            if sampled():
+                handler_logger.info("Bulletin QR code saved successfully.")
+
+
+def _fail(depth: int, payload: str):
+    parts = payload.split()
+    if depth:
+        _fail(depth - 1, payload)
+    raise ValueError(f"Campo inválido no boletim: {parts[0]}")
+
+
+def _log_exception():
+    with get_logger(task="application") as handler_logger:
+        try:
+            _fail(5, "QRBU:1:1 VRQR:1.5 VRCH:20240123")
+        except ValueError:
+            handler_logger.exception("Bulletin QR code saving failed")
+
+
+def _per_call_us(function, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    logger.complete()  # Wait for the file handler queue
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+@pytest.mark.benchmark
+def test_production_profile_logs_with_less_overhead(profile, logging_results):
+    results = {}
+    for name in ("debug", "production"):
+        profile(name)
+        _per_call_us(_log_request, REQUESTS // 10)  # Warm up
+        results[name] = (_per_call_us(_log_request, REQUESTS), _per_call_us(_log_exception, EXCEPTIONS))
+        logging_results.append({
+            "name": name,
+            "requests": REQUESTS,
+            "us_per_request": results[name][0],
+            "us_per_exception": results[name][1],
+        })
+
+    assert results["production"][0] < results["debug"][0]
+    assert results["production"][1] < results["debug"][1]
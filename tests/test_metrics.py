@@ -0,0 +1,82 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src.handlers import save_bulletin_qr_code
+from api.src.schemas import BulletinQrCode, EvaluatorPublic
+from api.src.settings import app_settings
+from api.src.utils.bu_parser import BulletinUrnaParser
+from api.src.utils.metrics import Histogram, get_metrics_registry
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+TOKEN = {"X-Security-Token": app_settings.SECURITY_TOKEN}
+
+
+@pytest.fixture
+def metrics():
+    registry = get_metrics_registry()
+    registry.reset()
+    yield registry
+    registry.reset()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("scan_seconds", "Scan time.", (0.1, 1), ("route",))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, '/a"b')
+
+    assert histogram.render() == [
+        "# HELP scan_seconds Scan time.",
+        "# TYPE scan_seconds histogram",
+        'scan_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+        'scan_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        'scan_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'scan_seconds_sum{route="/a\\"b"} 3.65',
+        'scan_seconds_count{route="/a\\"b"} 4',
+    ]
+
+
+def test_parser_stages_are_timed(metrics):
+    parser = BulletinUrnaParser(PHONE_NUMBER)
+    parser.execute_parts(generate_bulletin(seed=7, parts=2, parties=3, candidates=4))
+    stages = parser.stage_timings()
+    metrics.observe_parser_stages(stages)
+
+    assert set(stages) == {"header", "metadata", "details", "voting", "position", "party", "candidate", "summary", "security"}
+    for stage, (seconds, tokens) in stages.items():
+        assert seconds > 0 and tokens == parser.counters[stage][1]
+        assert metrics.parser_stages.count(stage) == 1
+        assert metrics.parser_tokens.value(stage) == tokens
+
+
+def test_requests_and_database_are_measured(database, metrics):
+    payload, = generate_bulletin(seed=8, parties=2, candidates=3)
+    save_bulletin_qr_code(EvaluatorPublic(id=1, phone_number=PHONE_NUMBER), BulletinQrCode(content=payload))
+    assert metrics.session_acquire.count() > 0
+    assert metrics.session_commit.count() > 0
+    assert metrics.pool_checkouts.value("sync") > 0
+
+    client = TestClient(app)
+    assert client.get("/debug/parser/trace/unknown", headers=TOKEN).status_code == 404
+    assert client.get("/not-a-route").status_code == 404
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_request_duration_seconds_count{method="GET",route="/debug/parser/trace/{trace_id}",status="404"} 1' in response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1' in response.text
+    assert 'bu_parser_stage_duration_seconds_count{stage="candidate"} 1' in response.text
+    assert 'db_pool_checked_out{engine="sync"}' in response.text
+
+
+@pytest.mark.parametrize("path", [
+    "/debug/parser/trace/unknown",
+    "/debug/cache/evaluators",
+    "/debug/idempotency",
+    "/debug/evaluator-locks",
+    "/debug/write-behind",
+])
+def test_debug_routes_require_the_security_token(path):
+    client = TestClient(app)
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"X-Security-Token": "wrong"}).status_code == 401
+    assert client.get(path, headers=TOKEN).status_code in (200, 404)
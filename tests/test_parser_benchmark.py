@@ -0,0 +1,214 @@
+"""
+Throughput benchmarks for BulletinUrnaParser.execute and execute_parts.
+
+Each workload is timed and compared to tests/benchmark_baseline.json. Timings are
+normalized by a fixed pure-Python calibration loop, timed in rounds interleaved with
+the workload, so a baseline recorded on one machine stays meaningful on another.
+A workload fails when it gets slower, or uses more memory, than its baseline by more
+than the tolerance of the measure: a loose one for the calibrated time, a tight one for
+the memory, which tracemalloc measures the same on every run. Memory is measured both at
+its peak, output included, and as the parser state held once the tokens of a scan are
+read, before it is assembled.
+
+    BU_BENCHMARK_UPDATE=1              rewrite the baseline with the current measurements
+    BU_BENCHMARK_TOLERANCE=0.5         allowed time regression ratio (default from the baseline file)
+    BU_BENCHMARK_MEMORY_TOLERANCE=0.15 allowed memory regression ratio (default from the baseline file)
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from api.src.schemas import BoletimUrna
+from api.src.utils.bu_parser import BulletinUrnaParser
+from bu_corpus import PHONE_NUMBER, load_corpus
+from synthetic_bu import generate_bulletin
+
+BASELINE_PATH = Path(__file__).parent / "benchmark_baseline.json"
+ROUNDS = 9
+MIN_ROUND_SECONDS = 0.05
+
+
+def _corpus_payloads(name: str) -> list:
+    entry = next(entry for entry in load_corpus() if entry["name"] == name)
+    return [part["qrcode"] for part in entry["parts"]]
+
+
+WORKLOADS = {
+    "corpus_small": lambda: _corpus_payloads("bu_small"),
+    "corpus_large_4_parts": lambda: _corpus_payloads("bu_big"),
+    "synthetic_small_10x40": lambda: generate_bulletin(seed=101, parties=10, candidates=40),
+    "synthetic_large_4x30x60": lambda: generate_bulletin(seed=102, parts=4, parties=30, candidates=60),
+    "synthetic_large_4x30x60_one_pass": lambda: generate_bulletin(seed=102, parts=4, parties=30, candidates=60),
+}
+# Parsed in one pass with execute_parts, as the handlers parse a bulletin once every part is received
+ONE_PASS = {"synthetic_large_4x30x60_one_pass"}
+
+
+def _prepare(payloads: list) -> list:
+    """
+    Pair each payload with the bulletin of the previous part it resumes from, so only parsing is timed
+    """
+    steps, last_bulletin = [], None
+    for payload in payloads:
+        steps.append((payload, last_bulletin))
+        last_bulletin = _execute(payload, last_bulletin)
+    return steps
+
+
+def _parser(last_bulletin: BoletimUrna | None) -> BulletinUrnaParser:
+    return BulletinUrnaParser(PHONE_NUMBER, last_bulletin=last_bulletin)
+
+
+def _execute(payload: str | list, last_bulletin: BoletimUrna | None) -> BoletimUrna:
+    if isinstance(payload, list):
+        return _parser(last_bulletin).execute_parts(payload)
+    return _parser(last_bulletin).execute(payload)
+
+
+def _iterations(function) -> int:
+    """
+    Number of calls making a timing round last at least MIN_ROUND_SECONDS
+    """
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        if time.perf_counter() - started >= MIN_ROUND_SECONDS:
+            return iterations
+        iterations *= 2
+
+
+def _time_per_iteration(*functions) -> list:
+    """
+    Best mean time (seconds) of a call of each function, over rounds interleaved so
+    that every function sees the same machine load. The garbage collector is paused,
+    as in timeit, so a collection does not land on some rounds only.
+    """
+    iterations = [_iterations(function) for function in functions]
+    best = [float("inf")] * len(functions)
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(ROUNDS):
+            for index, (function, count) in enumerate(zip(functions, iterations)):
+                started = time.perf_counter()
+                for _ in range(count):
+                    function()
+                best[index] = min(best[index], (time.perf_counter() - started) / count)
+    finally:
+        gc.enable()
+    return best
+
+
+def _calibration_loop():
+    tokens = [f"{91000 + i}:{i % 7}" for i in range(2000)]
+    totals = {}
+    for token in tokens:
+        key, value = token.split(":")
+        totals[key] = totals.get(key, 0) + int(value)
+    return totals
+
+
+def _peak_memory(function) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _state_memory(steps: list) -> int:
+    """
+    Largest memory held by the parser after reading the tokens of a scan, before assembling the bulletin
+    """
+    held = 0
+    for payload, last_bulletin in steps:
+        parser = _parser(last_bulletin)
+        tokens = None if isinstance(payload, list) else payload.split()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            if tokens is None:
+                parser._assemble = lambda: None  # Stops once every part is read
+                parser.execute_parts(payload)
+            else:
+                parser._run(tokens)
+            held = max(held, tracemalloc.get_traced_memory()[0])
+        finally:
+            tracemalloc.stop()
+    return held
+
+
+def _load_baseline() -> dict:
+    if BASELINE_PATH.exists():
+        return json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    return {"tolerance": {"time": 0.5, "memory": 0.15}, "workloads": {}}
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    data = _load_baseline()
+    yield data
+    if os.environ.get("BU_BENCHMARK_UPDATE"):
+        BASELINE_PATH.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name", list(WORKLOADS))
+def test_parser_throughput(name, baseline, benchmark_results):
+    payloads = WORKLOADS[name]()
+    steps = [(payloads, None)] if name in ONE_PASS else _prepare(payloads)
+    tokens = sum(len(payload.split()) for payload in payloads)
+
+    def run():
+        for payload, last_bulletin in steps:
+            _execute(payload, last_bulletin)
+
+    calibration, seconds = _time_per_iteration(_calibration_loop, run)
+    result = {
+        "name": name,
+        "scans": len(payloads),
+        "tokens": tokens,
+        "us_per_scan": seconds * 1e6 / len(payloads),
+        "tokens_per_sec": tokens / seconds,
+        "peak_kib": _peak_memory(run) / 1024,
+        "state_kib": _state_memory(steps) / 1024,
+    }
+    benchmark_results.append(result)
+
+    if os.environ.get("BU_BENCHMARK_UPDATE"):
+        baseline["workloads"][name] = {
+            "us_per_scan": round(result["us_per_scan"], 2),
+            "calibration_us": round(calibration * 1e6, 2),
+            "peak_kib": round(result["peak_kib"], 1),
+            "state_kib": round(result["state_kib"], 1),
+        }
+        return
+
+    reference = baseline["workloads"].get(name)
+    if not reference or not reference.get("calibration_us"):
+        pytest.skip(f"No baseline for {name}, run with BU_BENCHMARK_UPDATE=1 to record it")
+    tolerance = float(os.environ.get("BU_BENCHMARK_TOLERANCE", baseline["tolerance"]["time"]))
+    memory_tolerance = float(os.environ.get("BU_BENCHMARK_MEMORY_TOLERANCE", baseline["tolerance"]["memory"]))
+    speed_ratio = calibration * 1e6 / reference["calibration_us"]
+    expected_us = reference["us_per_scan"] * speed_ratio
+    result["baseline_us"] = expected_us
+
+    assert result["us_per_scan"] <= expected_us * (1 + tolerance), (
+        f"{name}: {result['us_per_scan']:.1f} us/scan, baseline {expected_us:.1f} us/scan (+{tolerance:.0%} allowed)"
+    )
+    assert result["peak_kib"] <= reference["peak_kib"] * (1 + memory_tolerance), (
+        f"{name}: peak {result['peak_kib']:.1f} KiB, baseline {reference['peak_kib']:.1f} KiB (+{memory_tolerance:.0%} allowed)"
+    )
+    if reference.get("state_kib"):
+        assert result["state_kib"] <= reference["state_kib"] * (1 + memory_tolerance), (
+            f"{name}: parser state {result['state_kib']:.1f} KiB, baseline {reference['state_kib']:.1f} KiB (+{memory_tolerance:.0%} allowed)"
+        )
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from bu_corpus import load_corpus, parse_parts
+from synthetic_bu import generate_bulletin
+
+CORPUS = load_corpus()
+
+
+@pytest.mark.parametrize("entry", CORPUS, ids=[entry["name"] for entry in CORPUS])
+def test_parser_matches_golden_output(entry):
+    results = parse_parts([part["qrcode"] for part in entry["parts"]])
+    for part, result in zip(entry["parts"], results):
+        assert json.loads(result.model_dump_json()) == part["expected"]
+
+
+@pytest.mark.parametrize("entry", [e for e in CORPUS if e["generator"]], ids=lambda e: e["name"])
+def test_synthetic_generator_is_deterministic(entry):
+    assert generate_bulletin(**entry["generator"]) == [part["qrcode"] for part in entry["parts"]]
+
+
+def test_synthetic_large_bulletin_is_split_in_parts():
+    payloads = generate_bulletin(seed=7, parts=5, parties=10, candidates=20)
+    assert [payload.split()[0] for payload in payloads] == [f"QRBU:{i}:5" for i in range(1, 6)]
+    assert all(payload.split()[-1].startswith("ASSI:") == (i == 5) for i, payload in enumerate(payloads, 1))
+
+    bulletin = parse_parts(payloads)[-1]
+    assert bulletin.type == "large"
+    assert bulletin.finished
+
+
+def test_synthetic_small_bulletin_counts():
+    payload, = generate_bulletin(seed=11, positions=(13, 11), parties=5, candidates=12)
+    bulletin = parse_parts([payload])[0]
+    proportional, majoritarian = bulletin.content.voting.position
+    assert [position.CARG for position in bulletin.content.voting.position] == [13, 11]
+    assert [len(party.candidates) for party in proportional.party] == [12] * 5
+    assert len(majoritarian.party[0].candidates) == 5
+    assert bulletin.finished
+
+
+def test_repeated_position_is_replaced_at_the_end():
+    payload, = generate_bulletin(seed=3, positions=(13, 11, 13), parties=40, candidates=2)
+    bulletin = parse_parts([payload])[0]
+    assert [position.CARG for position in bulletin.content.voting.position] == [11, 13]
+    proportional = bulletin.content.voting.position[1]
+    assert len(proportional.party) == 40
+    assert all(str(party.PART) == next(iter(party.candidates))[:2] for party in proportional.party)
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from api.src.settings import app_settings
+from api.src.utils.parser_pool import ParserPool
+from bu_corpus import PHONE_NUMBER, load_corpus
+from synthetic_bu import generate_bulletin
+
+CORPUS = {entry["name"]: entry for entry in load_corpus()}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(app_settings, "BATCH_POOL_SIZE", 2)
+    pool = ParserPool()
+    yield pool
+    pool.shutdown()
+
+
+def test_parse_many_keeps_order_and_reports_errors(pool):
+    small = [part["qrcode"] for part in CORPUS["bu_small"]["parts"]]
+    multi_position = CORPUS["synthetic_multi_position"]["parts"]
+    bulletins = [small, ["QRBU:1:1 BROKEN"], [part["qrcode"] for part in multi_position]]
+    bulletins += [generate_bulletin(seed=seed, parties=3, candidates=5) for seed in range(8)]
+
+    results = pool.parse_many(PHONE_NUMBER, bulletins)
+
+    assert len(results) == len(bulletins)
+    assert json.loads(results[0][0].model_dump_json()) == CORPUS["bu_small"]["parts"][0]["expected"]
+    assert results[1] == (None, "Campo inválido no boletim: BROKEN")
+    assert json.loads(results[2][0].model_dump_json()) == multi_position[-1]["expected"]
+    assert all(bulletin.finished and error is None for bulletin, error in results[3:])
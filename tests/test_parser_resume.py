@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from api.src.utils.bu_parser import BulletinUrnaParser
+from bu_corpus import PHONE_NUMBER, load_corpus, parse_parts
+from synthetic_bu import generate_bulletin
+
+LARGE = [entry for entry in load_corpus() if len(entry["parts"]) > 1]
+
+
+def _dump(bulletin) -> dict:
+    return json.loads(bulletin.model_dump_json())
+
+
+@pytest.mark.parametrize("payloads", [
+    *[[part["qrcode"] for part in entry["parts"]] for entry in LARGE],
+    generate_bulletin(seed=23, parts=6, positions=(13, 11, 13), parties=12, candidates=25),
+], ids=[entry["name"] for entry in LARGE] + ["synthetic_6_parts"])
+def test_resumed_parts_match_single_pass_parsing(payloads):
+    expected = _dump(BulletinUrnaParser(PHONE_NUMBER).execute_parts(payloads))
+    assert _dump(parse_parts(payloads)[-1]) == expected
+
+
+def test_resume_errors():
+    first, second, third = generate_bulletin(seed=24, parts=3, parties=8, candidates=30)
+    last_bulletin = BulletinUrnaParser(PHONE_NUMBER).execute(first)
+
+    with pytest.raises(ValueError, match="esperado 2, recebeu 3"):
+        BulletinUrnaParser(PHONE_NUMBER, last_bulletin=last_bulletin).execute(third)
+    with pytest.raises(ValueError, match="Parte 1 do boletim não encontrada"):
+        BulletinUrnaParser(PHONE_NUMBER).execute(second)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src import handlers
+from api.src.settings import app_settings
+from api.src.utils.bu_parser import MAX_TOKEN_LENGTH, BulletinUrnaParser
+from api.src.utils.evaluator_locks import EvaluatorBusy
+from api.src.utils.qr_stream import read_lines
+from bu_corpus import PHONE_NUMBER, load_corpus, parse_parts
+from synthetic_bu import generate_bulletin
+
+CORPUS = load_corpus()
+
+
+def _dump(bulletin) -> dict:
+    return json.loads(bulletin.model_dump_json())
+
+
+def _chunks(text: str, rng: random.Random):
+    start = 0
+    while start < len(text):
+        size = rng.choice([1, 2, 7, 64, 1000])
+        yield text[start:start + size]
+        start += size
+
+
+def _feed_parts(payloads, rng):
+    results = []
+    for payload in payloads:
+        parser = BulletinUrnaParser(PHONE_NUMBER, last_bulletin=results[-1] if results else None)
+        for chunk in _chunks(payload, rng):
+            parser.feed(chunk)
+        results.append(parser.close())
+    return results
+
+
+@pytest.mark.parametrize("payloads", [
+    *[[part["qrcode"] for part in entry["parts"]] for entry in CORPUS],
+    generate_bulletin(seed=31, parties=10, candidates=40),
+    generate_bulletin(seed=32, parts=4, positions=(13, 11), parties=8, candidates=20),
+], ids=[entry["name"] for entry in CORPUS] + ["synthetic_small", "synthetic_4_parts"])
+def test_chunked_feed_matches_execute(payloads):
+    rng = random.Random(len(payloads[0]))
+    expected = [_dump(bulletin) for bulletin in parse_parts(payloads)]
+    assert [_dump(bulletin) for bulletin in _feed_parts(payloads, rng)] == expected
+
+
+def test_feed_buffers_a_single_token():
+    payload, = generate_bulletin(seed=33, parties=2, candidates=3)
+    parser = BulletinUrnaParser(PHONE_NUMBER)
+    parser.feed(payload[:len(payload) // 2])
+    assert len(parser._tail) < 64 and parser._pending is not None
+    parser.feed(payload[len(payload) // 2:])
+    assert _dump(parser.close()) == _dump(BulletinUrnaParser(PHONE_NUMBER).execute(payload))
+
+    with pytest.raises(ValueError, match="excede"):
+        BulletinUrnaParser(PHONE_NUMBER).feed(payload[:20] + "x" * (MAX_TOKEN_LENGTH + 1))
+
+
+def _read_lines(chunks, max_length: int) -> list:
+    async def iterate():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [line async for line in read_lines(iterate(), max_length)]
+    return asyncio.run(collect())
+
+
+def test_read_lines_skips_oversized_lines():
+    # Oversized lines arriving whole inside a chunk, or spread over several
+    assert _read_lines([b"ab\n" + b"x" * 9 + b"\ncd\n\n"], 8) == [b"ab", None, b"cd"]
+    assert _read_lines([b"ab\nxxxxx", b"xxxxx", b"x\ncd", b"\nyyyyyyyyy"], 8) == [b"ab", None, b"cd", None]
+    assert _read_lines([b"12345678", b"\n"], 8) == [b"12345678"]
+
+
+def test_stream_route_saves_every_line(file_database, monkeypatch):
+    monkeypatch.setattr(app_settings, "BATCH_MAX_ITEMS", 2)
+    single = [generate_bulletin(seed=seed, parties=2, candidates=3)[0] for seed in (34, 35)]
+    large = generate_bulletin(seed=36, parts=2, parties=3, candidates=4)
+    lines = [json.dumps({"content": single[0]}), json.dumps(single[1]), "{not json", *map(json.dumps, large), json.dumps(single[0])]
+    body = ("\n".join(lines) + "\n").encode()
+    client = TestClient(app)
+
+    response = client.post("/bulletin/qrcode/stream", params={"phone_number": PHONE_NUMBER, "id": 1},
+                           content=(body[start:start + 100] for start in range(0, len(body), 100)),
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 201
+    result = response.json()
+    assert [item["index"] for item in result["items"]] == list(range(6))
+    assert [item["status"] for item in result["items"]] == ["stored", "stored", "error", "buffered", "stored", "duplicate"]
+    assert "NDJSON" in result["items"][2]["error"]
+    assert (result["stored"], result["failed"]) == (3, 1)
+
+    text = "\n\n" + generate_bulletin(seed=37, parties=2, candidates=3)[0] + "\n" + "x" * (app_settings.batch_max_line_bytes + 1)
+    response = client.post("/bulletin/qrcode/stream", params={"phone_number": PHONE_NUMBER, "id": 1},
+                           content=text.encode(), headers={"Content-Type": "text/plain"})
+    assert [item["status"] for item in response.json()["items"]] == ["stored", "error"]
+    response = client.post("/bulletin/qrcode/stream", params={"phone_number": PHONE_NUMBER, "id": 1, "format": "csv"}, content=b"")
+    assert response.status_code == 400
+
+
+def test_stream_reports_the_batches_stored_before_a_failure(file_database, monkeypatch):
+    monkeypatch.setattr(app_settings, "BATCH_MAX_ITEMS", 2)
+    save_batch, calls = handlers.save_bulletin_qr_code_batch, []
+
+    def busy_after_first_batch(evaluator, bulletins):
+        calls.append(len(bulletins))
+        if len(calls) > 1:
+            raise EvaluatorBusy()
+        return save_batch(evaluator, bulletins)
+    monkeypatch.setattr(handlers, "save_bulletin_qr_code_batch", busy_after_first_batch)
+    payloads = [generate_bulletin(seed=seed, parties=2, candidates=3)[0] for seed in range(40, 45)]
+
+    response = TestClient(app).post("/bulletin/qrcode/stream", params={"phone_number": PHONE_NUMBER, "id": 1},
+                                    content="\n".join(payloads).encode(), headers={"Content-Type": "text/plain"})
+    assert response.status_code == 201 and calls == [2, 2]
+    result = response.json()
+    assert [item["status"] for item in result["items"]] == ["stored"] * 2 + ["error"] * 3
+    assert result["items"][4]["error"] == str(EvaluatorBusy())
+    assert (result["stored"], result["failed"]) == (2, 3)
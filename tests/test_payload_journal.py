@@ -0,0 +1,90 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import select, update
+
+from api.src.handlers import reprocess_journal, save_bulletin_qr_code
+from api.src.models import BoletimUrnaModel, BuSectionModel
+from api.src.schemas import BulletinQrCode, EvaluatorPublic
+from api.src.settings import journal_settings
+from api.src.utils import payload_journal
+from api.src.utils.payload_journal import SegmentError, get_payload_journal, journal_records, journal_segments, read_segment
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+EVALUATOR = EvaluatorPublic(id=1, phone_number=PHONE_NUMBER)
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    get_payload_journal().close()
+    monkeypatch.setattr(journal_settings, "JOURNAL_DIR", str(tmp_path))
+    yield get_payload_journal()
+    get_payload_journal().close()
+
+
+def test_records_are_read_back_until_a_torn_tail(journal):
+    bulletins = [generate_bulletin(seed=seed, parts=2) for seed in range(3)]
+    for payloads in bulletins:
+        journal.append(PHONE_NUMBER, payloads)
+    journal.close()
+
+    path, = journal_segments()
+    assert [record.payloads for record in read_segment(path)] == bulletins
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 10)
+    errors = []
+    assert [record.payloads for record in journal_records(errors=errors)] == bulletins[:2]
+    assert "truncated record" in errors[0] or "corrupted record" in errors[0]
+    with pytest.raises(SegmentError):
+        list(read_segment(path))
+
+
+def test_segments_roll_over(journal, monkeypatch):
+    monkeypatch.setattr(journal_settings, "JOURNAL_SEGMENT_BYTES", 4096)
+    payload, = generate_bulletin(seed=1, parties=2, candidates=3)
+    for index in range(20):
+        journal.append(f"5586{index:09d}", [payload])
+    journal.close()
+
+    assert [record.phone_number for record in journal_records()] == [f"5586{index:09d}" for index in range(20)]
+    assert len(journal_segments()) > 1
+    assert all(os.path.getsize(path) <= 4096 for path in journal_segments())
+
+
+def test_concurrent_appends_share_fsyncs(journal, monkeypatch):
+    fsyncs = []
+
+    def slow_fsync(descriptor):
+        fsyncs.append(descriptor)
+        time.sleep(0.005)
+    monkeypatch.setattr(payload_journal.os, "fsync", slow_fsync)
+    payload, = generate_bulletin(seed=1, parties=2, candidates=3)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda index: journal.append(f"5586{index:09d}", [payload]), range(200)))
+    journal.close()
+
+    assert sorted(record.phone_number for record in journal_records()) == [f"5586{index:09d}" for index in range(200)]
+    assert len(fsyncs) < 100
+
+
+def test_reprocess_rewrites_the_stored_bulletins(database, journal):
+    scans = [generate_bulletin(seed=seed, parties=2, candidates=3) for seed in (31, 32)]
+    for payloads in scans:
+        save_bulletin_qr_code(EVALUATOR, BulletinQrCode(content=payloads[0]))
+    save_bulletin_qr_code(EVALUATOR, BulletinQrCode(content=scans[0][0]))  # Duplicate, not journaled again
+    with database.get_session() as session:
+        expected = session.execute(select(BoletimUrnaModel.id, BoletimUrnaModel.document).order_by(BoletimUrnaModel.id)).all()
+        session.execute(update(BoletimUrnaModel).values(document="{}", etag="stale"))
+        session.execute(update(BuSectionModel).values(COMP=-1))
+        session.commit()
+    journal.close()
+
+    result = reprocess_journal(workers=1, chunk_size=1)
+    assert (result.records, result.updated, result.unmatched, result.failed) == (2, 2, 0, 0)
+    with database.get_session() as session:
+        assert session.execute(select(BoletimUrnaModel.id, BoletimUrnaModel.document).order_by(BoletimUrnaModel.id)).all() == expected
+        assert -1 not in session.scalars(select(BuSectionModel.COMP)).all()
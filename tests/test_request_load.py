@@ -0,0 +1,110 @@
+"""
+Load test of the request path in the sync (threadpool) and async (DB_ASYNC) modes.
+
+Concurrent logins are sent in-process through httpx to a sqlite file where every
+evaluator lookup waits LATENCY_MS inside the database, standing in for the round trip
+to a remote database. In the sync mode each waiting request holds one of Starlette's
+threadpool slots (40 by default); in the async mode it only holds a pooled connection.
+The async mode pays more CPU per request, so its gain shows once requests mostly wait
+on the database, as they do behind a remote database under load.
+
+    BU_LOAD_REQUESTS=400      requests sent per mode
+    BU_LOAD_CONCURRENCY=200   requests in flight at once
+    BU_LOAD_LATENCY_MS=200    time each evaluator lookup waits in the database
+"""
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from api.main import app
+from api.src.database import get_database_interface
+from api.src.settings import database_settings, evaluator_cache_settings
+from bu_corpus import PHONE_NUMBER
+
+REQUESTS = int(os.environ.get("BU_LOAD_REQUESTS", 400))
+CONCURRENCY = int(os.environ.get("BU_LOAD_CONCURRENCY", 200))
+LATENCY_MS = int(os.environ.get("BU_LOAD_LATENCY_MS", 200))
+POOL_SIZE = 100
+
+
+def _sleep_ms(milliseconds: int) -> int:
+    time.sleep(milliseconds / 1000)
+    return 0
+
+
+@pytest.fixture
+def slow_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_settings, "DB_OVERRIDE_URL", f"sqlite:///{tmp_path / 'load.db'}")
+    monkeypatch.setattr(database_settings, "DB_POOL_SIZE", POOL_SIZE)
+    monkeypatch.setattr(database_settings, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(database_settings, "DB_ASYNC", True)
+    monkeypatch.setattr(evaluator_cache_settings, "EVALUATOR_CACHE_MAX_ENTRIES", 0)  # Every login goes to the database
+    interface = get_database_interface()
+    interface.create_engines()
+
+    @event.listens_for(interface.engine, "connect")
+    def register_sync(dbapi_connection, _):
+        dbapi_connection.create_function("sleep_ms", 1, _sleep_ms)
+
+    @event.listens_for(interface.async_engine.sync_engine, "connect")
+    def register_async(dbapi_connection, _):
+        dbapi_connection.run_async(lambda connection: connection.create_function("sleep_ms", 1, _sleep_ms))
+
+    interface.engine.dispose()
+    with interface.engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE evaluator_rows (id INTEGER PRIMARY KEY, phone_number TEXT)")
+        connection.exec_driver_sql(
+            f"CREATE VIEW evaluator AS SELECT id, phone_number FROM evaluator_rows WHERE sleep_ms({LATENCY_MS}) = 0"
+        )
+        connection.exec_driver_sql("INSERT INTO evaluator_rows VALUES (1, ?)", (PHONE_NUMBER,))
+    yield interface
+
+    interface.engine.dispose()
+    asyncio.run(interface.dispose_async())
+    monkeypatch.undo()
+    interface.create_engines()
+
+
+async def _run_load() -> dict:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def login(client):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(f"/evaluator/{PHONE_NUMBER}/login")
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+            assert response.json() == {"id": 1, "phone_number": PHONE_NUMBER}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await asyncio.gather(*(login(client) for _ in range(CONCURRENCY // 10)))  # Warm up the pools
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(login(client) for _ in range(REQUESTS)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": REQUESTS,
+        "concurrency": CONCURRENCY,
+        "requests_per_sec": REQUESTS / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+@pytest.mark.benchmark
+def test_async_mode_serves_more_concurrent_requests(slow_database, monkeypatch, load_results):
+    results = {}
+    for mode in ("sync", "async"):
+        monkeypatch.setattr(database_settings, "DB_ASYNC", mode == "async")
+        results[mode] = {"name": f"login_{mode}_{LATENCY_MS}ms_db", **asyncio.run(_run_load())}
+        load_results.append(results[mode])
+
+    assert results["async"]["requests_per_sec"] > results["sync"]["requests_per_sec"]
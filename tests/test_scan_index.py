@@ -0,0 +1,118 @@
+import re
+
+import pytest
+from sqlalchemy import func, select
+
+from api.src import handlers
+from api.src.handlers import _store_bulletins, save_bulletin_qr_code, save_bulletin_qr_code_batch
+from api.src.models import BoletimUrnaModel, BuScanModel, BuSectionModel
+from api.src.schemas import BatchItemStatus, BulletinQrCode, EvaluatorPublic
+from api.src.utils.parser_pool import parse_bulletin
+from api.src.utils.scan_index import BloomFilter, ScanStatus, get_scan_index, scan_hashes
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+EVALUATORS = [EvaluatorPublic(id=index, phone_number=f"55869999900{index:02d}") for index in range(1, 4)]
+
+
+def _count(session, model) -> int:
+    return session.scalar(select(func.count()).select_from(model))
+
+
+def _qr_codes(payloads):
+    return [BulletinQrCode(content=payload) for payload in payloads]
+
+
+def _no_parsing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("duplicate bulletin parsed again")
+    monkeypatch.setattr(handlers, "parse_bulletin", fail)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = scan_hashes([f"QRBU:1:1 IDUE:{index}" for index in range(1000)])
+    for digest in added:
+        bloom.add(digest)
+    assert all(digest in bloom for digest in added)
+    others = scan_hashes([f"QRBU:1:1 IDUE:{index}" for index in range(1000, 11000)])
+    assert sum(digest in bloom for digest in others) < 300
+
+
+def test_scan_of_another_evaluator_is_acknowledged_without_parsing(database, monkeypatch):
+    payloads = generate_bulletin(seed=21, parts=2, parties=3, candidates=4)
+    for qr_code in _qr_codes(payloads):
+        progress = save_bulletin_qr_code(EVALUATORS[0], qr_code)
+    assert progress.finished and not progress.duplicate
+
+    _no_parsing(monkeypatch)
+    for qr_code in reversed(_qr_codes(payloads)):
+        progress = save_bulletin_qr_code(EVALUATORS[1], qr_code)
+    assert progress.finished and progress.duplicate
+    assert progress.urn == int(re.search(r"IDUE:(\d+)", payloads[0]).group(1))
+    with database.get_session() as session:
+        assert _count(session, BoletimUrnaModel) == 1
+        assert _count(session, BuScanModel) == 2
+
+
+def test_different_content_for_a_section_is_flagged(database):
+    payload, = generate_bulletin(seed=22, parties=3, candidates=4)
+    save_bulletin_qr_code(EVALUATORS[0], BulletinQrCode(content=payload))
+    altered = re.sub(r"COMP:(\d+)", lambda match: f"COMP:{int(match.group(1)) + 1}", payload)
+
+    progress = save_bulletin_qr_code(EVALUATORS[1], BulletinQrCode(content=altered))
+    assert progress.conflict and not progress.duplicate
+    with database.get_session() as session:
+        assert _count(session, BoletimUrnaModel) == 2
+        assert session.scalars(select(BuScanModel.conflict).order_by(BuScanModel.id)).all() == [False, True]
+        # The tally keeps counting the content stored first
+        assert _count(session, BuSectionModel) == 1
+
+
+def test_batch_duplicates_are_found_in_the_batch_and_in_the_database(database):
+    stored, = generate_bulletin(seed=23, parties=2, candidates=3)
+    save_bulletin_qr_code(EVALUATORS[0], BulletinQrCode(content=stored))
+    new, = generate_bulletin(seed=24, parties=2, candidates=3)
+
+    result = save_bulletin_qr_code_batch(EVALUATORS[2], _qr_codes([stored, new, " ".join(new.split(" "))]))
+    assert [item.status for item in result.items] == [BatchItemStatus.DUPLICATE, BatchItemStatus.STORED, BatchItemStatus.DUPLICATE]
+    assert result.stored == 1
+    with database.get_session() as session:
+        assert _count(session, BoletimUrnaModel) == 2
+
+
+def test_scans_missed_by_the_prefilter_are_not_stored_twice(database):
+    payloads = generate_bulletin(seed=25, parties=2, candidates=3)
+    bulletin = parse_bulletin(PHONE_NUMBER, payloads)
+    assert _store_bulletins(PHONE_NUMBER, [bulletin], [scan_hashes(payloads)]) == [ScanStatus.NEW]
+    # Stored by another process: this one's prefilter has not seen it
+    get_scan_index().reset()
+    assert not get_scan_index().might_contain(scan_hashes(payloads))
+
+    assert _store_bulletins(PHONE_NUMBER, [bulletin], [scan_hashes(payloads)]) == [ScanStatus.DUPLICATE]
+    assert get_scan_index().might_contain(scan_hashes(payloads))
+    with database.get_session() as session:
+        assert _count(session, BoletimUrnaModel) == 1
+
+
+def test_scan_index_warms_from_the_database(database):
+    payloads = generate_bulletin(seed=26, parts=2, parties=2, candidates=3)
+    _store_bulletins(PHONE_NUMBER, [parse_bulletin(PHONE_NUMBER, payloads)], [scan_hashes(payloads)])
+    get_scan_index().reset()
+
+    assert get_scan_index().warm() == 2
+    assert get_scan_index().might_contain(scan_hashes(payloads))
+    assert get_scan_index().stats()["scans"] == 2
+
+
+def test_scans_missing_a_section_field_are_not_stored_twice(database):
+    payloads = generate_bulletin(seed=26, parties=2, candidates=3)
+    bulletin = parse_bulletin(PHONE_NUMBER, payloads)
+    bulletin.content.metadata.IDUE = None
+    assert _store_bulletins(PHONE_NUMBER, [bulletin], [scan_hashes(payloads)]) == [ScanStatus.NEW]
+    get_scan_index().reset()
+
+    assert _store_bulletins(PHONE_NUMBER, [bulletin], [scan_hashes(payloads)]) == [ScanStatus.DUPLICATE]
+    with database.get_session() as session:
+        assert _count(session, BoletimUrnaModel) == 1
+        assert set(session.scalars(select(BuScanModel.IDUE))) == {-1}
@@ -0,0 +1,69 @@
+from collections import Counter
+
+from api.src.handlers import _store_bulletins, get_results
+from api.src.utils.parser_pool import parse_bulletin
+from api.src.utils.tally import get_tally_engine
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+
+def _bulletin(seed: int, section_of: int = None):
+    payload, = generate_bulletin(seed=seed, parties=3, candidates=4)
+    if section_of is not None:
+        # Same voting section as the bulletin of another seed, with other votes
+        other, = generate_bulletin(seed=section_of, parties=3, candidates=4)
+        section = {token.split(":")[0]: token for token in other.split() if token.split(":")[0] in ("MUNI", "ZONA", "SECA")}
+        payload = " ".join(section.get(token.split(":")[0], token) for token in payload.split())
+    return parse_bulletin(PHONE_NUMBER, [payload])
+
+
+def _candidate_votes(bulletins, carg: int = 13) -> Counter:
+    votes = Counter()
+    for bulletin in bulletins:
+        position = next(position for position in bulletin.content.voting.position if position.CARG == carg)
+        for party in position.party:
+            votes.update({code: candidate.votes for code, candidate in party.candidates.items()})
+    return +votes
+
+
+def test_results_roll_up_stored_bulletins(database):
+    bulletins = [_bulletin(seed) for seed in range(4)]
+    _store_bulletins(PHONE_NUMBER, bulletins)
+
+    national = get_results(1, 13)
+    assert national.sections == 4
+    assert +Counter(national.candidates) == _candidate_votes(bulletins)
+    assert national.summary["NOMI"] == sum(_candidate_votes(bulletins).values())
+
+    first = bulletins[0].content.metadata
+    municipality = get_results(1, 13, muni=first.MUNI)
+    same_muni = [b for b in bulletins if b.content.metadata.MUNI == first.MUNI]
+    assert municipality.sections == len(same_muni)
+    assert +Counter(municipality.candidates) == _candidate_votes(same_muni)
+    assert get_results(1, 13, uf="ac", zona=first.ZONA).sections >= 1
+    assert get_results(1, 99) is None
+
+
+def test_replaced_bulletin_is_counted_once(database):
+    original, other = _bulletin(1), _bulletin(2)
+    _store_bulletins(PHONE_NUMBER, [original, other])
+    assert get_results(1, 13).sections == 2
+
+    replacement = _bulletin(3, section_of=1)
+    _store_bulletins(PHONE_NUMBER, [replacement])
+    _store_bulletins(PHONE_NUMBER, [replacement])
+    national = get_results(1, 13)
+    assert national.sections == 2
+    assert +Counter(national.candidates) == _candidate_votes([replacement, other])
+
+
+def test_tally_catches_up_from_the_vote_tables(database):
+    bulletins = [_bulletin(seed) for seed in range(3)]
+    _store_bulletins(PHONE_NUMBER, bulletins)
+    engine = get_tally_engine()
+    expected = engine.result(("BR",), 1, 11)
+
+    # A fresh process rebuilds the same totals from the stored bulletins
+    engine.reset()
+    assert engine.result(("BR",), 1, 11) == expected
+    assert engine.positions() == [(1, 11), (1, 13)]
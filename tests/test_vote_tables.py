@@ -0,0 +1,51 @@
+from sqlalchemy import func, insert, select
+
+from api.src.handlers import _bulletin_row, _store_bulletins
+from api.src.models import BoletimUrnaModel, BuCandidateVotesModel, BuPartyModel, BuPositionModel, BuSectionModel
+from api.src.utils.parser_pool import parse_bulletin
+from api.src.utils.vote_tables import backfill_vote_tables, vote_table_rows
+from bu_corpus import PHONE_NUMBER
+from synthetic_bu import generate_bulletin
+
+
+def _count(session, model) -> int:
+    return session.scalar(select(func.count()).select_from(model))
+
+
+def test_vote_table_rows_match_bulletin_totals():
+    bulletin = parse_bulletin(PHONE_NUMBER, generate_bulletin(seed=5, positions=(13, 11), parties=4, candidates=6))
+    rows = vote_table_rows([(1, PHONE_NUMBER, bulletin.content)])
+
+    section, = rows[BuSectionModel]
+    assert (section["MUNI"], section["IDUE"]) == (bulletin.content.metadata.MUNI, bulletin.content.metadata.IDUE)
+    assert [row["CARG"] for row in rows[BuPositionModel]] == [13, 11]
+    assert len(rows[BuPartyModel]) == 4
+    for party in rows[BuPartyModel]:
+        candidate_votes = sum(row["votes"] for row in rows[BuCandidateVotesModel] if row["PART"] == party["PART"])
+        assert party["TOTP"] == party["LEGP"] + candidate_votes
+    proportional = rows[BuPositionModel][0]
+    assert proportional["NOMI"] == sum(row["votes"] for row in rows[BuCandidateVotesModel] if row["CARG"] == 13)
+
+
+def test_stored_bulletins_fill_vote_tables(database):
+    bulletins = [parse_bulletin(PHONE_NUMBER, generate_bulletin(seed=seed, parties=3, candidates=4)) for seed in range(3)]
+    _store_bulletins(PHONE_NUMBER, bulletins)
+    with database.get_session() as session:
+        ids = session.scalars(select(BoletimUrnaModel.id).order_by(BoletimUrnaModel.id)).all()
+        sections = session.execute(select(BuSectionModel.bulletin_id, BuSectionModel.IDUE).order_by(BuSectionModel.bulletin_id)).all()
+    assert sections == [(bulletin_id, bulletin.content.metadata.IDUE) for bulletin_id, bulletin in zip(ids, bulletins)]
+
+
+def test_backfill_runs_in_chunks_and_resumes(database):
+    rows = [_bulletin_row(PHONE_NUMBER, parse_bulletin(PHONE_NUMBER, generate_bulletin(seed=seed, parties=2, candidates=3)))
+            for seed in range(5)]
+    with database.get_session() as session:
+        session.execute(insert(BoletimUrnaModel), rows)
+        session.commit()
+
+    assert backfill_vote_tables(chunk_size=2) == 5
+    assert backfill_vote_tables(chunk_size=2) == 0
+    with database.get_session() as session:
+        assert _count(session, BuSectionModel) == 5
+        assert _count(session, BuPartyModel) == 10
+        assert _count(session, BuCandidateVotesModel) == 5 * (2 * 3 + 2)
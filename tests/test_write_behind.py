@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.src.settings import write_behind_settings
+from api.src.utils.write_behind import WriteQueueFull, get_write_behind_queue
+from synthetic_bu import generate_bulletin
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(write_behind_settings, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(write_behind_settings, "WRITE_BEHIND_BATCH_SIZE", 16)
+    monkeypatch.setattr(write_behind_settings, "WRITE_BEHIND_FLUSH_MS", 5.0)
+    queue = get_write_behind_queue()
+    queue.close()
+    queue.reset()
+    yield queue
+    queue.close()
+    queue.reset()
+
+
+def test_concurrent_items_are_written_in_group_commits(queue):
+    batches = []
+
+    def write(items):
+        batches.append(len(items))
+        time.sleep(0.005)  # A commit waiting for its fsync
+        return [item * 2 for item in items]
+    queue.start(write)
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(lambda item: queue.submit(item).result(), range(200)))
+    assert results == [item * 2 for item in range(200)]
+    assert sum(batches) == 200
+    assert len(batches) < 100
+    assert max(batches) <= 16
+
+
+def test_a_faulty_item_does_not_fail_its_batch(queue):
+    def write(items):
+        if "bad" in items:
+            raise ValueError("bad item")
+        return items
+    queue.start(write)
+
+    futures = [queue.submit(item) for item in ("a", "bad", "b")]
+    assert futures[0].result() == "a" and futures[2].result() == "b"
+    with pytest.raises(ValueError):
+        futures[1].result()
+
+
+def test_full_queue_answers_503_with_retry_after(queue, monkeypatch):
+    monkeypatch.setattr(write_behind_settings, "WRITE_BEHIND_MAX_ITEMS", 2)
+    monkeypatch.setattr(write_behind_settings, "WRITE_BEHIND_BATCH_SIZE", 1)
+    monkeypatch.setattr(write_behind_settings, "WRITE_BEHIND_RETRY_AFTER_SECONDS", 3)
+    release = threading.Event()
+    queue.start(lambda items: release.wait() and items)
+
+    try:
+        pending = [queue.submit(0)]
+        while queue.stats()["queued"]:
+            time.sleep(0.001)  # Until the writer holds it
+        pending += [queue.submit(item) for item in (1, 2)]
+        with pytest.raises(WriteQueueFull):
+            queue.submit(3)
+
+        payload, = generate_bulletin(seed=41, parties=2, candidates=3)
+        response = TestClient(app).post("/bulletin/qrcode", json={
+            "evaluator": {"id": 1, "phone_number": "5586999990041"},
+            "bulletin": {"content": payload},
+        })
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+    finally:
+        release.set()
+    assert [future.result() for future in pending] == [0, 1, 2]